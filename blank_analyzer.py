@@ -126,6 +126,62 @@ class BlankAnalyzer:
         
         return examples
     
+    def get_product_catalog(self) -> Dict[str, Dict]:
+        """
+        Каталог продуктів бланка за кодом
+        Бланк містить кілька груп колонок поруч: № | Назва | Кількість | Код
+        """
+        catalog = {}
+        
+        try:
+            workbook = load_workbook(self.blank_file)
+        except Exception as e:
+            logger.error(f"Помилка завантаження бланка: {e}")
+            return catalog
+        
+        for sheet in workbook.worksheets:
+            for header_row in sheet.iter_rows():
+                # Шукаємо рядок заголовків з групами колонок
+                groups = []
+                for cell in header_row:
+                    if str(cell.value or '').strip().upper() != 'НАЗВА':
+                        continue
+                    group = {'name': cell.column}
+                    for offset in range(1, 4):
+                        title = str(sheet.cell(row=cell.row, column=cell.column + offset).value or '').strip().upper()
+                        if title == 'КІЛЬКІСТЬ':
+                            group['quantity'] = cell.column + offset
+                        elif title == 'КОД':
+                            group['code'] = cell.column + offset
+                            break
+                    if 'code' in group:
+                        groups.append(group)
+                
+                if not groups:
+                    continue
+                
+                for row in range(header_row[0].row + 1, sheet.max_row + 1):
+                    for group in groups:
+                        code = sheet.cell(row=row, column=group['code']).value
+                        name = sheet.cell(row=row, column=group['name']).value
+                        if code is None or name is None:
+                            continue
+                        code = str(code).strip()
+                        if code.endswith('.0'):
+                            code = code[:-2]
+                        if not code.isdigit():
+                            continue
+                        catalog[code] = {
+                            'name': ' '.join(str(name).split()),
+                            'sheet': sheet.title,
+                            'row': row,
+                            'quantity_column': group.get('quantity')
+                        }
+                break
+        
+        logger.info(f"Каталог бланка: {len(catalog)} продуктів")
+        return catalog
+    
     def generate_ocr_patterns(self) -> Dict:
         """Генерація патернів для OCR на основі бланка"""
         patterns = {
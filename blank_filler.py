@@ -0,0 +1,229 @@
+"""
+Заповнення оригінального бланка (бланк для випічки з новинками.xlsx) розпізнаними кількостями
+Бланк розбирається один раз: каталог код -> клітинка кількості, вміст xlsx архіву в пам'яті
+та XML аркуша, розрізаний на шматки навколо клітинок, які заповнюються.
+Для кожної накладної шматки лише склеюються з новими значеннями - без повторного
+читання та розбору xlsx, а все форматування бланка зберігається як є.
+"""
+
+import logging
+import posixpath
+import re
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+from blank_analyzer import BlankAnalyzer
+from config import BLANK_FILE
+from records import Invoice, ProductLine
+
+logger = logging.getLogger(__name__)
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Підписи полів шапки бланка
+DATE_LABEL = "ДАТА:"
+BAKERY_LABEL = "ПЕКАРНЯ"
+
+def cell_pattern(reference: str) -> re.Pattern:
+    """Клітинка аркуша: порожня (<c .../>) або з вмістом (<c ...>...</c>)"""
+    return re.compile(r'<c r="%s"(?P<attrs>[^>]*?)(?:/>|>.*?</c>)' % reference, re.S)
+
+def format_number(value: float) -> str:
+    """Число для <v> без зайвого ".0" """
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class SheetTemplate:
+    """XML аркуша, розрізаний на незмінні шматки та клітинки, які заповнюються"""
+
+    def __init__(self, xml: str, references: List[str]):
+        """Пошук клітинок (відсутні в XML клітинки вставляються в свій рядок)"""
+        spans = []
+        for reference in references:
+            span = self.find_cell(xml, reference)
+            if span is None:
+                logger.warning(f"Рядок клітинки {reference} не знайдено в бланку")
+                continue
+            spans.append(span)
+        spans.sort(key=lambda span: (span[0], column_index_from_string(re.sub(r'\d', '', span[2]))))
+
+        self.chunks: List[str] = []
+        self.references: List[str] = []
+        self.attributes: List[str] = []
+        # Початковий XML клітинки (порожній рядок для клітинок, яких не було в бланку)
+        self.originals: List[str] = []
+        position = 0
+        for start, end, reference, attributes in spans:
+            self.chunks.append(xml[position:start])
+            self.references.append(reference)
+            self.attributes.append(attributes)
+            self.originals.append(xml[start:end])
+            position = end
+        self.chunks.append(xml[position:])
+
+    @staticmethod
+    def find_cell(xml: str, reference: str) -> Optional[Tuple[int, int, str, str]]:
+        """(початок, кінець, клітинка, атрибути без типу) або місце вставки порожньої клітинки"""
+        match = cell_pattern(reference).search(xml)
+        if match:
+            # Тип (t="s" тощо) залежить від нового значення, стиль (s="...") лишається
+            attributes = re.sub(r'\s+t="[^"]*"', '', match.group('attrs'))
+            return match.start(), match.end(), reference, attributes
+
+        column = column_index_from_string(re.sub(r'\d', '', reference))
+        row_number = re.sub(r'\D', '', reference)
+        row = re.search(r'<row r="%s"[^>]*?(?:/>|>(?P<cells>.*?)</row>)' % row_number, xml, re.S)
+        if row is None or row.group('cells') is None:
+            return None
+        # Клітинки в рядку мають іти за порядком колонок
+        position = row.end('cells')
+        for cell in re.finditer(r'<c r="([A-Z]+)\d+"', row.group('cells')):
+            if column_index_from_string(cell.group(1)) > column:
+                position = row.start('cells') + cell.start()
+                break
+        return position, position, reference, ''
+
+    def render(self, values: Dict[str, object]) -> str:
+        """XML аркуша з новими значеннями (числа або текст; без значення клітинка лишається як у бланку)"""
+        parts = [self.chunks[0]]
+        for index, reference in enumerate(self.references):
+            value = values.get(reference)
+            attributes = self.attributes[index]
+            if value is None:
+                parts.append(self.originals[index])
+            elif isinstance(value, str):
+                parts.append(f'<c r="{reference}"{attributes} t="inlineStr"><is><t xml:space="preserve">'
+                             f'{escape(value)}</t></is></c>')
+            else:
+                parts.append(f'<c r="{reference}"{attributes}><v>{format_number(value)}</v></c>')
+            parts.append(self.chunks[index + 1])
+        return ''.join(parts)
+
+class BlankFiller:
+    """Бланк-шаблон у пам'яті та заповнення його кількостями з накладних"""
+
+    def __init__(self, blank_file: str = BLANK_FILE):
+        """Завантаження та розбір бланка (один раз)"""
+        self.blank_file = blank_file
+        self.catalog: Dict[str, Dict] = {}
+        self.members: List[Tuple[zipfile.ZipInfo, bytes]] = []
+        self.sheets: Dict[str, SheetTemplate] = {}
+        self.header: Dict[str, Tuple[str, str]] = {}
+        self.sheet_by_title: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self) -> bool:
+        """Розбір бланка: каталог кодів, поля шапки, шаблони аркушів"""
+        with self.lock:
+            if self.loaded:
+                return True
+            try:
+                self.catalog = BlankAnalyzer(self.blank_file).get_product_catalog()
+                self.header = self.find_header_cells()
+                with zipfile.ZipFile(self.blank_file) as archive:
+                    self.members = [(info, archive.read(info.filename)) for info in archive.infolist()]
+                    sheet_paths = self.sheet_paths(archive)
+            except Exception as e:
+                logger.error(f"Помилка завантаження бланка {self.blank_file}: {e}")
+                return False
+
+            references: Dict[str, List[str]] = {}
+            for entry in self.catalog.values():
+                if entry.get('quantity_column'):
+                    references.setdefault(entry['sheet'], []).append(self.quantity_cell(entry))
+            for sheet, cell in self.header.values():
+                references.setdefault(sheet, []).append(cell)
+
+            contents = dict((info.filename, data) for info, data in self.members)
+            for sheet, sheet_references in references.items():
+                path = sheet_paths.get(sheet)
+                if path not in contents:
+                    logger.error(f"Аркуш {sheet} не знайдено в архіві бланка")
+                    continue
+                self.sheets[path] = SheetTemplate(contents[path].decode('utf-8'), sheet_references)
+            self.sheet_by_title = {sheet: sheet_paths.get(sheet) for sheet in references}
+
+            self.loaded = True
+            logger.info(f"Бланк {self.blank_file} завантажено як шаблон: {len(self.catalog)} продуктів")
+            return True
+
+    @staticmethod
+    def quantity_cell(entry: Dict) -> str:
+        """Адреса клітинки кількості продукту (наприклад, C8)"""
+        return f"{get_column_letter(entry['quantity_column'])}{entry['row']}"
+
+    @staticmethod
+    def sheet_paths(archive: zipfile.ZipFile) -> Dict[str, str]:
+        """Назва аркуша -> шлях його XML в архіві"""
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        relations = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get('Id'): rel.get('Target') for rel in relations.iter(f"{{{PACKAGE_REL_NS}}}Relationship")}
+
+        paths = {}
+        for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet"):
+            target = targets.get(sheet.get(f"{{{REL_NS}}}id"), '')
+            paths[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else posixpath.join("xl", target)
+        return paths
+
+    def find_header_cells(self) -> Dict[str, Tuple[str, str]]:
+        """Клітинки дати та пекарні в шапці першого аркуша з підписами"""
+        header = {}
+        workbook = load_workbook(self.blank_file)
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows():
+                values = [(cell, str(cell.value).strip().upper()) for cell in row if cell.value is not None]
+                for index, (cell, text) in enumerate(values):
+                    if text == DATE_LABEL and 'date' not in header and index + 1 < len(values):
+                        # Дата пишеться в поле після підпису ("____ 20 __ р.")
+                        header['date'] = (sheet.title, values[index + 1][0].coordinate)
+                    elif text.startswith(BAKERY_LABEL) and 'bakery' not in header:
+                        header['bakery'] = (sheet.title, cell.coordinate)
+            if header:
+                return header
+        return header
+
+    def quantities_by_cell(self, products: Sequence[ProductLine]) -> Tuple[Dict[str, Dict[str, float]], List[ProductLine]]:
+        """Кількості за клітинками бланка (однакові коди з двох фото сумуються) та продукти без коду в бланку"""
+        values: Dict[str, Dict[str, float]] = {}
+        unmatched = []
+        for product in products:
+            entry = self.catalog.get(str(product.code or '').strip())
+            if not entry or not entry.get('quantity_column'):
+                unmatched.append(product)
+                continue
+            cells = values.setdefault(self.sheet_by_title[entry['sheet']], {})
+            cell = self.quantity_cell(entry)
+            cells[cell] = cells.get(cell, 0) + product.quantity
+        return values, unmatched
+
+    def fill(self, invoice: Invoice, date: str) -> Tuple[bytes, List[ProductLine]]:
+        """Заповнений бланк (вміст xlsx) та продукти, яких немає в бланку"""
+        if not self.load():
+            raise RuntimeError(f"Бланк {self.blank_file} недоступний")
+
+        values, unmatched = self.quantities_by_cell(invoice.products)
+        if 'date' in self.header:
+            sheet, cell = self.header['date']
+            values.setdefault(self.sheet_by_title[sheet], {})[cell] = date
+        if 'bakery' in self.header and invoice.bakery_name:
+            sheet, cell = self.header['bakery']
+            values.setdefault(self.sheet_by_title[sheet], {})[cell] = f"Пекарня {invoice.bakery_name}"
+
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for info, data in self.members:
+                template = self.sheets.get(info.filename)
+                if template is not None:
+                    data = template.render(values.get(info.filename, {})).encode('utf-8')
+                archive.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+        return buffer.getvalue(), unmatched
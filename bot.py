@@ -1,14 +1,36 @@
+import asyncio
+import json
 import logging
+import mimetypes
 import os
 import time
 from datetime import datetime
-from typing import Dict, List
+from io import BytesIO
+from typing import Dict, List, Optional, Set, Tuple
 
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 
-from config import TELEGRAM_TOKEN, PHOTO_GROUPING_TIMEOUT
-from ocr_processor import OCRProcessor
+from config import (
+    TELEGRAM_TOKEN, PHOTO_GROUPING_TIMEOUT,
+    OCR_WORKERS, OCR_TORCH_THREADS, OCR_BATCH_SIZE, MAX_JOBS_PER_USER, MAX_QUEUE_SIZE,
+    PROGRESSIVE_RESULTS, PROGRESS_EDIT_INTERVAL,
+    OCR_WORKER_MAX_JOBS, OCR_WORKER_MAX_RSS_MB, MAX_IMAGE_PIXELS,
+    DOCUMENT_MAX_PIXELS, MAX_DOCUMENT_BYTES, TILE_MIN_PIXELS, TILE_SIZE, TILE_OVERLAP,
+    EXCEL_ARCHIVE, EXCEL_OUTPUT_MODE, RETENTION_INTERVAL_HOURS, DUPLICATE_DETECTION, CORRECTIONS_COMPILE_MINUTES,
+    LEDGER_ENABLED, LEDGER_COMPACT_HOURS, QUALITY_GATE
+)
+from blank_filler import BlankFiller
+from correction_table import compile_corrections, save_corrections
+from duplicate_detector import QuantityHasher, file_digest
+from job_scheduler import InvoiceJobScheduler
+from ledger import InvoiceLedger
+from ocr_worker_pool import OCRWorkerPool
+from profiling import InvoiceProfiler
+from progress_reporter import ProgressReporter
+from quality_gate import QualityGate
+from records import Invoice
+from retention import RetentionManager
 from excel_generator import ExcelGenerator
 from training_data_collector import TrainingDataCollector
 
@@ -30,36 +52,101 @@ class NakladniBot:
             os.makedirs(self.photos_dir)
             logger.info(f"Створено папку: {self.photos_dir}")
         
-        # Ініціалізуємо OCR та Excel генератор
-        self.ocr_processor = OCRProcessor()
+        # Ініціалізуємо OCR (в окремих процесах) та Excel генератор
+        self.ocr_pool = OCRWorkerPool(
+            workers=OCR_WORKERS,
+            max_jobs=OCR_WORKER_MAX_JOBS,
+            max_rss_mb=OCR_WORKER_MAX_RSS_MB,
+            max_pixels=MAX_IMAGE_PIXELS,
+            torch_threads=OCR_TORCH_THREADS,
+            batch_size=OCR_BATCH_SIZE,
+            tile_min_pixels=TILE_MIN_PIXELS,
+            tile_size=TILE_SIZE,
+            tile_overlap=TILE_OVERLAP
+        )
         self.excel_generator = ExcelGenerator()
+        self.blank_filler = BlankFiller()
+        self.ledger = InvoiceLedger()
+        self.quality_gate = QualityGate()
         self.training_collector = TrainingDataCollector()
+        # Відбиток клітинок кількості для попередження про повтор (потрібен еталон бланка)
+        self.quantity_hasher = QuantityHasher() if DUPLICATE_DETECTION else None
+        self.profiler = InvoiceProfiler()
+        self.retention = RetentionManager(
+            photos_dir=self.photos_dir,
+            reports_dir=self.excel_generator.output_dir,
+            training_dir=self.training_collector.training_dir
+        )
+        
+        # Фонові завдання (архівація), щоб їх не прибрав збирач сміття
+        self.background_tasks: Set[asyncio.Task] = set()
+        
+        # Черга обробки накладних
+        self.scheduler = InvoiceJobScheduler(
+            max_workers=OCR_WORKERS,
+            per_user_limit=MAX_JOBS_PER_USER,
+            max_queue_size=MAX_QUEUE_SIZE
+        )
         
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обробка фото накладної"""
-        user_id = update.effective_user.id
         photo = update.message.photo[-1]  # Найбільша версія фото
+        await self.receive_page(update, context, photo.file_id, ".jpg", is_document=False)
+    
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обробка фото накладної, надісланого файлом (без стиснення Telegram)"""
+        document = update.message.document
+        if document.file_size and document.file_size > MAX_DOCUMENT_BYTES:
+            await update.message.reply_text(
+                f"❌ Файл завеликий ({document.file_size / 1024 / 1024:.0f} МБ). "
+                f"Максимум - {MAX_DOCUMENT_BYTES / 1024 / 1024:.0f} МБ."
+            )
+            return
+        
+        extension = os.path.splitext(document.file_name or "")[1].lower()
+        if not extension:
+            extension = mimetypes.guess_extension(document.mime_type or "") or ".jpg"
+        await self.receive_page(update, context, document.file_id, extension, is_document=True)
+    
+    async def receive_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                           file_id: str, extension: str, is_document: bool):
+        """Завантаження сторінки накладної (фото або файл) та групування сторінок по дві"""
+        user_id = update.effective_user.id
         
         try:
             # Завантажуємо фото
-            file = await context.bot.get_file(photo.file_id)
+            file = await context.bot.get_file(file_id)
             photo_bytes = await file.download_as_bytearray()
             
-            # Зберігаємо фото в окремій папці
+            # Зберігаємо фото в окремій папці; message_id розрізняє сторінки, надіслані в ту саму секунду
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            photo_filename = os.path.join(self.photos_dir, f"photo_{user_id}_{timestamp}.jpg")
+            photo_filename = os.path.join(
+                self.photos_dir, f"photo_{user_id}_{timestamp}_{update.message.message_id}{extension}"
+            )
             
             with open(photo_filename, 'wb') as f:
                 f.write(photo_bytes)
             
+            # Розмите, темне чи дрібне фото відхиляємо одразу, не чекаючи OCR
+            if not await self.check_quality(photo_filename, update):
+                return
+            
+            # Перевіряємо до OCR, чи не надсилалось це фото раніше
+            photo_hash, digest, duplicate = await self.check_duplicate(photo_filename, update)
+            
             # Перевіряємо, чи є вже фото від цього користувача
             if user_id in self.pending_photos:
-                # Друге фото - обробляємо накладну
-                await self.process_nakladna(user_id, photo_filename, update, context)
+                # Друге фото - ставимо накладну в чергу на обробку
+                await self.enqueue_nakladna(user_id, photo_filename, update, context, photo_hash, duplicate,
+                                            is_document, digest)
             else:
                 # Перше фото - зберігаємо і чекаємо друге
                 self.pending_photos[user_id] = {
                     'photo1': photo_filename,
+                    'hash': photo_hash,
+                    'digest': digest,
+                    'duplicate': duplicate,
+                    'document': is_document,
                     'timestamp': time.time()
                 }
                 await update.message.reply_text("✅ Фото 1 збережено\n⏳ Очікую фото 2... (у вас є 5 хвилин)")
@@ -76,44 +163,99 @@ class NakladniBot:
             logger.error(f"Помилка обробки фото: {e}")
             await update.message.reply_text("❌ Помилка обробки фото. Спробуйте ще раз.")
     
-    async def process_nakladna(self, user_id: int, photo2_filename: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def enqueue_nakladna(self, user_id: int, photo2_filename: str, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               photo2_hash: Optional[Tuple] = None, duplicate2: Optional[Dict] = None,
+                               document2: bool = False, photo2_digest: Optional[str] = None):
+        """Постановка накладної в чергу обробки"""
+        pending = self.pending_photos[user_id]
+        photo1_filename = pending['photo1']
+        photo_hashes = (pending.get('hash'), photo2_hash)
+        photo_digests = (pending.get('digest'), photo2_digest)
+        duplicates = (pending.get('duplicate'), duplicate2)
+        documents = (pending.get('document', False), document2)
+        
+        async def job():
+            await self.process_nakladna(user_id, photo1_filename, photo2_filename, update, context,
+                                        photo_hashes, duplicates, documents, photo_digests)
+        
+        position = self.scheduler.submit(user_id, job)
+        if position is None:
+            # Залишаємо перше фото, щоб користувач міг повторно надіслати друге
+            self.cleanup_temp_files([photo2_filename])
+            await update.message.reply_text(
+                "⏳ Зараз забагато накладних в обробці.\n"
+                "Надішліть друге фото ще раз через кілька хвилин."
+            )
+            return
+        
+        # Наступне фото від користувача почне нову накладну
+        del self.pending_photos[user_id]
+        
+        if position > 0:
+            await update.message.reply_text(f"🕐 Накладну додано в чергу. Ви #{position} у черзі.")
+    
+    async def process_nakladna(self, user_id: int, photo1_filename: str, photo2_filename: str,
+                               update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               photo_hashes: Tuple = (None, None), duplicates: Tuple = (None, None),
+                               documents: Tuple = (False, False), photo_digests: Tuple = (None, None)):
         """Обробка повної накладної (2 фото) з OCR та Excel"""
+        invoice_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        # Профілювання (якщо увімкнено): лише синхронні ділянки - OCR в процесі-обробнику та Excel,
+        # профілі переносяться до даних накладної, тільки якщо їх зберігаємо
+        started = time.monotonic()
+        profile_mode = self.profiler.begin()
+        staging_dir = self.profiler.staging_dir(invoice_id)
+        
+        def profile_path(name: str):
+            return os.path.join(staging_dir, f"profile_{name}.prof") if profile_mode else None
+        
         try:
-            photo1_filename = self.pending_photos[user_id]['photo1']
-            
             # Повідомляємо про початок обробки
-            await update.message.reply_text("🔄 Обробляю накладну... (це може зайняти кілька секунд)")
-            
-            # Обробляємо обидва фото через OCR
-            invoice_data1 = self.ocr_processor.process_invoice(photo1_filename)
-            invoice_data2 = self.ocr_processor.process_invoice(photo2_filename)
+            status_message = await update.message.reply_text("🔄 Обробляю накладну... (це може зайняти кілька секунд)")
+            progress = ProgressReporter(status_message, PROGRESS_EDIT_INTERVAL) if PROGRESSIVE_RESULTS else None
             
-            # Зберігаємо сирий текст для аналізу
-            self.save_raw_ocr_text(photo1_filename, invoice_data1['raw_text'])
-            self.save_raw_ocr_text(photo2_filename, invoice_data2['raw_text'])
+            # Побайтово ті самі фото вже обробленої накладної - беремо попередній результат без OCR
+            invoice = self.load_earlier_invoice(invoice_id, duplicates)
+            reused = invoice is not None
+            if reused:
+                training_dir = None
+                await self.report_stage(
+                    progress,
+                    f"♻️ Ці фото вже оброблялись (накладна {duplicates[0]['invoice_id']}) - використано попередній результат",
+                    force=True
+                )
+            else:
+                invoice, training_dir = await self.recognize_invoice(
+                    invoice_id, photo1_filename, photo2_filename, photo_hashes, progress, profile_path, documents,
+                    photo_digests
+                )
+            bakery_name = invoice.bakery_name
             
-            # Зберігаємо дані для тренування
-            invoice_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            combined_results = {
-                'bakery_name': invoice_data1.get('bakery_name') or invoice_data2.get('bakery_name'),
-                'products': invoice_data1.get('products', []) + invoice_data2.get('products', []),
-                'total_quantity': invoice_data1.get('total_quantity', 0) + invoice_data2.get('total_quantity', 0),
-                'total_amount': invoice_data1.get('total_amount', 0) + invoice_data2.get('total_amount', 0)
-            }
+            # Журнал рядків для аналітики (повтор уже обробленої накладної не дописуємо)
+            if LEDGER_ENABLED and not reused:
+                self.run_in_background(asyncio.to_thread(self.ledger.append_invoice, invoice, user_id))
             
-            training_dir = self.training_collector.save_invoice_data(
-                invoice_id, photo1_filename, photo2_filename,
-                invoice_data1['raw_text'], invoice_data2['raw_text'],
-                combined_results
+            await self.report_stage(
+                progress,
+                f"📊 Разом: {len(invoice)} продуктів, "
+                f"{invoice.total_quantity:.2f} шт., {invoice.total_amount:.2f} грн."
             )
             
-            # Об'єднуємо дані з обох фото
-            combined_products = combined_results['products']
-            bakery_name = combined_results['bakery_name']
-            
-            # Створюємо Excel файл
+            # Створюємо Excel файли в пам'яті (поза event loop) і одразу надсилаємо користувачу
             current_date = datetime.now().strftime("%d.%m")
-            excel_filepath = self.excel_generator.create_excel(bakery_name, combined_products, current_date)
+            excel_files, unmatched = await asyncio.to_thread(
+                self.profiler.profile_call, profile_path("bot_excel"), self.build_excel_files, invoice, current_date
+            )
+            excel_filename = ", ".join(filename for filename, _ in excel_files)
+            if progress:
+                await progress.finish(f"✅ Excel готовий: {excel_filename}")
+            for filename, buffer in excel_files:
+                await update.message.reply_document(document=buffer, filename=filename)
+                if EXCEL_ARCHIVE:
+                    self.run_in_background(
+                        asyncio.to_thread(self.excel_generator.archive_excel, filename, buffer.getvalue())
+                    )
             
             # Створюємо звіт
             report_filename = f"Накладна_{current_date}.txt"
@@ -123,44 +265,205 @@ class NakladniBot:
                 f.write(f"Пекарня: {bakery_name or 'Невідома'}\n")
                 f.write(f"Фото 1: {photo1_filename}\n")
                 f.write(f"Фото 2: {photo2_filename}\n")
-                f.write(f"Excel файл: {excel_filepath}\n")
+                f.write(f"Excel файл: {excel_filename}\n")
                 f.write(f"Час обробки: {datetime.now().strftime('%H:%M:%S')}\n")
                 f.write("=" * 50 + "\n")
-                f.write(f"Знайдено продуктів: {len(combined_products)}\n")
-                f.write(f"Загальна кількість: {sum(p.get('quantity', 0) for p in combined_products):.2f}\n")
-                f.write(f"Загальна сума: {sum(p.get('total', 0) for p in combined_products):.2f}\n")
+                f.write(f"Знайдено продуктів: {len(invoice)}\n")
+                f.write(f"Загальна кількість: {invoice.total_quantity:.2f}\n")
+                f.write(f"Загальна сума: {invoice.total_amount:.2f}\n")
                 f.write("=" * 50 + "\n")
                 f.write("СПИСОК ПРОДУКТІВ:\n")
-                for i, product in enumerate(combined_products, 1):
-                    f.write(f"{i}. {product.get('name', 'Невідомий продукт')} - "
-                           f"{product.get('quantity', 0)} шт. - "
-                           f"{product.get('total', 0):.2f} грн.\n")
+                for i, product in enumerate(invoice.products, 1):
+                    f.write(f"{i}. {product.name or 'Невідомий продукт'} - "
+                           f"{product.quantity} шт. - "
+                           f"{product.total:.2f} грн.\n")
             
             # Відправляємо результат
             result_message = (
                 f"✅ Накладна оброблена!\n\n"
                 f"🏪 Пекарня: {bakery_name or 'Невідома'}\n"
-                f"📦 Продуктів: {len(combined_products)}\n"
-                f"📊 Загальна кількість: {sum(p.get('quantity', 0) for p in combined_products):.2f}\n"
-                f"💰 Загальна сума: {sum(p.get('total', 0) for p in combined_products):.2f} грн.\n\n"
+                f"📦 Продуктів: {len(invoice)}\n"
+                f"📊 Загальна кількість: {invoice.total_quantity:.2f}\n"
+                f"💰 Загальна сума: {invoice.total_amount:.2f} грн.\n\n"
                 f"📄 Звіт: {report_filename}\n"
-                f"📊 Excel: {os.path.basename(excel_filepath)}\n"
+                f"📊 Excel: {excel_filename}\n"
+                f"{self.unmatched_note(unmatched)}"
                 f"📸 Фото збережено в папці: {self.photos_dir}\n\n"
-                f"🎯 Дані збережено для тренування: {training_dir}\n"
-                f"💡 Для покращення точності відредагуйте файл manual_annotation.json"
+                f"{self.training_note(training_dir, duplicates)}"
             )
             
             await update.message.reply_text(result_message)
             
-            # Очищаємо дані користувача
-            del self.pending_photos[user_id]
-            
         except Exception as e:
             logger.error(f"Помилка обробки накладної: {e}")
             await update.message.reply_text(
                 "❌ Помилка обробки накладної. Спробуйте ще раз.\n"
                 "Переконайтеся, що фото чіткі та містять текст накладних."
             )
+        finally:
+            if profile_mode:
+                # Перенесення профілів - файлові операції, не блокуємо ними event loop
+                await asyncio.to_thread(
+                    self.profiler.finish, profile_mode, staging_dir,
+                    self.training_collector.get_invoice_dir(invoice_id), invoice_id, time.monotonic() - started
+                )
+    
+    def build_excel_files(self, invoice: Invoice, current_date: str) -> Tuple[List[Tuple[str, BytesIO]], List]:
+        """Excel файли для користувача згідно з EXCEL_OUTPUT_MODE та продукти, яких немає в бланку"""
+        excel_files = []
+        unmatched = []
+        if EXCEL_OUTPUT_MODE in ("report", "both"):
+            excel_files.append(self.excel_generator.create_excel_bytes(invoice, current_date))
+        if EXCEL_OUTPUT_MODE in ("blank", "both"):
+            data, unmatched = self.blank_filler.fill(invoice, current_date)
+            filename = f"Бланк_{self.excel_generator.get_filename(invoice.bakery_name, current_date)}"
+            excel_files.append((filename, BytesIO(data)))
+        return excel_files, unmatched
+    
+    def unmatched_note(self, unmatched: List) -> str:
+        """Рядок повідомлення про продукти, які не вдалося вписати в бланк"""
+        if not unmatched:
+            return ""
+        names = ", ".join(product.name or "?" for product in unmatched[:5])
+        more = f" та ще {len(unmatched) - 5}" if len(unmatched) > 5 else ""
+        return f"⚠️ Немає в бланку (за кодом): {names}{more}\n"
+    
+    async def recognize_invoice(self, invoice_id: str, photo1_filename: str, photo2_filename: str,
+                                photo_hashes: Tuple, progress: Optional[ProgressReporter], profile_path,
+                                documents: Tuple = (False, False), photo_digests: Tuple = (None, None)):
+        """OCR обох фото, об'єднання в накладну та збереження для тренування"""
+        # Файли-документи не стиснуті Telegram, тому мають більший бюджет пікселів (великі - плитками)
+        def max_pixels(is_document: bool) -> Optional[int]:
+            return DOCUMENT_MAX_PIXELS if is_document else None
+        
+        # Обробляємо обидва фото через OCR (в процесах-обробниках, щоб бот відповідав іншим)
+        invoice_data1 = await self.ocr_pool.process_invoice(
+            photo1_filename, profile_path("ocr_photo1"), max_pixels(documents[0])
+        )
+        await self.report_stage(
+            progress,
+            f"📄 Фото 1: {invoice_data1.get('bakery_name') or 'пекарню не знайдено'}, "
+            f"продуктів: {len(invoice_data1.get('products', []))}",
+            force=True
+        )
+        
+        invoice_data2 = await self.ocr_pool.process_invoice(
+            photo2_filename, profile_path("ocr_photo2"), max_pixels(documents[1])
+        )
+        await self.report_stage(
+            progress,
+            f"📄 Фото 2: продуктів: {len(invoice_data2.get('products', []))}"
+        )
+        
+        # Зберігаємо сирий текст для аналізу
+        self.save_raw_ocr_text(photo1_filename, invoice_data1['raw_text'])
+        self.save_raw_ocr_text(photo2_filename, invoice_data2['raw_text'])
+        
+        # Об'єднуємо дані з обох фото (підсумки рахуються один раз)
+        invoice = Invoice.from_pages(invoice_id, [invoice_data1, invoice_data2])
+        
+        # Зберігаємо дані для тренування
+        training_dir = self.training_collector.save_invoice_data(
+            invoice, photo1_filename, photo2_filename,
+            invoice_data1['raw_text'], invoice_data2['raw_text'],
+            [invoice_data1.get('ocr_boxes', []), invoice_data2.get('ocr_boxes', [])],
+            photo_hashes, photo_digests
+        )
+        
+        return invoice, training_dir
+    
+    async def check_quality(self, photo_filename: str, update: Update) -> bool:
+        """Швидка перевірка якості фото; погане фото видаляється, користувач отримує пораду"""
+        if not QUALITY_GATE:
+            return True
+        
+        try:
+            passed, advice, _ = await asyncio.to_thread(self.quality_gate.evaluate, photo_filename)
+        except Exception as e:
+            logger.error(f"Помилка перевірки якості фото {photo_filename}: {e}")
+            return True
+        if passed:
+            return True
+        
+        self.cleanup_temp_files([photo_filename])
+        page = "Фото 2" if update.effective_user.id in self.pending_photos else "Фото"
+        await update.message.reply_text(
+            f"🔁 {page} не вдасться розпізнати - перезніміть, будь ласка:\n" + "\n".join(advice)
+        )
+        return False
+    
+    async def check_duplicate(self, photo_filename: str,
+                              update: Update) -> Tuple[Optional[Tuple], Optional[str], Optional[Dict]]:
+        """
+        Відбиток клітинок кількості і sha256 фото та раніше збережене фото (з попередженням користувачу)
+        Впевнений збіг відбитка - лише попередження; повтором вважається тільки той самий файл
+        """
+        if not DUPLICATE_DETECTION:
+            return None, None, None
+        
+        try:
+            photo_hash = await asyncio.to_thread(self.quantity_hasher.hash, photo_filename)
+            digest = await asyncio.to_thread(file_digest, photo_filename)
+        except Exception as e:
+            logger.error(f"Помилка обчислення хеша фото {photo_filename}: {e}")
+            return None, None, None
+        
+        duplicate = self.training_collector.duplicates.find(photo_hash, digest)
+        if duplicate:
+            logger.info(f"Фото {photo_filename} повторює {duplicate['page']} накладної "
+                        f"{duplicate['invoice_id']} (відстань {duplicate['distance']}, "
+                        f"той самий файл: {duplicate['identical']})")
+            await update.message.reply_text(
+                f"⚠️ Схоже, цю накладну вже надсилали (накладна {duplicate['invoice_id']}, ті самі кількості).\n"
+                f"Якщо це інша накладна - просто продовжуйте."
+            )
+        return photo_hash, digest, duplicate
+    
+    def load_earlier_invoice(self, invoice_id: str, duplicates: Tuple) -> Optional[Invoice]:
+        """
+        Попередній результат, якщо обидва фото - побайтово ті самі файли однієї вже обробленої накладної
+        (схожий pHash має і інша накладна на тому самому бланку - її треба розпізнати)
+        """
+        first, second = duplicates
+        if not first or not second or first['invoice_id'] != second['invoice_id'] or first['page'] == second['page']:
+            return None
+        if not first.get('identical') or not second.get('identical'):
+            return None
+        
+        results_file = os.path.join(self.training_collector.get_invoice_dir(first['invoice_id']), "ocr_results.json")
+        try:
+            with open(results_file, 'r', encoding='utf-8') as f:
+                return Invoice.from_dict(invoice_id, json.load(f))
+        except Exception:
+            # Накладну вже заархівовано або видалено - розпізнаємо заново
+            return None
+    
+    def training_note(self, training_dir: Optional[str], duplicates: Tuple) -> str:
+        """Рядок повідомлення про збереження тренувальних даних"""
+        if training_dir:
+            return (f"🎯 Дані збережено для тренування: {training_dir}\n"
+                    f"💡 Для покращення точності відредагуйте файл manual_annotation.json")
+        duplicate = next((match for match in duplicates if match and match.get('identical')), None)
+        if duplicate:
+            return f"♻️ Повтор накладної {duplicate['invoice_id']} - для тренування не збережено"
+        return "⚠️ Дані для тренування не збережено"
+    
+    def run_in_background(self, coroutine):
+        """Запуск фонового завдання з логуванням помилок"""
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        
+        def on_done(finished: asyncio.Task):
+            self.background_tasks.discard(finished)
+            if not finished.cancelled() and finished.exception():
+                logger.error(f"Помилка фонового завдання: {finished.exception()}")
+        
+        task.add_done_callback(on_done)
+    
+    async def report_stage(self, progress: ProgressReporter, line: str, force: bool = False):
+        """Оновлення статусу обробки (якщо увімкнено поетапний режим)"""
+        if progress:
+            await progress.add_stage(line, force=force)
     
     def save_raw_ocr_text(self, image_path: str, raw_text: List[str]):
         """Збереження сирого тексту OCR для аналізу"""
@@ -187,6 +490,28 @@ class NakladniBot:
             del self.pending_photos[user_id]
             logger.info(f"Очищено застаріле фото для користувача {user_id}")
     
+    async def run_retention(self, context: ContextTypes.DEFAULT_TYPE):
+        """Фонове очищення старих фото, звітів та тренувальних даних"""
+        try:
+            await asyncio.to_thread(self.retention.run)
+        except Exception as e:
+            logger.error(f"Помилка очищення файлів: {e}")
+    
+    async def run_corrections_compile(self, context: ContextTypes.DEFAULT_TYPE):
+        """Перекомпіляція таблиці виправлень з нових анотацій (OCR процеси підхоплять її самі)"""
+        try:
+            table = await asyncio.to_thread(compile_corrections, self.training_collector.training_dir)
+            await asyncio.to_thread(save_corrections, table)
+        except Exception as e:
+            logger.error(f"Помилка компіляції таблиці виправлень: {e}")
+    
+    async def run_ledger_compact(self, context: ContextTypes.DEFAULT_TYPE):
+        """Ущільнення завершених днів журналу в один файл на день"""
+        try:
+            await asyncio.to_thread(self.ledger.compact)
+        except Exception as e:
+            logger.error(f"Помилка ущільнення журналу: {e}")
+    
     def cleanup_temp_files(self, filenames: List[str]):
         """Видалення тимчасових файлів"""
         for filename in filenames:
@@ -196,15 +521,55 @@ class NakladniBot:
             except Exception as e:
                 logger.error(f"Помилка видалення файлу {filename}: {e}")
 
-def main():
-    """Запуск бота"""
-    bot = NakladniBot()
+def build_application(bot: NakladniBot = None, base_url: str = None, base_file_url: str = None) -> Application:
+    """Створення Application з усіма обробниками (для polling і webhook)"""
+    if bot is None:
+        bot = NakladniBot()
     
-    # Створюємо додаток з job_queue
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Створюємо додаток з job_queue (інший base_url - для локального тестового Bot API)
+    builder = Application.builder().token(TELEGRAM_TOKEN)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    application = builder.build()
     
     # Додаємо обробник фото
     application.add_handler(MessageHandler(filters.PHOTO, bot.handle_photo))
+    application.add_handler(MessageHandler(filters.Document.IMAGE, bot.handle_document))
+    
+    # Зберігаємо бота для доступу зі сторони веб-сервера (статистика черги)
+    application.bot_data['nakladni_bot'] = bot
+    
+    # Періодичне очищення старих файлів
+    if application.job_queue and RETENTION_INTERVAL_HOURS > 0:
+        application.job_queue.run_repeating(
+            bot.run_retention,
+            interval=RETENTION_INTERVAL_HOURS * 3600,
+            first=60
+        )
+    
+    # Періодична компіляція таблиці виправлень з ручних анотацій
+    if application.job_queue and CORRECTIONS_COMPILE_MINUTES > 0:
+        application.job_queue.run_repeating(
+            bot.run_corrections_compile,
+            interval=CORRECTIONS_COMPILE_MINUTES * 60,
+            first=120
+        )
+    
+    # Періодичне ущільнення журналу рядків накладних
+    if application.job_queue and LEDGER_ENABLED and LEDGER_COMPACT_HOURS > 0:
+        application.job_queue.run_repeating(
+            bot.run_ledger_compact,
+            interval=LEDGER_COMPACT_HOURS * 3600,
+            first=180
+        )
+    
+    return application
+
+def main():
+    """Запуск бота"""
+    application = build_application()
     
     # Запускаємо бота
     logger.info("Бот запущений з системою тренування OCR!")
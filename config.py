@@ -1,10 +1,109 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Налаштування паралельності OCR, підібрані командою tune_parallelism.py (змінні середовища мають пріоритет)
+OCR_TUNING_FILE = os.getenv("OCR_TUNING_FILE", "ocr_tuning.json")
+try:
+    with open(OCR_TUNING_FILE, 'r', encoding='utf-8') as f:
+        OCR_TUNING = json.load(f)
+except (OSError, ValueError):
+    OCR_TUNING = {}
+
 # Telegram Bot Token - беремо з змінних середовища Railway
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "7940729582:AAHFGzrVxYLZT8VWZ90xHgJD6RF0OvK0jTs")
 
 # Налаштування для групування фото
-PHOTO_GROUPING_TIMEOUT = 300  # 5 хвилин в секундах 
\ No newline at end of file
+PHOTO_GROUPING_TIMEOUT = 300  # 5 хвилин в секундах 
+
+# Налаштування webhook (якщо WEBHOOK_URL не задано - бот працює через polling)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Наприклад: https://your-app.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Налаштування черги обробки накладних
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(OCR_TUNING.get("workers", 1))))  # Скільки накладних обробляється одночасно
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", str(OCR_TUNING.get("torch_threads", 0))))  # Потоків torch на OCR процес, 0 - за замовчуванням torch
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", str(OCR_TUNING.get("batch_size", 1))))  # Розмір пакета розпізнавання easyocr
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "1"))  # Одночасних накладних на користувача
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "20"))  # Максимум накладних в очікуванні
+
+# Поетапне оновлення статусу обробки накладної
+PROGRESSIVE_RESULTS = os.getenv("PROGRESSIVE_RESULTS", "1") == "1"
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.5"))  # Мінімум секунд між редагуваннями
+
+# Повторне розпізнавання блоків з низькою впевненістю
+REOCR_ENABLED = os.getenv("REOCR_ENABLED", "1") == "1"
+REOCR_CONFIDENCE_THRESHOLD = float(os.getenv("REOCR_CONFIDENCE_THRESHOLD", "0.4"))  # Блоки нижче - кандидати
+REOCR_MIN_CONFIDENCE = float(os.getenv("REOCR_MIN_CONFIDENCE", "0.05"))  # Нижче - шум, не варто часу
+REOCR_SCALE = float(os.getenv("REOCR_SCALE", "2.0"))  # Збільшення вирізаних блоків
+REOCR_TIME_BUDGET = float(os.getenv("REOCR_TIME_BUDGET", "3.0"))  # Секунд на повторний прохід для одного фото
+
+# Вирівнювання фото за еталоном бланка (еталони створюються командою template_registration.py calibrate)
+TEMPLATE_REGISTRATION = os.getenv("TEMPLATE_REGISTRATION", "1") == "1"
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "templates")
+TEMPLATE_MIN_INLIERS = int(os.getenv("TEMPLATE_MIN_INLIERS", "40"))  # Мінімум збігів ознак для гомографії
+
+# Обмеження пам'яті OCR процесів
+OCR_WORKER_MAX_JOBS = int(os.getenv("OCR_WORKER_MAX_JOBS", "50"))  # Перезапуск процесу після N фото
+OCR_WORKER_MAX_RSS_MB = float(os.getenv("OCR_WORKER_MAX_RSS_MB", "1500"))  # Перезапуск при перевищенні пам'яті
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "4000000"))  # Більші фото зменшуються перед OCR
+
+# Виправлення орієнтації фото перед OCR (EXIF, проєкційні профілі та перевірка 0/180 на мініатюрі)
+ORIENTATION_DETECTION = os.getenv("ORIENTATION_DETECTION", "1") == "1"
+ORIENTATION_THUMB_SIDE = int(os.getenv("ORIENTATION_THUMB_SIDE", "960"))  # Довша сторона мініатюри
+ORIENTATION_SAMPLE_BOXES = int(os.getenv("ORIENTATION_SAMPLE_BOXES", "8"))  # Блоків для перевірки 0/180
+
+# Фото, надіслані файлом (без стиснення Telegram): великі розпізнаються плитками паралельно в OCR процесах
+DOCUMENT_MAX_PIXELS = int(os.getenv("DOCUMENT_MAX_PIXELS", "16000000"))  # Бюджет пікселів для файлів
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", str(20 * 1024 * 1024)))  # Ліміт завантаження Bot API
+TILE_MIN_PIXELS = int(os.getenv("TILE_MIN_PIXELS", "6000000"))  # Більші зображення діляться на плитки, 0 - вимкнено
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1600"))  # Сторона плитки, пікселів
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "200"))  # Перекриття сусідніх плиток (більше за висоту рядка)
+
+# Архівувати Excel файли в папку excel_reports (файл у будь-якому разі надсилається користувачу)
+EXCEL_ARCHIVE = os.getenv("EXCEL_ARCHIVE", "1") == "1"
+
+# Політики зберігання файлів (у днях, 0 - не застосовувати)
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))  # 0 - фонове очищення вимкнено
+PHOTO_RECOMPRESS_DAYS = int(os.getenv("PHOTO_RECOMPRESS_DAYS", "7"))
+PHOTO_DELETE_DAYS = int(os.getenv("PHOTO_DELETE_DAYS", "90"))
+REPORT_DELETE_DAYS = int(os.getenv("REPORT_DELETE_DAYS", "30"))
+TRAINING_ARCHIVE_DAYS = int(os.getenv("TRAINING_ARCHIVE_DAYS", "30"))  # Анотовані накладні не архівуються
+ARCHIVE_SHARD_DELETE_DAYS = int(os.getenv("ARCHIVE_SHARD_DELETE_DAYS", "0"))
+
+# Папка з описами бланків постачальників (*.json)
+SUPPLIER_TEMPLATES_DIR = os.getenv("SUPPLIER_TEMPLATES_DIR", "supplier_templates")
+
+# Профілювання накладних (профілі зберігаються в training_data/invoice_<id>/, зведення: python profiling.py)
+PROFILE_EVERY_N = int(os.getenv("PROFILE_EVERY_N", "0"))  # Профілювати кожну N-ту накладну, 0 - вимкнено
+PROFILE_LATENCY_THRESHOLD = float(os.getenv("PROFILE_LATENCY_THRESHOLD", "0"))  # Зберігати профілі накладних, повільніших за N секунд
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))  # Частка накладних, які профілюються для порогу (0..1)
+
+# Пошук повторно надісланих накладних: sha256 файлу та відбиток клітинок кількості за еталоном бланка (до OCR)
+DUPLICATE_DETECTION = os.getenv("DUPLICATE_DETECTION", "1") == "1"
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "12"))  # Максимум різних бітів клітинок кількості для попередження (без калібрування)
+DUPLICATE_MIN_INK_BITS = int(os.getenv("DUPLICATE_MIN_INK_BITS", "40"))  # Майже порожня сторінка не порівнюється (заповнена клітинка - близько 12 бітів)
+DUPLICATE_CALIBRATION_FILE = os.getenv("DUPLICATE_CALIBRATION_FILE", "duplicate_calibration.json")
+DUPLICATE_WINDOW_DAYS = float(os.getenv("DUPLICATE_WINDOW_DAYS", "7"))  # Порівнювати лише з недавніми фото, 0 - з усіма
+
+# Таблиця виправлень OCR з ручних анотацій (компіляція: python correction_table.py)
+CORRECTIONS_FILE = os.getenv("CORRECTIONS_FILE", "training_data/corrections.json")
+CORRECTION_MIN_COUNT = int(os.getenv("CORRECTION_MIN_COUNT", "1"))  # Мінімум однакових анотацій для виправлення
+QUANTITY_CORRECTION_MIN_COUNT = int(os.getenv("QUANTITY_CORRECTION_MIN_COUNT", "5"))  # Кількість ризикованіше міняти - потрібно більше анотацій
+CORRECTIONS_COMPILE_MINUTES = float(os.getenv("CORRECTIONS_COMPILE_MINUTES", "60"))  # Як часто бот перекомпільовує таблицю, 0 - ніколи
+
+# Вихідний Excel: report - власний звіт, blank - заповнений оригінальний бланк, both - обидва
+EXCEL_OUTPUT_MODE = os.getenv("EXCEL_OUTPUT_MODE", "report")
+BLANK_FILE = os.getenv("BLANK_FILE", "бланк для випічки з новинками.xlsx")  # Бланк для режиму blank
+
+# Журнал розпізнаних рядків накладних (Parquet, денні розділи; запити: python ledger.py summary)
+LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "1") == "1"
+LEDGER_DIR = os.getenv("LEDGER_DIR", "ledger")
+LEDGER_COMPACT_HOURS = float(os.getenv("LEDGER_COMPACT_HOURS", "24"))  # Ущільнення завершених днів, 0 - вимкнено
+
+# Перевірка якості фото перед OCR (пороги калібруються командою python quality_gate.py calibrate)
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+QUALITY_THRESHOLDS_FILE = os.getenv("QUALITY_THRESHOLDS_FILE", "quality_thresholds.json")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Таблиця виправлень OCR, зібрана з ручних анотацій (manual_annotation.json)
+Повторювані помилки розпізнавання виправляються одним пошуком у словнику:
+точний текст OCR -> назва, потім нормалізований текст -> назва.
+
+Компіляція (бот також перекомпільовує таблицю періодично):
+    python correction_table.py [training_data]
+"""
+
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import CORRECTIONS_FILE, CORRECTION_MIN_COUNT, QUANTITY_CORRECTION_MIN_COUNT
+from text_normalizer import normalize_key
+
+logger = logging.getLogger(__name__)
+
+# Як часто парсер перевіряє, чи змінився файл таблиці (секунд)
+RELOAD_CHECK_INTERVAL = 5.0
+
+def quantity_key(name: str, quantity: float) -> str:
+    """Ключ виправлення кількості: нормалізована назва + розпізнана кількість"""
+    return f"{normalize_key(name)}|{float(quantity):g}"
+
+def pick_winners(votes: Dict[str, Counter], min_count: int) -> Dict[str, list]:
+    """Найчастіше виправлення для кожного ключа: {ключ: [значення, кількість]} (нічиї відкидаються)"""
+    winners = {}
+    for key, counter in votes.items():
+        ranked = counter.most_common(2)
+        value, count = ranked[0]
+        if count < min_count or (len(ranked) > 1 and ranked[1][1] == count):
+            continue
+        winners[key] = [value, count]
+    return winners
+
+def compile_corrections(training_dir: str = "training_data", min_count: int = CORRECTION_MIN_COUNT,
+                        quantity_min_count: int = QUANTITY_CORRECTION_MIN_COUNT) -> Dict:
+    """
+    Збирання таблиці виправлень з усіх анотацій
+    Виправлення кількості потребує quantity_min_count голосів: та сама розпізнана кількість
+    здебільшого правильна, і одна анотація не повинна міняти її у всіх наступних накладних
+    """
+    exact: Dict[str, Counter] = defaultdict(Counter)
+    normalized: Dict[str, Counter] = defaultdict(Counter)
+    quantities: Dict[str, Counter] = defaultdict(Counter)
+    bakeries: Dict[str, Counter] = defaultdict(Counter)
+    annotations = 0
+
+    for path in glob.glob(os.path.join(training_dir, "invoice_*", "manual_annotation.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                annotation = json.load(f)
+        except Exception as e:
+            logger.error(f"Помилка читання анотації {path}: {e}")
+            continue
+        annotations += 1
+
+        bakery = annotation.get('bakery_name', {})
+        if bakery.get('found_in_ocr') and bakery.get('correct_name'):
+            bakeries[normalize_key(bakery['found_in_ocr'])][bakery['correct_name'].strip()] += 1
+
+        for product in annotation.get('products', []):
+            ocr_name = (product.get('ocr_name') or '').strip()
+            if not ocr_name:
+                continue
+
+            # Підтверджена назва теж голосує - щоб одна помилкова анотація не переважила
+            correct_name = (product.get('correct_name') or '').strip()
+            if not correct_name and product.get('is_correct'):
+                correct_name = ocr_name
+            if correct_name:
+                exact[ocr_name][correct_name] += 1
+                normalized[normalize_key(ocr_name)][correct_name] += 1
+
+            correct_quantity = product.get('correct_quantity') or 0
+            ocr_quantity = product.get('ocr_quantity') or 0
+            # Підтверджений рядок голосує за розпізнану кількість - проти виправлень
+            if not correct_quantity and product.get('is_correct'):
+                correct_quantity = ocr_quantity
+            if correct_quantity > 0 and ocr_quantity > 0:
+                quantities[quantity_key(correct_name or ocr_name, ocr_quantity)][correct_quantity] += 1
+
+    def without_identity(table: Dict[str, list], key_of) -> Dict[str, list]:
+        # Записи "назва -> та сама назва" нічого не виправляють
+        return {key: value for key, value in table.items() if key != key_of(value[0])}
+
+    return {
+        'compiled_at': datetime.now().isoformat(),
+        'annotations': annotations,
+        'exact': without_identity(pick_winners(exact, min_count), lambda value: value),
+        'normalized': without_identity(pick_winners(normalized, min_count), normalize_key),
+        'quantities': {key: value for key, value in pick_winners(quantities, quantity_min_count).items()
+                       if float(key.rsplit('|', 1)[1]) != value[0]},
+        'bakery': without_identity(pick_winners(bakeries, min_count), normalize_key)
+    }
+
+def save_corrections(table: Dict, path: str = CORRECTIONS_FILE):
+    """Збереження таблиці (через тимчасовий файл, щоб парсер не прочитав її наполовину)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, path)
+
+class CorrectionTable:
+    """Таблиця виправлень для парсера з перезавантаженням при зміні файлу"""
+
+    def __init__(self, path: str = CORRECTIONS_FILE):
+        """Завантаження таблиці (якщо файл вже є)"""
+        self.path = path
+        self.mtime = None
+        self.checked_at = 0.0
+        self.exact: Dict[str, str] = {}
+        self.normalized: Dict[str, str] = {}
+        self.quantities: Dict[str, float] = {}
+        self.bakery: Dict[str, str] = {}
+        self.reload_if_changed(force=True)
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Перезавантаження таблиці, якщо файл змінився (перевірка не частіше раз на кілька секунд)"""
+        now = time.monotonic()
+        if not force and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return False
+        self.checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        except Exception as e:
+            logger.error(f"Помилка завантаження таблиці виправлень {self.path}: {e}")
+            return False
+
+        self.exact = {key: value[0] for key, value in table.get('exact', {}).items()}
+        self.normalized = {key: value[0] for key, value in table.get('normalized', {}).items()}
+        self.quantities = {key: value[0] for key, value in table.get('quantities', {}).items()}
+        self.bakery = {key: value[0] for key, value in table.get('bakery', {}).items()}
+        self.mtime = mtime
+        logger.info(f"Завантажено таблицю виправлень: {len(self.exact)} назв, {len(self.quantities)} кількостей")
+        return True
+
+    def correct_name(self, name: str) -> Optional[str]:
+        """Виправлена назва продукту або None"""
+        if not name:
+            return None
+        return self.exact.get(name) or self.normalized.get(normalize_key(name))
+
+    def correct_quantity(self, name: str, quantity: float) -> Optional[float]:
+        """Виправлена кількість для продукту або None"""
+        if not self.quantities:
+            return None
+        return self.quantities.get(quantity_key(name, quantity))
+
+    def correct_bakery(self, bakery_name: Optional[str]) -> Optional[str]:
+        """Виправлена назва пекарні (або та сама)"""
+        if not bakery_name or not self.bakery:
+            return bakery_name
+        return self.bakery.get(normalize_key(bakery_name), bakery_name)
+
+def main():
+    """Компіляція таблиці з командного рядка"""
+    logging.basicConfig(level=logging.INFO)
+    training_dir = sys.argv[1] if len(sys.argv) > 1 else "training_data"
+
+    print("📚 КОМПІЛЯЦІЯ ТАБЛИЦІ ВИПРАВЛЕНЬ")
+    print("=" * 50)
+
+    table = compile_corrections(training_dir)
+    save_corrections(table)
+
+    print(f"Анотацій: {table['annotations']}")
+    print(f"Виправлень назв: {len(table['exact'])} точних, {len(table['normalized'])} нормалізованих")
+    print(f"Виправлень кількості: {len(table['quantities'])}")
+    print(f"Виправлень назв пекарень: {len(table['bakery'])}")
+    print(f"Збережено в {CORRECTIONS_FILE} - парсер підхопить зміни без перезапуску")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Пошук повторно надісланих накладних
+Побайтово той самий файл (sha256) - точний повтор: бот бере попередній результат без OCR
+і не зберігає його в тренувальні дані.
+Перезйомка тієї ж накладної дає інший файл, а різні накладні на спільному бланку - майже
+однакові фото, тому перцептивний відбиток рахується не з усього фото, а з клітинок кількості,
+вирівняних за еталоном бланка (template_registration): які клітинки заповнені і де в них чорнило.
+Схожий відбиток - лише попередження користувачу, і лише впевнене: заповнених клітинок достатньо,
+а відстань не більша за поріг, відкалібрований на справжніх парах фото.
+Відбитки зберігаються в jsonl файлі, пошук - через BK-дерево окремо для кожної сторінки бланка.
+
+Калібрування порогу (pairs/<накладна>/*.jpg - кілька знімків однієї заповненої сторінки):
+    python duplicate_detector.py calibrate pairs [training_data]
+"""
+
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import (DUPLICATE_CALIBRATION_FILE, DUPLICATE_MAX_DISTANCE, DUPLICATE_MIN_INK_BITS,
+                    DUPLICATE_WINDOW_DAYS, TEMPLATE_DIR)
+from template_registration import TemplateRegistrar
+
+logger = logging.getLogger(__name__)
+
+# Сітка однієї клітинки кількості (рядки, колонки): біт - чи є чорнило в комірці сітки
+CELL_GRID = (4, 16)
+# Частка краю клітинки, яка не враховується (лінії таблиці після неточного вирівнювання)
+CELL_MARGIN = 0.15
+# Піксель - чорнило, якщо він темніший за цю частку яскравості паперу в клітинці
+INK_DARKNESS = 0.6
+# Частка пікселів комірки сітки з чорнилом, з якої біт встановлюється
+INK_LEVEL = 0.08
+# Скільки фото з training_data брати для пар різних накладних під час калібрування
+CALIBRATION_PHOTOS = 200
+
+# Відбиток сторінки: (назва сторінки еталона, біти клітинок кількості)
+QuantityHash = Tuple[str, int]
+
+def file_digest(path: str) -> str:
+    """sha256 вмісту файлу"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cell_bits(aligned: np.ndarray, box: List[int]) -> np.ndarray:
+    """Біти чорнила однієї клітинки кількості вирівняного фото"""
+    x_min, x_max, y_min, y_max = box
+    margin_x = int((x_max - x_min) * CELL_MARGIN)
+    margin_y = int((y_max - y_min) * CELL_MARGIN)
+    crop = aligned[y_min + margin_y:y_max - margin_y, x_min + margin_x:x_max - margin_x]
+    rows, columns = CELL_GRID
+    if crop.size == 0:
+        return np.zeros(rows * columns, dtype=bool)
+
+    paper = float(np.percentile(crop, 90))
+    ink = (crop < paper * INK_DARKNESS).astype(np.float32)
+    grid = cv2.resize(ink, (columns, rows), interpolation=cv2.INTER_AREA)
+    return (grid > INK_LEVEL).ravel()
+
+def quantity_bits(aligned: np.ndarray, cells: List[Dict]) -> int:
+    """Біти всіх клітинок кількості сторінки (порядок - як у розмітці еталона)"""
+    bits = np.concatenate([cell_bits(aligned, cell['quantity_box']) for cell in cells])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def ink_bits(value: int) -> int:
+    """Кількість встановлених бітів (скільки чорнила у відбитку)"""
+    return value.bit_count()
+
+class QuantityHasher:
+    """Відбиток клітинок кількості фото, вирівняного за еталоном бланка"""
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR):
+        """Еталони завантажуються без OCR моделі - потрібне лише вирівнювання"""
+        self.registrar = TemplateRegistrar(None, template_dir)
+        # Детектор ознак OpenCV не розрахований на одночасні виклики з кількох потоків
+        self.lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        """Чи є відкалібровані еталони"""
+        return self.registrar.is_ready()
+
+    def hash(self, image_path: str) -> Optional[QuantityHash]:
+        """Відбиток фото або None (фото не вирівнюється за жодним еталоном)"""
+        if not self.registrar.is_ready():
+            return None
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+        with self.lock:
+            aligned = self.registrar.align(image)
+        if aligned is None:
+            return None
+        cells = aligned['page']['layout'].get('cells', [])
+        if not cells:
+            return None
+        return aligned['page']['name'], quantity_bits(aligned['image'], cells)
+
+def load_max_distance(path: str = DUPLICATE_CALIBRATION_FILE) -> int:
+    """Відкалібрований поріг відстані (немає калібрування - DUPLICATE_MAX_DISTANCE)"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return int(json.load(f)['max_distance'])
+        except Exception as e:
+            logger.error(f"Помилка завантаження калібрування повторів {path}: {e}")
+    return DUPLICATE_MAX_DISTANCE
+
+def hamming(a: int, b: int) -> int:
+    """Кількість різних бітів"""
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """BK-дерево для пошуку хешів у межах відстані Хеммінга"""
+
+    def __init__(self):
+        # Вузол: [хеш, записи з цим хешем, {відстань: дочірній вузол}]
+        self.root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item: Any):
+        """Додавання хеша"""
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """Усі записи на відстані не більше max_distance, від найближчих"""
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # Нерівність трикутника: піддерева поза [d - max, d + max] не можуть містити збігів
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        found.sort(key=lambda match: match[0])
+        return found
+
+class DuplicateIndex:
+    """Індекс відбитків і sha256 фото накладних (training_data/photo_hashes.jsonl)"""
+
+    def __init__(self, index_file: str, max_distance: Optional[int] = None,
+                 window_days: float = DUPLICATE_WINDOW_DAYS, min_ink_bits: int = DUPLICATE_MIN_INK_BITS):
+        """Завантаження збережених відбитків"""
+        self.index_file = index_file
+        self.max_distance = load_max_distance() if max_distance is None else max_distance
+        self.window_days = window_days
+        self.min_ink_bits = min_ink_bits
+        self.trees: Dict[str, BKTree] = {}
+        self.digests: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def remember(self, entry: Dict[str, Any]):
+        """Додавання запису в дерево його сторінки та словник sha256"""
+        if entry.get('quantity_hash') and entry.get('template'):
+            self.trees.setdefault(entry['template'], BKTree()).add(int(entry['quantity_hash'], 16), entry)
+        if entry.get('sha256'):
+            self.digests[entry['sha256']] = entry
+
+    def load(self):
+        """Читання jsonl файлу (старі записи з pHash всього фото лишаються лише для sha256)"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self.remember(json.loads(line))
+            logger.info(f"Завантажено відбитків фото: {sum(tree.size for tree in self.trees.values())}, "
+                        f"sha256: {len(self.digests)}")
+        except Exception as e:
+            logger.error(f"Помилка завантаження індексу хешів {self.index_file}: {e}")
+
+    def oldest_time(self) -> float:
+        """Час найстарішого запису, з яким ще порівнюємо"""
+        return time.time() - self.window_days * 24 * 60 * 60 if self.window_days > 0 else 0
+
+    def find_identical(self, digest: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Раніше збережене побайтово те саме фото (за sha256) або None"""
+        if not digest:
+            return None
+        with self.lock:
+            entry = self.digests.get(digest)
+        if entry is None or entry.get('time', 0) < self.oldest_time():
+            return None
+        return {**entry, 'distance': 0, 'identical': True}
+
+    def find(self, quantity_hash: Optional[QuantityHash],
+             digest: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Раніше збережене фото (з полями invoice_id, page, distance, identical) або None
+        identical - той самий файл за sha256; інакше - впевнений збіг відбитка клітинок кількості:
+        майже порожня сторінка схожа на будь-яку іншу, тому потрібно min_ink_bits бітів чорнила
+        """
+        identical = self.find_identical(digest)
+        if identical:
+            return identical
+        if quantity_hash is None or self.max_distance < 0:
+            return None
+        template, value = quantity_hash
+        if ink_bits(value) < self.min_ink_bits:
+            return None
+
+        oldest = self.oldest_time()
+        with self.lock:
+            tree = self.trees.get(template)
+            matches = tree.search(value, self.max_distance) if tree else []
+        for distance, entry in matches:
+            if entry.get('time', 0) >= oldest:
+                return {**entry, 'distance': distance, 'identical': False}
+        return None
+
+    def add(self, quantity_hash: Optional[QuantityHash], invoice_id: str, page: str,
+            digest: Optional[str] = None):
+        """Додавання відбитка та sha256 збереженого фото"""
+        if quantity_hash is None and not digest:
+            return
+        entry = {'invoice_id': invoice_id, 'page': page, 'time': time.time()}
+        if quantity_hash is not None:
+            entry['template'], entry['quantity_hash'] = quantity_hash[0], format(quantity_hash[1], 'x')
+        if digest:
+            entry['sha256'] = digest
+        with self.lock:
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+            self.remember(entry)
+
+def photo_groups(pairs_dir: str) -> Dict[str, List[str]]:
+    """Знімки однієї накладної: підпапки pairs_dir"""
+    groups = {}
+    for group_dir in sorted(glob.glob(os.path.join(pairs_dir, "*"))):
+        photos = sorted(path for path in glob.glob(os.path.join(group_dir, "*"))
+                        if path.lower().endswith(('.jpg', '.jpeg', '.png')))
+        if os.path.isdir(group_dir) and len(photos) >= 2:
+            groups[os.path.basename(group_dir)] = photos
+    return groups
+
+def calibrate(pairs_dir: str, training_dir: str = "training_data",
+              min_ink_bits: int = DUPLICATE_MIN_INK_BITS, hasher: Optional[QuantityHasher] = None) -> Dict:
+    """
+    Поріг відстані за справжніми парами фото
+    Повтори - знімки однієї накладної з pairs_dir; різні накладні - фото з training_data
+    та знімки різних груп pairs_dir. Поріг ставиться нижче найближчої пари різних накладних,
+    тож на цих даних попередження не буває хибним
+    """
+    hasher = hasher or QuantityHasher()
+    labelled = []
+    for group, photos in photo_groups(pairs_dir).items():
+        labelled.extend((group, photo) for photo in photos)
+    training_photos = sorted(glob.glob(os.path.join(training_dir, "invoice_*", "photo*.*")))[:CALIBRATION_PHOTOS]
+    # Сторінки однієї збереженої накладної різні, тож кожне фото - окрема "накладна"
+    labelled.extend((f"training:{photo}", photo) for photo in training_photos)
+
+    hashes = []
+    for group, photo in labelled:
+        quantity_hash = hasher.hash(photo)
+        if quantity_hash and ink_bits(quantity_hash[1]) >= min_ink_bits:
+            hashes.append((group, quantity_hash))
+
+    same, different = [], []
+    for (group_a, (page_a, value_a)), (group_b, (page_b, value_b)) in itertools.combinations(hashes, 2):
+        if page_a != page_b:
+            continue
+        (same if group_a == group_b else different).append(hamming(value_a, value_b))
+
+    result = {
+        'max_distance': DUPLICATE_MAX_DISTANCE,
+        'calibrated': bool(same and different),
+        'photos': len(hashes),
+        'same_pairs': len(same),
+        'different_pairs': len(different),
+        'calibrated_at': datetime.now().isoformat()
+    }
+    if not result['calibrated']:
+        return result
+
+    closest_different = min(different)
+    farthest_same = max(same)
+    if farthest_same < closest_different:
+        # Посередині між повторами та різними накладними
+        max_distance = (farthest_same + closest_different - 1) // 2
+    else:
+        max_distance = closest_different - 1
+    result.update({
+        'max_distance': max(max_distance, 0),
+        'same_caught': sum(1 for distance in same if distance <= max_distance),
+        'closest_different': closest_different,
+        'farthest_same': farthest_same
+    })
+    return result
+
+def main():
+    """Калібрування порогу з командного рядка"""
+    if len(sys.argv) < 3 or sys.argv[1] != 'calibrate':
+        print(__doc__)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    pairs_dir = sys.argv[2]
+    training_dir = sys.argv[3] if len(sys.argv) > 3 else "training_data"
+    print("🔁 КАЛІБРУВАННЯ ПОШУКУ ПОВТОРНИХ НАКЛАДНИХ")
+    print("=" * 50)
+
+    hasher = QuantityHasher()
+    if not hasher.is_ready():
+        print(f"❌ Немає еталона бланка в {TEMPLATE_DIR} - спершу python template_registration.py calibrate")
+        return
+
+    result = calibrate(pairs_dir, training_dir, hasher=hasher)
+    print(f"Фото з відбитком: {result['photos']}, пар повторів: {result['same_pairs']}, "
+          f"пар різних накладних: {result['different_pairs']}")
+    if not result['calibrated']:
+        print(f"⚠️ Потрібні і повтори, і різні накладні - поріг не змінено ({DUPLICATE_MAX_DISTANCE})")
+        return
+    print(f"Найдальший повтор: {result['farthest_same']}, найближча інша накладна: {result['closest_different']}")
+    print(f"Поріг: {result['max_distance']} (розпізнає повторів: {result['same_caught']}/{result['same_pairs']})")
+
+    with open(DUPLICATE_CALIBRATION_FILE, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Збережено в {DUPLICATE_CALIBRATION_FILE} - бот використає поріг при наступному запуску")
+
+if __name__ == "__main__":
+    main()
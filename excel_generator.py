@@ -2,11 +2,14 @@ import pandas as pd
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
-from typing import List, Dict
+from io import BytesIO
+from typing import List, Sequence, Tuple
 import os
 from datetime import datetime
 import logging
 
+from records import Invoice, ProductLine
+
 logger = logging.getLogger(__name__)
 
 class ExcelGenerator:
@@ -17,18 +20,49 @@ class ExcelGenerator:
             os.makedirs(self.output_dir)
             logger.info(f"Створено папку: {self.output_dir}")
     
-    def create_excel(self, bakery_name: str, products: List[Dict], date: str = None) -> str:
+    def create_excel(self, invoice: Invoice, date: str = None) -> str:
         """Створення Excel файлу для накладної"""
         if not date:
             date = datetime.now().strftime("%d.%m")
         
+        filepath = os.path.join(self.output_dir, self.get_filename(invoice.bakery_name, date))
+        
+        # Зберігаємо
+        workbook = self.build_workbook(invoice, date)
+        workbook.save(filepath)
+        logger.info(f"Створено Excel файл: {filepath}")
+        
+        return filepath
+    
+    def create_excel_bytes(self, invoice: Invoice, date: str = None) -> Tuple[str, BytesIO]:
+        """Створення Excel файлу в пам'яті (без запису на диск) - для відправки користувачу"""
+        if not date:
+            date = datetime.now().strftime("%d.%m")
+        
+        buffer = BytesIO()
+        self.build_workbook(invoice, date).save(buffer)
+        buffer.seek(0)
+        
+        return self.get_filename(invoice.bakery_name, date), buffer
+    
+    def archive_excel(self, filename: str, data: bytes) -> str:
+        """Збереження готового Excel файлу в архів"""
+        filepath = os.path.join(self.output_dir, filename)
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        logger.info(f"Excel файл збережено в архів: {filepath}")
+        return filepath
+    
+    def get_filename(self, bakery_name: str, date: str) -> str:
+        """Назва Excel файлу для накладної"""
         # Очищаємо назву пекарні для файлу
         safe_bakery_name = self.sanitize_filename(bakery_name) if bakery_name else "Невідома_пекарня"
-        filename = f"{safe_bakery_name}_{date}.xlsx"
-        filepath = os.path.join(self.output_dir, filename)
-        
+        return f"{safe_bakery_name}_{date}.xlsx"
+    
+    def build_workbook(self, invoice: Invoice, date: str) -> openpyxl.Workbook:
+        """Побудова робочої книги для накладної"""
         # Створюємо DataFrame
-        df = self.create_dataframe(products)
+        df = self.create_dataframe(invoice.products)
         
         # Створюємо Excel файл
         workbook = openpyxl.Workbook()
@@ -36,21 +70,17 @@ class ExcelGenerator:
         worksheet.title = "Накладна"
         
         # Додаємо заголовок
-        self.add_header(worksheet, bakery_name, date)
+        self.add_header(worksheet, invoice.bakery_name, date)
         
         # Додаємо дані
-        self.add_data(worksheet, df)
+        self.add_data(worksheet, df, invoice)
         
         # Форматуємо
         self.format_worksheet(worksheet, df)
         
-        # Зберігаємо
-        workbook.save(filepath)
-        logger.info(f"Створено Excel файл: {filepath}")
-        
-        return filepath
+        return workbook
     
-    def create_dataframe(self, products: List[Dict]) -> pd.DataFrame:
+    def create_dataframe(self, products: Sequence[ProductLine]) -> pd.DataFrame:
         """Створення DataFrame з продуктами"""
         if not products:
             return pd.DataFrame(columns=['№', 'Назва продукту', 'Кількість', 'Ціна', 'Сума'])
@@ -59,10 +89,10 @@ class ExcelGenerator:
         for i, product in enumerate(products, 1):
             data.append({
                 '№': i,
-                'Назва продукту': product.get('name', ''),
-                'Кількість': product.get('quantity', 0),
-                'Ціна': product.get('price', 0),
-                'Сума': product.get('total', 0)
+                'Назва продукту': product.name,
+                'Кількість': product.quantity,
+                'Ціна': product.price,
+                'Сума': product.total
             })
         
         return pd.DataFrame(data)
@@ -90,7 +120,7 @@ class ExcelGenerator:
             cell.font = Font(bold=True)
             cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
     
-    def add_data(self, worksheet, df: pd.DataFrame):
+    def add_data(self, worksheet, df: pd.DataFrame, invoice: Invoice):
         """Додавання даних"""
         if df.empty:
             return
@@ -105,12 +135,9 @@ class ExcelGenerator:
         worksheet[f'A{total_row}'].font = Font(bold=True)
         worksheet.merge_cells(f'A{total_row}:C{total_row}')
         
-        # Підраховуємо підсумки
-        total_quantity = df['Кількість'].sum()
-        total_amount = df['Сума'].sum()
-        
-        worksheet[f'D{total_row}'] = total_quantity
-        worksheet[f'E{total_row}'] = total_amount
+        # Підсумки вже пораховані в накладній
+        worksheet[f'D{total_row}'] = invoice.total_quantity
+        worksheet[f'E{total_row}'] = invoice.total_amount
         worksheet[f'D{total_row}'].font = Font(bold=True)
         worksheet[f'E{total_row}'].font = Font(bold=True)
     
@@ -172,9 +199,9 @@ class ExcelGenerator:
         
         return filename.strip()
     
-    def create_multiple_sheets_excel(self, invoices_data: List[Dict]) -> str:
+    def create_multiple_sheets_excel(self, invoices: List[Invoice]) -> str:
         """Створення Excel файлу з кількома аркушами для різних накладних"""
-        if not invoices_data:
+        if not invoices:
             return None
         
         date = datetime.now().strftime("%d.%m")
@@ -186,17 +213,16 @@ class ExcelGenerator:
         # Видаляємо стандартний аркуш
         workbook.remove(workbook.active)
         
-        for i, invoice in enumerate(invoices_data):
-            bakery_name = invoice.get('bakery_name', f'Накладна_{i+1}')
-            products = invoice.get('products', [])
+        for i, invoice in enumerate(invoices):
+            bakery_name = invoice.bakery_name or f'Накладна_{i+1}'
             
             # Створюємо аркуш
             worksheet = workbook.create_sheet(title=f"Накладна_{i+1}")
             
             # Додаємо дані
-            df = self.create_dataframe(products)
+            df = self.create_dataframe(invoice.products)
             self.add_header(worksheet, bakery_name, date)
-            self.add_data(worksheet, df)
+            self.add_data(worksheet, df, invoice)
             self.format_worksheet(worksheet, df)
         
         workbook.save(filepath)
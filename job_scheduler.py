@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class InvoiceJobScheduler:
+    """Черга обробки накладних з чесним розподілом між користувачами"""
+
+    def __init__(self, max_workers: int = 1, per_user_limit: int = 1, max_queue_size: int = 20):
+        """Ініціалізація планувальника"""
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self.max_queue_size = max_queue_size
+
+        # Черги завдань кожного користувача та порядок обходу (round-robin)
+        self.queues: Dict[int, Deque[Dict[str, Any]]] = {}
+        self.rotation: Deque[int] = deque()
+        self.running: Dict[int, int] = {}
+        self.queued_count = 0
+
+        self.workers: List[asyncio.Task] = []
+        self.wakeup: Optional[asyncio.Event] = None
+
+        self.stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'failed': 0,
+            'total_wait_time': 0.0,
+            'total_run_time': 0.0
+        }
+
+    def submit(self, user_id: int, job: Callable[[], Awaitable]) -> Optional[int]:
+        """
+        Додавання завдання в чергу
+        Повертає позицію в черзі (0 - обробка почнеться одразу) або None, якщо черга переповнена
+        """
+        if self.queued_count >= self.max_queue_size:
+            self.stats['rejected'] += 1
+            logger.warning(f"Черга переповнена, завдання користувача {user_id} відхилено")
+            return None
+
+        if user_id not in self.queues:
+            self.queues[user_id] = deque()
+            self.rotation.append(user_id)
+
+        self.queues[user_id].append({'job': job, 'submitted_at': time.time()})
+        self.queued_count += 1
+        self.stats['submitted'] += 1
+
+        position = self.queue_position(user_id)
+
+        self.ensure_workers()
+        self.wakeup.set()
+        return position
+
+    def queue_position(self, user_id: int) -> int:
+        """
+        Позиція останнього завдання користувача з урахуванням round-robin (0 - обробка почнеться одразу)
+        Завдання попереду, які займуть вільні обробники, ще лежать у черзі, але не чекають -
+        рахуються лише ті, що чекають на зайняті обробники
+        """
+        own_queue = self.queues.get(user_id)
+        if not own_queue:
+            return 0
+
+        # Перед завданням стоять k завдань самого користувача,
+        # а також до k (+1 для тих, хто раніше в порядку обходу) завдань інших
+        k = len(own_queue) - 1
+        ahead = k
+        before_user = True
+        for other_id in self.rotation:
+            if other_id == user_id:
+                before_user = False
+                continue
+            rounds = k + 1 if before_user else k
+            ahead += min(len(self.queues.get(other_id, ())), rounds)
+
+        free_workers = max(self.max_workers - self.busy_workers(), 0)
+        # Власні попередні завдання разом з тими, що виконуються, можуть вичерпати ліміт користувача
+        user_blocked = self.running.get(user_id, 0) + k >= self.per_user_limit
+        if ahead < free_workers and not user_blocked:
+            return 0
+        return max(ahead + 1 - free_workers, 1)
+
+    def busy_workers(self) -> int:
+        """Кількість завдань, що виконуються"""
+        return sum(self.running.values())
+
+    def ensure_workers(self):
+        """Запуск обробників у поточному event loop"""
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.max_workers:
+            self.workers.append(asyncio.create_task(self.worker()))
+
+    def next_job(self) -> Optional[Dict[str, Any]]:
+        """Вибір наступного завдання по колу серед користувачів"""
+        for _ in range(len(self.rotation)):
+            user_id = self.rotation[0]
+            self.rotation.rotate(-1)
+
+            queue = self.queues[user_id]
+            if queue and self.running.get(user_id, 0) < self.per_user_limit:
+                entry = queue.popleft()
+                self.queued_count -= 1
+                if not queue:
+                    # Прибираємо порожню чергу, щоб обхід не ріс з кількістю користувачів
+                    del self.queues[user_id]
+                    self.rotation.remove(user_id)
+                entry['user_id'] = user_id
+                return entry
+
+        return None
+
+    async def worker(self):
+        """Обробник завдань з черги"""
+        while True:
+            entry = self.next_job()
+            if entry is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            user_id = entry['user_id']
+            self.running[user_id] = self.running.get(user_id, 0) + 1
+            started_at = time.time()
+            self.stats['total_wait_time'] += started_at - entry['submitted_at']
+
+            try:
+                await entry['job']()
+                self.stats['completed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Помилка виконання завдання користувача {user_id}: {e}")
+            finally:
+                self.stats['total_run_time'] += time.time() - started_at
+                self.running[user_id] -= 1
+                if not self.running[user_id]:
+                    del self.running[user_id]
+                # Користувач міг мати завдання, заблоковані лімітом
+                self.wakeup.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика черги для моніторингу"""
+        finished = self.stats['completed'] + self.stats['failed']
+        started = finished + self.busy_workers()
+        return {
+            'queued': self.queued_count,
+            'running': self.busy_workers(),
+            'users_waiting': len(self.rotation),
+            'max_workers': self.max_workers,
+            'per_user_limit': self.per_user_limit,
+            'max_queue_size': self.max_queue_size,
+            'submitted': self.stats['submitted'],
+            'rejected': self.stats['rejected'],
+            'completed': self.stats['completed'],
+            'failed': self.stats['failed'],
+            'average_wait_time': self.stats['total_wait_time'] / started if started else 0.0,
+            'average_run_time': self.stats['total_run_time'] / finished if finished else 0.0
+        }
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Журнал розпізнаних рядків накладних у колонковому форматі (Parquet)
+Кожна оброблена накладна дописується окремим файлом у денний розділ
+ledger/date=YYYY-MM-DD/, старі дні періодично ущільнюються в один файл.
+Аналітика читає лише потрібні колонки та дні, не торкаючись фото та Excel.
+
+Використання:
+    python ledger.py summary --from 2026-09-01 --to 2026-09-30 --product "Багет ВП" --by bakery
+    python ledger.py compact
+    python ledger.py backfill [training_data]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import LEDGER_DIR
+from records import Invoice
+
+logger = logging.getLogger(__name__)
+
+# Типи колонок (рядки в Parquet і так зберігаються словником значень)
+SCHEMA = pa.schema([
+    ('invoice_id', pa.string()),
+    ('processed_at', pa.timestamp('s')),
+    ('user_id', pa.int64()),
+    ('bakery', pa.string()),
+    ('line', pa.int16()),
+    ('code', pa.string()),
+    ('name', pa.string()),
+    ('quantity', pa.float32()),
+    ('price', pa.float32()),
+    ('total', pa.float32()),
+    ('weight', pa.float32()),
+    ('weight_unit', pa.string())
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+
+# Колонки, які в pandas зручніше мати категоріями (мало різних значень)
+CATEGORY_COLUMNS = ('bakery', 'code', 'name', 'weight_unit')
+
+# Назва групи для рядків без пекарні, коду чи назви
+UNKNOWN_GROUP = "Невідома"
+
+class InvoiceLedger:
+    """Журнал рядків накладних з денними розділами"""
+
+    def __init__(self, ledger_dir: str = LEDGER_DIR):
+        """Ініціалізація (папка створюється при першому записі)"""
+        self.ledger_dir = ledger_dir
+
+    def partition_dir(self, day: date) -> str:
+        """Папка денного розділу"""
+        return os.path.join(self.ledger_dir, f"date={day.isoformat()}")
+
+    def invoice_table(self, invoice: Invoice, user_id: Optional[int], processed_at: datetime) -> pa.Table:
+        """Рядки накладної як таблиця Arrow"""
+        products = invoice.products
+        columns = {
+            'invoice_id': [invoice.invoice_id] * len(products),
+            'processed_at': [processed_at.replace(microsecond=0)] * len(products),
+            'user_id': [user_id] * len(products),
+            'bakery': [invoice.bakery_name] * len(products),
+            'line': list(range(1, len(products) + 1)),
+            'code': [product.code for product in products],
+            'name': [product.name for product in products],
+            'quantity': [product.quantity for product in products],
+            'price': [product.price for product in products],
+            'total': [product.total for product in products],
+            'weight': [product.weight for product in products],
+            'weight_unit': [product.weight_unit for product in products]
+        }
+        return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+    def append_invoice(self, invoice: Invoice, user_id: Optional[int] = None,
+                       processed_at: Optional[datetime] = None) -> Optional[str]:
+        """Дописування накладної новим файлом у розділ дня обробки"""
+        if not invoice.products:
+            return None
+        processed_at = processed_at or datetime.now()
+
+        directory = self.partition_dir(processed_at.date())
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{invoice.invoice_id}-{uuid.uuid4().hex[:8]}.parquet")
+
+        # Через тимчасовий файл, щоб запит не прочитав файл наполовину
+        temp_file = path + ".tmp"
+        pq.write_table(self.invoice_table(invoice, user_id, processed_at), temp_file, compression='zstd')
+        os.replace(temp_file, path)
+        logger.info(f"Накладну {invoice.invoice_id} додано в журнал: {len(invoice)} рядків")
+        return path
+
+    def compact(self, before: Optional[date] = None) -> Dict[str, int]:
+        """
+        Ущільнення завершених днів: усі файли розділу -> один файл
+        Сьогоднішній розділ не чіпаємо - туди ще дописуються накладні
+        """
+        before = before or date.today()
+        stats = {'partitions': 0, 'files': 0}
+        for directory in sorted(glob.glob(os.path.join(self.ledger_dir, "date=*"))):
+            try:
+                day = date.fromisoformat(os.path.basename(directory).split('=', 1)[1])
+            except ValueError:
+                continue
+            files = sorted(glob.glob(os.path.join(directory, "*.parquet")))
+            if day >= before or len(files) < 2:
+                continue
+
+            table = pa.concat_tables([pq.read_table(path, schema=SCHEMA) for path in files])
+            table = table.sort_by([('processed_at', 'ascending'), ('invoice_id', 'ascending'), ('line', 'ascending')])
+            path = os.path.join(directory, f"compact-{uuid.uuid4().hex[:8]}.parquet")
+            temp_file = path + ".tmp"
+            pq.write_table(table, temp_file, compression='zstd')
+            os.replace(temp_file, path)
+            for old_file in files:
+                os.remove(old_file)
+
+            stats['partitions'] += 1
+            stats['files'] += len(files)
+        if stats['partitions']:
+            logger.info(f"Журнал ущільнено: {stats['files']} файлів у {stats['partitions']} розділах")
+        return stats
+
+    def query(self, start: Optional[date] = None, end: Optional[date] = None,
+              columns: Optional[List[str]] = None, bakery: Optional[str] = None,
+              product: Optional[str] = None) -> pd.DataFrame:
+        """
+        Рядки накладних за період (включно) як DataFrame
+        Читаються лише потрібні колонки та денні розділи; product - частина назви без урахування регістру
+        """
+        if not os.path.isdir(self.ledger_dir):
+            return pd.DataFrame(columns=['date'] + (columns or SCHEMA.names))
+
+        dataset = ds.dataset(self.ledger_dir, format='parquet', schema=SCHEMA.append(pa.field('date', pa.string())),
+                             partitioning=PARTITIONING, exclude_invalid_files=True)
+        condition = None
+        for expression in (
+            ds.field('date') >= start.isoformat() if start else None,
+            ds.field('date') <= end.isoformat() if end else None,
+            ds.field('bakery') == bakery if bakery else None
+        ):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+
+        read_columns = None
+        if columns:
+            read_columns = list(dict.fromkeys(['date'] + columns + (['name'] if product else [])))
+        frame = dataset.to_table(columns=read_columns, filter=condition).to_pandas()
+
+        if product:
+            frame = frame[frame['name'].str.contains(product, case=False, regex=False, na=False)]
+            if columns and 'name' not in columns:
+                frame = frame.drop(columns='name')
+        for column in CATEGORY_COLUMNS:
+            if column in frame.columns:
+                frame[column] = frame[column].astype('category')
+        return frame.reset_index(drop=True)
+
+    def summary(self, start: Optional[date] = None, end: Optional[date] = None,
+                product: Optional[str] = None, by: str = 'bakery') -> pd.DataFrame:
+        """Сума кількостей і грошей за групою (bakery, name, code або date)"""
+        frame = self.query(start, end, columns=[by, 'quantity', 'total', 'invoice_id'], product=product)
+        if frame.empty:
+            return pd.DataFrame(columns=[by, 'quantity', 'total', 'invoices'])
+        # Рядки без значення групи - окремою групою, щоб суми збігалися з усім журналом
+        result = (frame.groupby(by, observed=True, dropna=False)
+                  .agg(quantity=('quantity', 'sum'), total=('total', 'sum'), invoices=('invoice_id', 'nunique'))
+                  .sort_values('quantity', ascending=False)
+                  .reset_index())
+        result[by] = result[by].astype(object).fillna(UNKNOWN_GROUP)
+        return result
+
+    def backfill(self, training_dir: str = "training_data") -> int:
+        """Заповнення журналу з уже збережених накладних (training_data/invoice_*/ocr_results.json)"""
+        added = 0
+        for results_file in sorted(glob.glob(os.path.join(training_dir, "invoice_*", "ocr_results.json"))):
+            invoice_id = os.path.basename(os.path.dirname(results_file))[len("invoice_"):]
+            try:
+                # id накладної: <користувач>_<YYYYmmdd_HHMMSS>
+                user_id, stamp = invoice_id.split('_', 1)
+                processed_at = datetime.strptime(stamp, "%Y%m%d_%H%M%S")
+                with open(results_file, 'r', encoding='utf-8') as f:
+                    invoice = Invoice.from_dict(invoice_id, json.load(f))
+            except Exception as e:
+                logger.error(f"Пропущено {results_file}: {e}")
+                continue
+            if self.append_invoice(invoice, int(user_id) if user_id.isdigit() else None, processed_at):
+                added += 1
+        return added
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    """Дата з рядка YYYY-MM-DD"""
+    return date.fromisoformat(value) if value else None
+
+def main():
+    """Запити до журналу з командного рядка"""
+    parser = argparse.ArgumentParser(description="Журнал розпізнаних рядків накладних")
+    parser.add_argument('--ledger', default=LEDGER_DIR, help="Папка журналу")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    summary = commands.add_parser('summary', help="Суми кількостей за період")
+    summary.add_argument('--from', dest='start', help="Початкова дата YYYY-MM-DD")
+    summary.add_argument('--to', dest='end', help="Кінцева дата YYYY-MM-DD (включно)")
+    summary.add_argument('--product', help="Частина назви продукту")
+    summary.add_argument('--by', default='bakery', choices=['bakery', 'name', 'code', 'date'], help="Групування")
+
+    commands.add_parser('compact', help="Ущільнити завершені дні")
+
+    backfill = commands.add_parser('backfill', help="Заповнити журнал з training_data")
+    backfill.add_argument('training_dir', nargs='?', default="training_data")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    ledger = InvoiceLedger(args.ledger)
+
+    if args.command == 'summary':
+        result = ledger.summary(parse_day(args.start), parse_day(args.end), args.product, args.by)
+        if result.empty:
+            print("Рядків за вказаний період не знайдено")
+            sys.exit(0)
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(result.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    elif args.command == 'compact':
+        stats = ledger.compact()
+        print(f"Ущільнено розділів: {stats['partitions']}, файлів: {stats['files']}")
+    elif args.command == 'backfill':
+        print(f"Додано накладних: {ledger.backfill(args.training_dir)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Навантажувальний тест бота без Telegram
+Піднімає локальну імітацію Telegram Bot API (getUpdates, getFile, завантаження файлів,
+sendMessage, editMessageText, sendDocument), запускає NakladniBot проти неї та
+імітує N користувачів, які одночасно надсилають пари фото накладних
+
+Використання:
+    python load_test.py --users 5 --invoices 2 [--fixtures training_data] [--timeout 300]
+"""
+
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Файли, які потрібні боту в робочій папці тесту
+RESOURCES = [
+    'blank_patterns.json',
+    'ocr_tuning.json',
+    'quality_thresholds.json',
+    'supplier_templates',
+    'templates',
+    'бланк для випічки з новинками.xlsx',
+]
+
+class FakeBotAPI:
+    """Імітація Telegram Bot API в пам'яті"""
+
+    def __init__(self, token: str):
+        """Ініціалізація стану імітації"""
+        self.token = token
+        self.updates: List[Dict] = []
+        self.update_id = itertools.count(1)
+        self.message_id = itertools.count(1)
+        self.files: Dict[str, str] = {}
+        self.condition = threading.Condition()
+
+        # Усі відповіді бота: chat_id -> [(час, метод, текст)]
+        self.outbox: Dict[int, List[Tuple[float, str, str]]] = {}
+        self.request_counts: Dict[str, int] = {}
+        self.photos_pushed = 0
+
+    def add_file(self, file_id: str, path: str):
+        """Реєстрація файлу, який бот зможе завантажити"""
+        self.files[file_id] = path
+
+    def push_photo(self, user_id: int, file_id: str):
+        """Додавання оновлення з фото від користувача"""
+        update = {
+            'update_id': next(self.update_id),
+            'message': {
+                'message_id': next(self.message_id),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"Driver {user_id}"},
+                'photo': [{
+                    'file_id': file_id,
+                    'file_unique_id': file_id,
+                    'width': 1280,
+                    'height': 960,
+                    'file_size': os.path.getsize(self.files[file_id])
+                }]
+            }
+        }
+        with self.condition:
+            self.updates.append(update)
+            self.photos_pushed += 1
+            self.condition.notify_all()
+
+    def get_updates(self, params: Dict) -> List[Dict]:
+        """Довге опитування: чекаємо оновлень до timeout секунд"""
+        offset = int(params.get('offset', 0) or 0)
+        timeout = min(float(params.get('timeout', 0) or 0), 1.0)
+        deadline = time.time() + timeout
+        with self.condition:
+            # Все до offset вже підтверджено ботом
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+            return list(self.updates)
+
+    def record(self, method: str, params: Dict) -> Dict:
+        """Запам'ятовування відповіді бота користувачу"""
+        chat_id = int(params.get('chat_id', 0))
+        text = params.get('text') or params.get('caption') or params.get('filename', '')
+        with self.condition:
+            self.outbox.setdefault(chat_id, []).append((time.time(), method, text))
+            self.condition.notify_all()
+        return {
+            'message_id': int(params.get('message_id') or next(self.message_id)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', '')
+        }
+
+    def handle(self, method: str, params: Dict):
+        """Виконання методу Bot API"""
+        self.request_counts[method] = self.request_counts.get(method, 0) + 1
+
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Load Test Bot', 'username': 'load_test_bot',
+                    'can_join_groups': False, 'can_read_all_group_messages': False,
+                    'supports_inline_queries': False}
+        if method == 'getUpdates':
+            return self.get_updates(params)
+        if method == 'getFile':
+            file_id = params['file_id']
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': os.path.getsize(self.files[file_id]), 'file_path': f"photos/{file_id}.jpg"}
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            return self.record(method, params)
+        # deleteWebhook, setWebhook та інші службові методи
+        return True
+
+    def wait_for_reply(self, user_id: int, since: float, predicate, timeout: float) -> Optional[Tuple[float, str, str]]:
+        """Очікування відповіді бота, яка задовольняє умову"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                for reply in self.outbox.get(user_id, []):
+                    if reply[0] >= since and predicate(reply):
+                        return reply
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+def make_handler(api: FakeBotAPI):
+    """HTTP обробник для імітації Bot API"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def parse_params(self) -> Dict:
+            """Параметри з query, form-urlencoded, multipart або JSON тіла"""
+            params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            length = int(self.headers.get('Content-Length', 0) or 0)
+            if not length:
+                return params
+
+            body = self.rfile.read(length)
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('application/json'):
+                params.update(json.loads(body))
+            elif content_type.startswith('multipart/form-data'):
+                message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+                for part in message.get_payload():
+                    name = part.get_param('name', header='content-disposition')
+                    filename = part.get_param('filename', header='content-disposition')
+                    if filename:
+                        params['filename'] = filename
+                    elif name:
+                        params[name] = part.get_payload(decode=True).decode('utf-8')
+            else:
+                params.update({key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+            return params
+
+        def send_json(self, status: int, payload: Dict):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = unquote(urlparse(self.path).path)
+            file_prefix = f"/file/bot{api.token}/photos/"
+            if path.startswith(file_prefix):
+                file_id = os.path.splitext(path[len(file_prefix):])[0]
+                if file_id not in api.files:
+                    self.send_json(404, {'ok': False, 'description': 'file not found'})
+                    return
+                with open(api.files[file_id], 'rb') as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self.do_POST()
+
+        def do_POST(self):
+            path = unquote(urlparse(self.path).path)
+            prefix = f"/bot{api.token}/"
+            if not path.startswith(prefix):
+                self.send_json(404, {'ok': False, 'description': 'not found'})
+                return
+            try:
+                result = api.handle(path[len(prefix):], self.parse_params())
+                self.send_json(200, {'ok': True, 'result': result})
+            except Exception as e:
+                logger.error(f"Помилка імітації Bot API: {e}")
+                self.send_json(400, {'ok': False, 'error_code': 400, 'description': str(e)})
+
+    return Handler
+
+def load_fixture_pairs(path: str) -> List[Tuple[str, str]]:
+    """Пари фото: training_data/invoice_*/photo1+photo2 або відсортовані фото з папки попарно"""
+    pairs = []
+    for invoice_dir in sorted(glob.glob(os.path.join(path, "invoice_*"))):
+        photo1 = os.path.join(invoice_dir, "photo1.jpg")
+        photo2 = os.path.join(invoice_dir, "photo2.jpg")
+        if os.path.exists(photo1) and os.path.exists(photo2):
+            pairs.append((os.path.abspath(photo1), os.path.abspath(photo2)))
+
+    if not pairs:
+        images = sorted(
+            os.path.abspath(os.path.join(path, name)) for name in os.listdir(path)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+        )
+        pairs = list(zip(images[0::2], images[1::2]))
+
+    return pairs
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль (найближчий ранг)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+async def simulate_user(api: FakeBotAPI, user_id: int, pairs: List[Tuple[str, str]],
+                        invoices: int, timeout: float, results: List[Dict]):
+    """Один користувач надсилає кілька накладних (пари фото) поспіль"""
+    for n in range(invoices):
+        photo1, photo2 = pairs[(user_id + n) % len(pairs)]
+        file1, file2 = f"u{user_id}_{n}_1", f"u{user_id}_{n}_2"
+        api.add_file(file1, photo1)
+        api.add_file(file2, photo2)
+
+        started = time.time()
+        api.push_photo(user_id, file1)
+        ack = await asyncio.to_thread(
+            api.wait_for_reply, user_id, started,
+            lambda reply: reply[1] == 'sendMessage' and reply[2].startswith(("✅ Фото 1", "❌", "🔁")), timeout
+        )
+        if ack is None or "Фото 1" not in ack[2]:
+            results.append({'user_id': user_id, 'status': 'error' if ack else 'timeout', 'latency': None})
+            continue
+
+        sent_at = time.time()
+        api.push_photo(user_id, file2)
+
+        def finished(reply):
+            return reply[1] == 'sendMessage' and reply[2].startswith(("✅ Накладна", "❌", "🔁", "⏳ Зараз забагато"))
+
+        reply = await asyncio.to_thread(api.wait_for_reply, user_id, sent_at, finished, timeout)
+        if reply is None:
+            status = 'timeout'
+        elif reply[2].startswith("✅"):
+            status = 'ok'
+        elif reply[2].startswith("⏳"):
+            status = 'rejected'
+        else:
+            status = 'error'
+
+        first_update = api.wait_for_reply(user_id, sent_at, lambda r: r[1] == 'editMessageText', 0)
+        results.append({
+            'user_id': user_id,
+            'status': status,
+            'latency': reply[0] - sent_at if reply else None,
+            'first_progress': first_update[0] - sent_at if first_update else None
+        })
+
+def prepare_workdir(workdir: str):
+    """Робоча папка тесту з потрібними ресурсами, щоб не засмічувати training_data"""
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in RESOURCES:
+        source = os.path.join(source_dir, name)
+        target = os.path.join(workdir, name)
+        if os.path.exists(source) and not os.path.exists(target):
+            os.symlink(source, target)
+    os.chdir(workdir)
+
+async def run_load_test(args) -> Dict:
+    """Запуск імітації API, бота та користувачів"""
+    from bot import NakladniBot, build_application
+    from config import TELEGRAM_TOKEN
+
+    pairs = load_fixture_pairs(args.fixtures)
+    if not pairs:
+        raise SystemExit(f"❌ У {args.fixtures} не знайдено пар фото")
+
+    api = FakeBotAPI(TELEGRAM_TOKEN)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(api))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    prepare_workdir(args.workdir)
+    bot = NakladniBot()
+    photos_before = set(os.listdir(bot.photos_dir))
+    application = build_application(bot, base_url=f"{base}/bot", base_file_url=f"{base}/file/bot")
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    results: List[Dict] = []
+    started = time.time()
+    try:
+        await asyncio.gather(*(
+            simulate_user(api, 1000 + i, pairs, args.invoices, args.timeout, results)
+            for i in range(args.users)
+        ))
+    finally:
+        wall_time = time.time() - started
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        bot.ocr_pool.shutdown()
+        server.shutdown()
+
+    # Кожна надіслана сторінка має лягти в окремий файл - інакше фото 2 перезаписало фото 1
+    saved_pages = len(set(os.listdir(bot.photos_dir)) - photos_before)
+
+    latencies = [r['latency'] for r in results if r['status'] == 'ok']
+    progress = [r['first_progress'] for r in results if r.get('first_progress') is not None]
+    counts = {status: sum(r['status'] == status for r in results) for status in ('ok', 'error', 'rejected', 'timeout')}
+    return {
+        'users': args.users,
+        'invoices': len(results),
+        'wall_time': wall_time,
+        'throughput_per_min': counts['ok'] / wall_time * 60 if wall_time else 0.0,
+        'error_rate': (len(results) - counts['ok']) / len(results) if results else 0.0,
+        'counts': counts,
+        'latency': {f"p{q}": percentile(latencies, q) for q in (50, 90, 95, 99)},
+        'latency_max': max(latencies) if latencies else 0.0,
+        'first_progress_p50': percentile(progress, 50),
+        'overwritten_pages': max(api.photos_pushed - saved_pages, 0),
+        'api_requests': dict(api.request_counts)
+    }
+
+def main():
+    """Навантажувальний тест з командного рядка"""
+    parser = argparse.ArgumentParser(description="Навантажувальний тест бота з локальним Bot API")
+    parser.add_argument('--users', type=int, default=5, help="Кількість одночасних користувачів")
+    parser.add_argument('--invoices', type=int, default=1, help="Накладних на користувача")
+    parser.add_argument('--fixtures', default="training_data", help="Папка з фото накладних")
+    parser.add_argument('--timeout', type=float, default=300, help="Максимальне очікування відповіді, с")
+    parser.add_argument('--workdir', default=None, help="Робоча папка бота (за замовчуванням тимчасова)")
+    parser.add_argument('--json', default=None, help="Зберегти звіт у JSON файл")
+    args = parser.parse_args()
+
+    # Усі користувачі надсилають ті самі фото - без цього повтори оброблялись би без OCR
+    os.environ.setdefault("DUPLICATE_DETECTION", "0")
+
+    logging.basicConfig(level=logging.WARNING)
+    args.fixtures = os.path.abspath(args.fixtures)
+    report_path = os.path.abspath(args.json) if args.json else None
+    temp_dir = None
+    if args.workdir is None:
+        temp_dir = tempfile.mkdtemp(prefix="nakladni_load_")
+        args.workdir = temp_dir
+
+    try:
+        report = asyncio.run(run_load_test(args))
+    finally:
+        if temp_dir:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print("📈 НАВАНТАЖУВАЛЬНИЙ ТЕСТ")
+    print("=" * 50)
+    print(f"Користувачів: {report['users']}, накладних: {report['invoices']}")
+    print(f"Час тесту: {report['wall_time']:.1f} с")
+    print(f"Пропускна здатність: {report['throughput_per_min']:.2f} накладних/хв")
+    print(f"Успішно: {report['counts']['ok']}, помилок: {report['counts']['error']}, "
+          f"відхилено: {report['counts']['rejected']}, таймаутів: {report['counts']['timeout']}")
+    print(f"Частка помилок: {report['error_rate'] * 100:.1f}%")
+    print("Затримка від другого фото до результату:")
+    for name, value in report['latency'].items():
+        print(f"  {name}: {value:.2f} с")
+    print(f"  max: {report['latency_max']:.2f} с")
+    print(f"Перше оновлення статусу (p50): {report['first_progress_p50']:.2f} с")
+    if report['overwritten_pages']:
+        print(f"⚠️ Перезаписано сторінок: {report['overwritten_pages']} - "
+              f"дві сторінки отримали одне ім'я файлу, результати недостовірні")
+
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Звіт збережено в {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,90 @@
 import easyocr
+import cv2
+import numpy as np
 import re
+import time
+from bisect import bisect_right
 from typing import List, Dict, Tuple, Optional
 import logging
 import json
 
+from config import (
+    REOCR_ENABLED, REOCR_CONFIDENCE_THRESHOLD, REOCR_MIN_CONFIDENCE,
+    REOCR_SCALE, REOCR_TIME_BUDGET, TEMPLATE_REGISTRATION, SUPPLIER_TEMPLATES_DIR,
+    OCR_BATCH_SIZE, ORIENTATION_DETECTION
+)
+from correction_table import CorrectionTable
+from orientation import OrientationCorrector
+from records import OCRBox, ProductLine
+from row_reconstruction import box_geometry, group_into_rows
+from template_registration import TemplateRegistrar
+from template_registry import TemplateRegistry
+from text_normalizer import extract_weight, fold_homoglyphs, key_tokens, normalize_key
+
 logger = logging.getLogger(__name__)
 
+# Колонки однієї групи в рядку бланка: № | Назва | Кількість | Код
+# (на бланку три такі групи поруч в одному рядку)
+BLANK_ROW_COLUMNS = ('number', 'name', 'quantity', 'code')
+
+# Які числові значення може містити кожна колонка
+COLUMN_PATTERNS = {
+    'number': re.compile(r'^\d{1,3}$'),
+    'quantity': re.compile(r'^\d{1,3}(?:[.,]\d+)?$'),
+    'code': re.compile(r'^\d{4,6}$'),
+    'price': re.compile(r'^\d+(?:[.,]\d+)?$'),
+}
+
+NUMBER_TOKEN = re.compile(r'^\d+(?:[.,]\d+)?$')
+
+# Патерни для назв пекарень (текст вже нормалізовано до верхнього регістру)
+BAKERY_PATTERNS = [
+    re.compile(r'ПЕКАРНЯ\s+["\']?([^"\']+)["\']?'),
+    re.compile(r'ТОВ\s+["\']?([^"\']+)["\']?'),
+    re.compile(r'ПП\s+["\']?([^"\']+)["\']?'),
+    re.compile(r'ФОП\s+["\']?([^"\']+)["\']?'),
+    re.compile(r'["\']?([А-ЯІЇЄ\s]+(?:ПЕКАРНЯ|ХЛІБ|БУЛОЧНА|КОНДИТЕРСЬКА))["\']?'),
+    re.compile(r'["\']?([А-ЯІЇЄ\s]{3,}(?:ПРОДАКШН|ПРОДАКШЕН|ПРОДАКШИН))["\']?'),
+    re.compile(r'["\']?([А-ЯІЇЄ\s]{3,}(?:КОМПАНІЯ|КОМПАНИЯ))["\']?'),
+    re.compile(r'["\']?([А-ЯІЇЄ\s]{3,}(?:ТОРГОВА|ТОРГОВО))["\']?'),
+]
+
+# Кожен патерн пекарні містить одне з цих слів - рядки без них не перевіряємо
+BAKERY_KEYWORDS = re.compile(r'ПЕКАРНЯ|ТОВ|ПП|ФОП|ХЛІБ|БУЛОЧНА|КОНДИТЕРСЬКА|ПРОДАКШ|КОМПАНИ|КОМПАНІ|ТОРГОВ')
+
+# Слова, які не можуть бути назвою продукту
+STOP_WORDS = frozenset([
+    'НАКЛАДНА', 'ДАТА', 'ПЕКАРНЯ', 'ТОВ', 'ПП', 'ФОП', 'РАЗОМ', 'ВСЬОГО',
+    'ПРОДАВЕЦЬ', 'ПОКУПЕЦЬ', 'СУМА', 'КІЛЬКІСТЬ', 'ЦІНА', 'ЦЕНА',
+    'ПІДПИС', 'ПОДПИС', 'ШТАМП', 'ПЕЧАТЬ', 'НОМЕР', '№', 'N',
+    'ТЕЛЕФОН', 'АДРЕСА', 'АДРЕС', 'ІНН', 'ИНН', 'ЄДРПОУ', 'ЕДРПОУ',
+    'НАЗВА', 'КОД'
+])
+
 class OCRProcessor:
-    def __init__(self):
+    def __init__(self, batch_size: int = OCR_BATCH_SIZE):
         """Ініціалізація OCR з підтримкою української та російської мов"""
         self.reader = easyocr.Reader(['uk', 'ru', 'en'], gpu=False)
+        self.batch_size = batch_size
         logger.info("OCR процесор ініціалізовано")
         
+        # Оцінка часу повторного розпізнавання одного блоку (уточнюється після кожного проходу)
+        self.reocr_seconds_per_box = 0.05
+        
         # Завантажуємо патерни з бланка
         self.load_blank_patterns()
+        
+        # Бланки постачальників: колонки, каталог і параметри парсингу
+        self.templates = TemplateRegistry(SUPPLIER_TEMPLATES_DIR)
+        
+        # Еталони бланка для розпізнавання без детекції тексту
+        self.registrar = TemplateRegistrar(self.reader) if TEMPLATE_REGISTRATION else None
+        
+        # Визначення орієнтації фото перед повним OCR
+        self.orientation = OrientationCorrector(self.reader) if ORIENTATION_DETECTION else None
+        
+        # Виправлення з ручних анотацій (перезавантажуються при зміні файлу)
+        self.corrections = CorrectionTable()
     
     def load_blank_patterns(self):
         """Завантаження патернів з бланка"""
@@ -25,16 +96,86 @@ class OCRProcessor:
             self.blank_patterns = {}
             logger.warning("Не вдалося завантажити патерни з бланка")
     
-    def extract_text(self, image_path: str) -> List[Tuple]:
-        """Розпізнавання тексту з зображення"""
+    def extract_text(self, image_path) -> List[Tuple]:
+        """Розпізнавання тексту з зображення (шлях до файлу або масив пікселів)"""
+        source = image_path if isinstance(image_path, str) else f"плитки {image_path.shape[1]}x{image_path.shape[0]}"
         try:
-            results = self.reader.readtext(image_path)
-            logger.info(f"Розпізнано {len(results)} текстових блоків з {image_path}")
+            results = self.reader.readtext(image_path, batch_size=self.batch_size)
+            logger.info(f"Розпізнано {len(results)} текстових блоків з {source}")
             return results
         except Exception as e:
-            logger.error(f"Помилка OCR для {image_path}: {e}")
+            logger.error(f"Помилка OCR для {source}: {e}")
             return []
     
+    def refine_low_confidence(self, image_path: str, ocr_results: List[Tuple]) -> List[Tuple]:
+        """Повторне розпізнавання лише слабких блоків: вирізаємо, збільшуємо, підсилюємо різкість"""
+        weak = [i for i, (_, _, confidence) in enumerate(ocr_results)
+                if REOCR_MIN_CONFIDENCE <= confidence < REOCR_CONFIDENCE_THRESHOLD]
+        if not weak:
+            return ocr_results
+        
+        # Скільки блоків встигнемо в межах бюджету часу
+        max_boxes = int(REOCR_TIME_BUDGET / self.reocr_seconds_per_box)
+        if max_boxes <= 0:
+            return ocr_results
+        # Спершу блоки, які майже пройшли поріг - у них найбільше шансів
+        weak = sorted(weak, key=lambda i: ocr_results[i][2], reverse=True)[:max_boxes]
+        
+        try:
+            start = time.time()
+            image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                return ocr_results
+            
+            # Складаємо збільшені фрагменти один під одним в одне зображення
+            crops = []
+            geometry = box_geometry([ocr_results[i] for i in weak])
+            for x_min, y_min, x_max, y_max in geometry.astype(int):
+                pad = 4
+                crop = image[max(y_min - pad, 0):y_max + pad, max(x_min - pad, 0):x_max + pad]
+                if crop.size == 0:
+                    crops.append(np.full((1, 1), 255, dtype=np.uint8))
+                    continue
+                crop = cv2.resize(crop, None, fx=REOCR_SCALE, fy=REOCR_SCALE, interpolation=cv2.INTER_CUBIC)
+                blurred = cv2.GaussianBlur(crop, (0, 0), 3)
+                crops.append(cv2.addWeighted(crop, 1.5, blurred, -0.5, 0))
+            
+            gap = 10
+            canvas = np.full((sum(c.shape[0] + gap for c in crops), max(c.shape[1] for c in crops)), 255, dtype=np.uint8)
+            offsets, horizontal_list = [], []
+            y = 0
+            for crop in crops:
+                height, width = crop.shape
+                canvas[y:y + height, :width] = crop
+                offsets.append(y)
+                horizontal_list.append([0, width, y, y + height])
+                y += height + gap
+            
+            # Одне пакетне розпізнавання без детекції тексту
+            recognized = self.reader.recognize(canvas, horizontal_list=horizontal_list, free_list=[],
+                                               batch_size=len(crops))
+            
+            refined = list(ocr_results)
+            recovered = 0
+            for bbox, text, confidence in recognized:
+                slot = bisect_right(offsets, min(point[1] for point in bbox)) - 1
+                if slot < 0:
+                    continue
+                index = weak[slot]
+                if text.strip() and confidence > refined[index][2]:
+                    refined[index] = (refined[index][0], text, confidence)
+                    if confidence >= REOCR_CONFIDENCE_THRESHOLD:
+                        recovered += 1
+            
+            elapsed = time.time() - start
+            self.reocr_seconds_per_box = 0.7 * self.reocr_seconds_per_box + 0.3 * (elapsed / len(weak))
+            logger.info(f"Повторно розпізнано {len(weak)} слабких блоків за {elapsed:.2f} с, відновлено {recovered}")
+            return refined
+            
+        except Exception as e:
+            logger.error(f"Помилка повторного розпізнавання для {image_path}: {e}")
+            return ocr_results
+    
     def extract_bakery_name(self, ocr_results: List[Tuple]) -> Optional[str]:
         """Витяг назви пекарні з OCR результатів"""
         if not ocr_results:
@@ -42,22 +183,12 @@ class OCRProcessor:
         
         # Шукаємо назву пекарні в перших рядках
         for i, (bbox, text, confidence) in enumerate(ocr_results[:15]):
-            text = text.strip().upper()
-            
-            # Патерни для назв пекарень
-            bakery_patterns = [
-                r'ПЕКАРНЯ\s+["\']?([^"\']+)["\']?',
-                r'ТОВ\s+["\']?([^"\']+)["\']?',
-                r'ПП\s+["\']?([^"\']+)["\']?',
-                r'ФОП\s+["\']?([^"\']+)["\']?',
-                r'["\']?([А-ЯІЇЄ\s]+(?:ПЕКАРНЯ|ХЛІБ|БУЛОЧНА|КОНДИТЕРСЬКА))["\']?',
-                r'["\']?([А-ЯІЇЄ\s]{3,}(?:ПРОДАКШН|ПРОДАКШЕН|ПРОДАКШИН))["\']?',
-                r'["\']?([А-ЯІЇЄ\s]{3,}(?:КОМПАНІЯ|КОМПАНИЯ))["\']?',
-                r'["\']?([А-ЯІЇЄ\s]{3,}(?:ТОРГОВА|ТОРГОВО))["\']?',
-            ]
+            text = normalize_key(text)
+            if not BAKERY_KEYWORDS.search(text):
+                continue
             
-            for pattern in bakery_patterns:
-                match = re.search(pattern, text)
+            for pattern in BAKERY_PATTERNS:
+                match = pattern.search(text)
                 if match:
                     bakery_name = match.group(1) if len(match.groups()) > 0 else match.group(0)
                     bakery_name = re.sub(r'["\']', '', bakery_name).strip()
@@ -67,7 +198,7 @@ class OCRProcessor:
         
         # Якщо не знайдено за патернами, шукаємо рядки з високою впевненістю
         for bbox, text, confidence in ocr_results[:10]:
-            text = text.strip()
+            text = fold_homoglyphs(text.strip())
             if confidence > 0.7 and len(text) > 5 and len(text) < 50:
                 # Перевіряємо, чи не містить цифри або спецсимволи
                 if not re.search(r'\d', text) and not re.search(r'[^\w\s]', text):
@@ -76,25 +207,117 @@ class OCRProcessor:
         
         return None
     
-    def extract_products_data(self, ocr_results: List[Tuple]) -> List[Dict]:
-        """Витяг даних про продукти з OCR результатів"""
+    def extract_products_data(self, ocr_results: List[Tuple], template: Optional[Dict] = None) -> List[ProductLine]:
+        """Витяг даних про продукти з OCR результатів за профілем бланка"""
         products = []
+        min_confidence = template['min_confidence'] if template else 0.4
+        row_tolerance = template['row_tolerance'] if template else 0.5
+        columns = tuple(template['columns']) if template else BLANK_ROW_COLUMNS
+        
+        # Пропускаємо блоки з низькою впевненістю
+        confident_results = [result for result in ocr_results if result[2] >= min_confidence]
+        
+        # Збираємо блоки в рядки таблиці і парсимо кожен рядок один раз
+        for row in group_into_rows(confident_results, row_tolerance):
+            cells = [fold_homoglyphs(text.strip()) for _, text, _ in row if text.strip()]
+            if cells:
+                products.extend(self.parse_table_row(cells, columns))
+        
+        # Відомий код - беремо точну назву з каталогу бланка
+        for i, product in enumerate(products):
+            catalog_name = self.templates.catalog_name(template, product.code)
+            if catalog_name:
+                products[i] = self.build_product(catalog_name, product.quantity, product.price, product.code)
         
-        for bbox, text, confidence in ocr_results:
-            text = text.strip()
+        return products
+    
+    def tokenize_row(self, cells: List[str]) -> List[Tuple[str, str]]:
+        """Розбиття клітинок рядка на числа та текст: [('number', '5'), ('text', 'Багет ВП 230г'), ...]"""
+        tokens = []
+        for cell in cells:
+            words = cell.replace('|', ' ').split()
+            
+            # Числа на краях клітинки - окремі колонки, все між ними - назва
+            start, end = 0, len(words)
+            while start < end and NUMBER_TOKEN.match(words[start]):
+                start += 1
+            while end > start and NUMBER_TOKEN.match(words[end - 1]):
+                end -= 1
             
-            # Пропускаємо рядки з низькою впевненістю
-            if confidence < 0.4:
+            tokens.extend(('number', word) for word in words[:start])
+            if start < end:
+                tokens.append(('text', ' '.join(words[start:end])))
+            tokens.extend(('number', word) for word in words[end:])
+        
+        return tokens
+    
+    def parse_table_row(self, cells: List[str], columns: Tuple[str, ...] = BLANK_ROW_COLUMNS) -> List[ProductLine]:
+        """Парсинг рядка таблиці (клітинки зліва направо) в продукти за порядком колонок бланка"""
+        groups = []
+        current: Dict[str, str] = {}
+        position = 0
+        
+        for kind, value in self.tokenize_row(cells):
+            while True:
+                # Шукаємо наступну колонку групи, яка може прийняти це значення
+                slot = None
+                for index in range(position, len(columns)):
+                    column = columns[index]
+                    if kind == 'text' and column == 'name':
+                        slot = index
+                    elif kind == 'number' and column != 'name' and COLUMN_PATTERNS[column].match(value):
+                        slot = index
+                    if slot is not None:
+                        break
+                
+                if slot is not None:
+                    column = columns[slot]
+                    if column == 'name' and column in current:
+                        current[column] += ' ' + value
+                    else:
+                        current[column] = value
+                    # Назва може продовжуватись у сусідній клітинці
+                    position = slot if column == 'name' else slot + 1
+                    break
+                
+                if not current:
+                    # Значення не підходить жодній колонці
+                    break
+                
+                # Група закінчилась - наступна група бланка в тому ж рядку
+                groups.append(current)
+                current = {}
+                position = 0
+            
+        if current:
+            groups.append(current)
+        
+        # Рядок без кодів - не рядок бланка, парсимо його як звичайний текст
+        if not any('code' in group for group in groups):
+            product_data = self.parse_product_line(' '.join(cells))
+            return [product_data] if product_data else []
+        
+        products = []
+        for group in groups:
+            # Рядки бланка без кількості - продукт не поставлявся
+            if 'name' not in group or 'quantity' not in group:
                 continue
             
-            # Шукаємо рядки з продуктами (кількість, назва, ціна)
-            product_data = self.parse_product_line(text)
-            if product_data:
-                products.append(product_data)
+            product_name = group['name'].strip()
+            quantity = float(group['quantity'].replace(',', '.'))
+            price = float(group['price'].replace(',', '.')) if 'price' in group else 0.0
+            
+            if self.is_valid_product(product_name, quantity):
+                products.append(self.build_product(product_name, quantity, price, group.get('code')))
         
         return products
     
-    def parse_product_line(self, text: str) -> Optional[Dict]:
+    def build_product(self, name: str, quantity: float, price: float, code: Optional[str]) -> ProductLine:
+        """Рядок продукту з вагою, виділеною з назви"""
+        weight, weight_unit = extract_weight(name) or (None, None)
+        return ProductLine(name, quantity, price, code, weight, weight_unit)
+    
+    def parse_product_line(self, text: str) -> Optional[ProductLine]:
         """Парсинг рядка з продуктом з урахуванням формату бланка"""
         # Формат бланка: номер | назва продукту | код | ціна
         # Приклад: "1 | Багет ВП 230г з Ковб та Сир | 43056 | 36"
@@ -166,13 +389,10 @@ class OCRProcessor:
                 
                 # Валідація даних
                 if self.is_valid_product(product_name, quantity):
-                    return {
-                        'name': product_name,
-                        'quantity': quantity,
-                        'price': price,
-                        'total': quantity * price if price > 0 else 0,
-                        'code': product_code if 'product_code' in locals() else None
-                    }
+                    return self.build_product(
+                        product_name, quantity, price,
+                        product_code if 'product_code' in locals() else None
+                    )
         
         return None
     
@@ -186,15 +406,8 @@ class OCRProcessor:
         if quantity <= 0 or quantity > 10000:
             return False
         
-        # Перевіряємо на стоп-слова
-        stop_words = [
-            'НАКЛАДНА', 'ДАТА', 'ПЕКАРНЯ', 'ТОВ', 'ПП', 'ФОП', 'РАЗОМ', 'ВСЬОГО',
-            'ПРОДАВЕЦЬ', 'ПОКУПЕЦЬ', 'СУМА', 'КІЛЬКІСТЬ', 'ЦІНА', 'ЦЕНА',
-            'ПІДПИС', 'ПОДПИС', 'ШТАМП', 'ПЕЧАТЬ', 'НОМЕР', '№', 'N',
-            'ТЕЛЕФОН', 'АДРЕСА', 'АДРЕС', 'ІНН', 'ИНН', 'ЄДРПОУ', 'ЕДРПОУ',
-            'КІЛЬКІСТЬ', 'НАЗВА', 'КОД', 'ЦІНА', 'СУМА'
-        ]
-        if any(word in name.upper() for word in stop_words):
+        # Перевіряємо на стоп-слова (одне перетинання множин замість пошуку кожного слова)
+        if not STOP_WORDS.isdisjoint(key_tokens(name)):
             return False
         
         # Перевіряємо на дати та номери
@@ -210,26 +423,63 @@ class OCRProcessor:
         
         return True
     
-    def calculate_total_quantity(self, products: List[Dict]) -> float:
+    def apply_corrections(self, products: List[ProductLine]) -> List[ProductLine]:
+        """Виправлення повторюваних помилок OCR за таблицею з ручних анотацій"""
+        corrected = []
+        for product in products:
+            name = self.corrections.correct_name(product.name) or product.name
+            quantity = self.corrections.correct_quantity(name, product.quantity)
+            if name != product.name or quantity is not None:
+                product = self.build_product(name, quantity or product.quantity, product.price, product.code)
+            corrected.append(product)
+        return corrected
+    
+    def calculate_total_quantity(self, products: List[ProductLine]) -> float:
         """Підрахунок загальної кількості"""
-        return sum(product['quantity'] for product in products)
+        return sum(product.quantity for product in products)
     
-    def calculate_total_amount(self, products: List[Dict]) -> float:
+    def calculate_total_amount(self, products: List[ProductLine]) -> float:
         """Підрахунок загальної суми"""
-        return sum(product['total'] for product in products)
+        return sum(product.total for product in products)
     
-    def process_invoice(self, image_path: str) -> Dict:
-        """Повна обробка накладної"""
+    def process_invoice(self, image_path: str, ocr_results: Optional[List[Tuple]] = None) -> Dict:
+        """Повна обробка накладної (ocr_results - вже розпізнані блоки, наприклад, з плиток)"""
         logger.info(f"Початок обробки накладної: {image_path}")
+        self.corrections.reload_if_changed()
+        
+        # Якщо фото вирівнюється за еталоном бланка - читаємо лише клітинки кількості
+        if ocr_results is None and self.registrar and self.registrar.is_ready():
+            registered = self.registrar.process_invoice(image_path)
+            if registered and registered['products']:
+                products = self.apply_corrections(registered['products'])
+                return {
+                    'bakery_name': self.corrections.correct_bakery(registered['bakery_name']),
+                    'products': products,
+                    'total_quantity': self.calculate_total_quantity(products),
+                    'total_amount': self.calculate_total_amount(products),
+                    'raw_text': registered['raw_text'],
+                    'ocr_boxes': [],
+                    'image_path': image_path
+                }
+        
+        # Розпізнаємо текст (повернуте фото спершу вирівнюємо - один поворот замість rotation_info)
+        if ocr_results is None:
+            if self.orientation:
+                self.orientation.correct(image_path)
+            ocr_results = self.extract_text(image_path)
+        
+        # Другий прохід лише для слабких блоків
+        if REOCR_ENABLED:
+            ocr_results = self.refine_low_confidence(image_path, ocr_results)
         
-        # Розпізнаємо текст
-        ocr_results = self.extract_text(image_path)
+        # Визначаємо бланк постачальника за першими блоками
+        template = self.templates.fingerprint(ocr_results)
         
         # Витягаємо назву пекарні
-        bakery_name = self.extract_bakery_name(ocr_results)
+        bakery_name = self.corrections.correct_bakery(self.extract_bakery_name(ocr_results))
         
         # Витягаємо дані про продукти
-        products = self.extract_products_data(ocr_results)
+        products = self.apply_corrections(self.extract_products_data(ocr_results, template))
         
         # Підраховуємо підсумки
         total_quantity = self.calculate_total_quantity(products)
@@ -241,7 +491,9 @@ class OCRProcessor:
             'total_quantity': total_quantity,
             'total_amount': total_amount,
             'raw_text': [text for _, text, _ in ocr_results],
-            'image_path': image_path
+            'ocr_boxes': [OCRBox.from_easyocr(result) for result in ocr_results],
+            'image_path': image_path,
+            'template': template['id'] if template else None
         }
         
         logger.info(f"Обробка завершена. Знайдено {len(products)} продуктів")
@@ -0,0 +1,298 @@
+import asyncio
+import cProfile
+import logging
+import multiprocessing
+import os
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from orientation import EXIF_ORIENTATION
+from tiling import merge_tile_results, plan_tiles, shift_results
+
+logger = logging.getLogger(__name__)
+
+# OCR процесор всередині процесу-обробника
+_processor = None
+
+# Декодоване фото, плитки якого розпізнає цей процес: ((шлях, mtime, розмір файлу), пікселі)
+_tile_image: Optional[Tuple[Tuple[str, int, int], np.ndarray]] = None
+
+# EXIF орієнтації, в яких кадр збережено боком (ширина й висота після повороту міняються)
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def current_rss_mb() -> float:
+    """Поточна резидентна пам'ять процесу в МБ"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except Exception:
+        # Не Linux - беремо пікове значення
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def downscale_image(image_path: str, max_pixels: int) -> bool:
+    """Зменшення фото, яке перевищує бюджет пікселів (файл перезаписується)"""
+    image = cv2.imread(image_path)
+    if image is None:
+        return False
+
+    height, width = image.shape[:2]
+    if width * height <= max_pixels:
+        return False
+
+    scale = (max_pixels / (width * height)) ** 0.5
+    resized = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    cv2.imwrite(image_path, resized)
+    logger.info(f"Фото {image_path} зменшено з {width}x{height} до {resized.shape[1]}x{resized.shape[0]}")
+    return True
+
+def init_worker(torch_threads: int = 0, batch_size: int = 1):
+    """Ініціалізація процесу-обробника: моделі OCR завантажуються тут, а не в процесі бота"""
+    global _processor
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if torch_threads > 0:
+        # Кілька процесів з потоками torch за замовчуванням (усі ядра) конкурують за процесор
+        import torch
+        torch.set_num_threads(torch_threads)
+    from ocr_processor import OCRProcessor
+    _processor = OCRProcessor(batch_size=batch_size)
+
+def image_size(image_path: str) -> Tuple[int, int]:
+    """
+    Розмір зображення без декодування пікселів, з урахуванням EXIF орієнтації -
+    такий, як у cv2.imread, яким фото потім читається для OCR
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION, 1) in TRANSPOSED_ORIENTATIONS:
+            return height, width
+        return width, height
+
+def load_tile_image(image_path: str) -> Optional[np.ndarray]:
+    """Фото для плиток: декодується один раз на процес, а не для кожної плитки"""
+    global _tile_image
+    stat = os.stat(image_path)
+    key = (image_path, stat.st_mtime_ns, stat.st_size)
+    if _tile_image is None or _tile_image[0] != key:
+        _tile_image = None
+        image = cv2.imread(image_path)
+        if image is None:
+            return None
+        _tile_image = (key, image)
+    return _tile_image[1]
+
+def run_invoice_job(image_path: str, max_pixels: int, profile_path: Optional[str] = None,
+                    ocr_results: Optional[List[Tuple]] = None):
+    """Обробка одного фото в процесі-обробнику; повертає результат, RSS та pid"""
+    global _tile_image
+    # Плитки цього фото вже розпізнані - декодоване фото більше не потрібне
+    _tile_image = None
+    profile = cProfile.Profile() if profile_path else None
+    if profile:
+        profile.enable()
+    try:
+        downscale_image(image_path, max_pixels)
+        result = _processor.process_invoice(image_path, ocr_results)
+    finally:
+        if profile:
+            profile.disable()
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            profile.dump_stats(profile_path)
+    return result, current_rss_mb(), os.getpid()
+
+def run_orientation_job(image_path: str):
+    """
+    Вирівнювання орієнтації фото на місці (перед розбиттям на плитки)
+    Повертає розмір вже вирівняного файлу: поворот за EXIF теж міняє ширину і висоту,
+    а кут, який повертає correct(), його не враховує
+    """
+    if _processor.orientation:
+        _processor.orientation.correct(image_path)
+    return image_size(image_path), current_rss_mb(), os.getpid()
+
+def run_tile_job(image_path: str, tile: Tuple[int, int, int, int]):
+    """Розпізнавання однієї плитки; координати блоків - у системі всього зображення"""
+    x, y, width, height = tile
+    image = load_tile_image(image_path)
+    results = _processor.extract_text(image[y:y + height, x:x + width]) if image is not None else []
+    return shift_results(results, x, y), current_rss_mb(), os.getpid()
+
+class OCRWorkerPool:
+    """Пул процесів OCR з перезапуском після N завдань або перевищення ліміту пам'яті"""
+
+    def __init__(self, workers: int = 1, max_jobs: int = 50, max_rss_mb: float = 1500, max_pixels: int = 4000000,
+                 torch_threads: int = 0, batch_size: int = 1,
+                 tile_min_pixels: int = 0, tile_size: int = 1600, tile_overlap: int = 200):
+        """
+        Ініціалізація пулу (процеси запускаються при першому завданні)
+        Зображення більші за tile_min_pixels розпізнаються плитками паралельно (0 - ніколи)
+        """
+        self.workers = workers
+        self.tile_min_pixels = tile_min_pixels
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.torch_threads = torch_threads
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.max_pixels = max_pixels
+
+        self.context = multiprocessing.get_context('spawn')
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.condition: Optional[asyncio.Condition] = None
+
+        self.in_flight = 0
+        self.jobs_done = 0
+        self.recycling = False
+        self.worker_rss: Dict[int, float] = {}
+        self.stats = {'jobs': 0, 'tiles': 0, 'recycles': 0, 'peak_rss_mb': 0.0}
+
+    def start_executor(self):
+        """Створення нового пулу процесів"""
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self.context,
+            initializer=init_worker,
+            initargs=(self.torch_threads, self.batch_size)
+        )
+
+    def get_condition(self) -> asyncio.Condition:
+        """Умова для координації з перезапуском (створюється в event loop бота)"""
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def process_invoice(self, image_path: str, profile_path: Optional[str] = None,
+                              max_pixels: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Обробка фото в процесі-обробнику (profile_path - зберегти cProfile профіль обробки)
+        max_pixels - бюджет пікселів для цього фото (документи мають більший, ніж стиснуті фото)
+        """
+        max_pixels = max_pixels or self.max_pixels
+        ocr_results = None
+        if self.tile_min_pixels > 0:
+            width, height = await asyncio.to_thread(image_size, image_path)
+            if width * height > max_pixels:
+                await asyncio.to_thread(downscale_image, image_path, max_pixels)
+                width, height = await asyncio.to_thread(image_size, image_path)
+            if width * height > self.tile_min_pixels:
+                # Плитки нарізаються з уже вирівняного фото за його справжнім розміром
+                width, height = await self.run_job(run_orientation_job, image_path)
+                ocr_results = await self.recognize_tiles(image_path, width, height)
+
+        return await self.run_job(run_invoice_job, image_path, max_pixels, profile_path, ocr_results)
+
+    async def recognize_tiles(self, image_path: str, width: int, height: int) -> List[Tuple]:
+        """Паралельне розпізнавання плиток великого зображення та об'єднання блоків на стиках"""
+        tiles = plan_tiles(width, height, self.tile_size, self.tile_overlap)
+        logger.info(f"Фото {image_path} ({width}x{height}) розпізнається плитками: {len(tiles)}")
+        tile_boxes = await asyncio.gather(*(self.run_job(run_tile_job, image_path, tile) for tile in tiles))
+        self.stats['tiles'] += len(tiles)
+        return merge_tile_results(list(zip(tiles, tile_boxes)), width, height)
+
+    async def run_job(self, function, *args):
+        """Виконання завдання в процесі-обробнику з обліком пам'яті та перезапуском"""
+        condition = self.get_condition()
+        async with condition:
+            # Під час перезапуску нові завдання чекають на свіжі процеси
+            await condition.wait_for(lambda: not self.recycling)
+            if self.executor is None:
+                self.start_executor()
+            self.in_flight += 1
+            executor = self.executor
+
+        try:
+            loop = asyncio.get_running_loop()
+            result, rss_mb, pid = await loop.run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            # Процес-обробник аварійно завершився (OOM killer, segfault) - зламаний пул більше
+            # не приймає завдань, тож наступне завдання має отримати свіжі процеси
+            self.discard_executor(executor)
+            raise
+        finally:
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+        self.jobs_done += 1
+        self.stats['jobs'] += 1
+        self.worker_rss[pid] = rss_mb
+        self.stats['peak_rss_mb'] = max(self.stats['peak_rss_mb'], rss_mb)
+        logger.info(f"OCR процес {pid}: RSS {rss_mb:.0f} МБ після {self.jobs_done} завдань")
+
+        if not self.recycling:
+            if rss_mb > self.max_rss_mb:
+                asyncio.create_task(self.recycle(f"RSS {rss_mb:.0f} МБ > {self.max_rss_mb:.0f} МБ"))
+            elif self.jobs_done >= self.max_jobs:
+                asyncio.create_task(self.recycle(f"виконано {self.jobs_done} завдань"))
+
+        return result
+
+    async def recycle(self, reason: str):
+        """Перезапуск процесів після завершення поточних завдань"""
+        condition = self.get_condition()
+        async with condition:
+            if self.recycling:
+                return
+            self.recycling = True
+            logger.info(f"Перезапуск OCR процесів: {reason}")
+            await condition.wait_for(lambda: self.in_flight == 0)
+
+        try:
+            if self.executor is not None:
+                await asyncio.to_thread(self.executor.shutdown, True)
+        except Exception as e:
+            logger.error(f"Помилка зупинки OCR процесів: {e}")
+        finally:
+            self.executor = None
+            self.worker_rss.clear()
+            self.jobs_done = 0
+            self.stats['recycles'] += 1
+            async with condition:
+                self.recycling = False
+                condition.notify_all()
+
+    def discard_executor(self, executor: ProcessPoolExecutor):
+        """Відкидання зламаного пулу процесів (рахується як перезапуск)"""
+        # Інше завдання з того ж пулу вже могло його замінити
+        if self.executor is not executor:
+            return
+        logger.error("OCR процес аварійно завершився - пул процесів буде створено заново")
+        self.executor = None
+        self.worker_rss.clear()
+        self.jobs_done = 0
+        self.stats['recycles'] += 1
+        try:
+            executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            logger.error(f"Помилка зупинки OCR процесів: {e}")
+
+    def shutdown(self):
+        """Зупинка процесів"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пулу для моніторингу"""
+        return {
+            'workers': self.workers,
+            'torch_threads': self.torch_threads,
+            'batch_size': self.batch_size,
+            'in_flight': self.in_flight,
+            'jobs_since_recycle': self.jobs_done,
+            'recycling': self.recycling,
+            'worker_rss_mb': dict(self.worker_rss),
+            'max_jobs': self.max_jobs,
+            'max_rss_mb': self.max_rss_mb,
+            **self.stats
+        }
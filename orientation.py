@@ -0,0 +1,160 @@
+"""
+Визначення орієнтації фото накладної до повного OCR
+Фото часто приходять повернутими на 90° або 180°. Замість розпізнавання кожного блоку
+в кількох поворотах (rotation_info) орієнтація визначається дешево і фото повертається
+один раз на місці:
+1. EXIF орієнтація телефону;
+2. проєкційні профілі рядків тексту на мініатюрі: рядки вздовж чи впоперек кадру (0/180 чи 90/270);
+3. один прохід детекції на мініатюрі та розпізнавання кількох блоків у двох поворотах
+   (0 чи 180) - перемагає поворот з вищою впевненістю.
+"""
+
+import logging
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import ORIENTATION_SAMPLE_BOXES, ORIENTATION_THUMB_SIDE
+
+logger = logging.getLogger(__name__)
+
+# EXIF тег орієнтації
+EXIF_ORIENTATION = 0x0112
+
+# У скільки разів профіль колонок має бути різкішим за профіль рядків, щоб вважати фото боковим
+SIDEWAYS_RATIO = 1.3
+
+# На скільки середня впевненість у повороті 180° має перевищувати початкову, щоб перевернути фото
+UPSIDE_DOWN_MARGIN = 0.1
+
+ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE
+}
+
+def apply_exif_orientation(image_path: str) -> bool:
+    """Поворот пікселів за EXIF тегом (файл перезаписується без тегу орієнтації)"""
+    try:
+        with Image.open(image_path) as image:
+            if image.getexif().get(EXIF_ORIENTATION, 1) in (0, 1):
+                return False
+            image_format = image.format
+            upright = ImageOps.exif_transpose(image)
+        upright.save(image_path, format=image_format, quality=95)
+        logger.info(f"Фото {image_path} повернуто за EXIF")
+        return True
+    except Exception as e:
+        logger.error(f"Помилка обробки EXIF орієнтації {image_path}: {e}")
+        return False
+
+def load_thumbnail(image_path: str, side: int = ORIENTATION_THUMB_SIDE) -> Optional[np.ndarray]:
+    """Сіра мініатюра з довшою стороною side"""
+    try:
+        with Image.open(image_path) as original:
+            longest = max(original.size)
+    except Exception:
+        return None
+    # Великі фото декодуються одразу зменшеними
+    reduction = cv2.IMREAD_REDUCED_GRAYSCALE_4 if longest >= side * 4 else (
+        cv2.IMREAD_REDUCED_GRAYSCALE_2 if longest >= side * 2 else cv2.IMREAD_GRAYSCALE)
+    image = cv2.imread(image_path, reduction | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+    scale = side / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+def text_mask(gray: np.ndarray) -> np.ndarray:
+    """Маска символів без довгих ліній таблиці (лінії бланка дають профіль в обох напрямках)"""
+    ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    height, width = ink.shape
+    # Обидві маски ліній - з початкового зображення, інакше перетини розрізають лінії на короткі шматки
+    lines = cv2.bitwise_or(
+        cv2.morphologyEx(ink, cv2.MORPH_OPEN, np.ones((1, max(width // 12, 1)), np.uint8)),
+        cv2.morphologyEx(ink, cv2.MORPH_OPEN, np.ones((max(height // 12, 1), 1), np.uint8))
+    )
+    return cv2.subtract(ink, cv2.dilate(lines, np.ones((3, 3), np.uint8)))
+
+def line_contrast(mask: np.ndarray, axis: int) -> float:
+    """
+    Різкість проєкційного профілю: символи розмазуються вздовж передбачуваних рядків,
+    і якщо рядки справді йдуть у цьому напрямку, профіль різко чергує рядки та проміжки.
+    Рахуються перепади між сусідніми значеннями, а не розкид профілю: порожні колонки
+    таблиці дають великий розкид і в профілі колонок, але плавний
+    """
+    kernel = np.ones((1, 9), np.uint8) if axis == 1 else np.ones((9, 1), np.uint8)
+    profile = cv2.dilate(mask, kernel).mean(axis=axis)
+    mean = profile.mean()
+    return float(np.mean(np.diff(profile) ** 2) / mean ** 2) if mean > 0 else 0.0
+
+def is_sideways(gray: np.ndarray) -> bool:
+    """Чи йдуть рядки тексту вертикально (фото повернуто на 90° або 270°)"""
+    mask = text_mask(gray)
+    rows, columns = line_contrast(mask, axis=1), line_contrast(mask, axis=0)
+    return columns > rows * SIDEWAYS_RATIO
+
+class OrientationCorrector:
+    """Визначення та виправлення орієнтації фото перед OCR"""
+
+    def __init__(self, reader):
+        """reader - easyocr.Reader, вже завантажений OCR процесором"""
+        self.reader = reader
+
+    def sample_confidence(self, gray: np.ndarray, boxes: List[List[int]]) -> float:
+        """Середня впевненість розпізнавання вибраних блоків"""
+        recognized = self.reader.recognize(gray, horizontal_list=boxes, free_list=[], batch_size=len(boxes))
+        if not recognized:
+            return 0.0
+        return float(np.mean([confidence for _, _, confidence in recognized]))
+
+    def is_upside_down(self, gray: np.ndarray) -> bool:
+        """Один прохід детекції на мініатюрі, розпізнавання найширших блоків у поворотах 0° і 180°"""
+        horizontal_list, _ = self.reader.detect(gray)
+        boxes = [[int(value) for value in box] for box in (horizontal_list[0] if horizontal_list else [])]
+        if not boxes:
+            return False
+        boxes = sorted(boxes, key=lambda box: box[1] - box[0], reverse=True)[:ORIENTATION_SAMPLE_BOXES]
+
+        # Ті самі блоки на перевернутій мініатюрі
+        height, width = gray.shape
+        flipped_boxes = [[width - x_max, width - x_min, height - y_max, height - y_min]
+                         for x_min, x_max, y_min, y_max in boxes]
+        upright = self.sample_confidence(gray, boxes)
+        flipped = self.sample_confidence(cv2.rotate(gray, cv2.ROTATE_180), flipped_boxes)
+        return flipped > upright + UPSIDE_DOWN_MARGIN
+
+    def estimate(self, image_path: str) -> int:
+        """Кут повороту за годинниковою стрілкою (0, 90, 180, 270), який робить фото рівним"""
+        gray = load_thumbnail(image_path)
+        if gray is None:
+            return 0
+
+        angle = 0
+        if is_sideways(gray):
+            angle = 90
+            gray = cv2.rotate(gray, ROTATIONS[90])
+        if self.is_upside_down(gray):
+            angle = (angle + 180) % 360
+        return angle
+
+    def correct(self, image_path: str) -> int:
+        """Поворот фото на місці (один раз); повертає застосований кут без урахування EXIF"""
+        apply_exif_orientation(image_path)
+        try:
+            angle = self.estimate(image_path)
+        except Exception as e:
+            logger.error(f"Помилка визначення орієнтації {image_path}: {e}")
+            return 0
+        if angle == 0:
+            return 0
+
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            return 0
+        cv2.imwrite(image_path, cv2.rotate(image, ROTATIONS[angle]))
+        logger.info(f"Фото {image_path} повернуто на {angle}°")
+        return angle
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Профілювання обробки окремих накладних
+Профілюються лише синхронні ділянки: OCR у процесі-обробнику та побудова Excel у потоці.
+Профіль через await в event loop бота захоплював би чужі накладні, веб-сервер і фонові завдання.
+Профілі спершу пишуться в тимчасову папку і переносяться до даних накладної
+(training_data/invoice_<id>/profile_*.prof) лише якщо їх зберігаємо.
+
+Зведення найгарячіших функцій по всіх профілях:
+    python profiling.py [training_data] [--top 30] [--sort tottime] [--kind ocr]
+"""
+
+import argparse
+import cProfile
+import glob
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from config import PROFILE_EVERY_N, PROFILE_LATENCY_THRESHOLD, PROFILE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+class InvoiceProfiler:
+    """Вибір накладних для профілювання та збереження профілів"""
+
+    def __init__(self, every_n: int = PROFILE_EVERY_N, latency_threshold: float = PROFILE_LATENCY_THRESHOLD,
+                 sample_rate: float = PROFILE_SAMPLE_RATE):
+        """
+        every_n - профілювати кожну N-ту накладну; latency_threshold - зберігати профіль повільних;
+        sample_rate - частка накладних, які профілюються, щоб перевірити поріг
+        """
+        self.every_n = every_n
+        self.latency_threshold = latency_threshold
+        self.sample_rate = sample_rate
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def begin(self) -> Optional[str]:
+        """Рішення для нової накладної: 'sampled', 'threshold' або None (без профілювання)"""
+        with self.lock:
+            self.counter += 1
+            if self.every_n > 0 and self.counter % self.every_n == 0:
+                return 'sampled'
+        # Заздалегідь не відомо, чи накладна буде повільною - профілюємо вибірку і вирішуємо в кінці.
+        # Профілювати кожну накладну означало б уповільнити всі заради кількох повільних
+        if self.latency_threshold > 0 and random.random() < self.sample_rate:
+            return 'threshold'
+        return None
+
+    def staging_dir(self, invoice_id: str) -> str:
+        """Тимчасова папка профілів накладної (поза training_data)"""
+        return os.path.join(tempfile.gettempdir(), f"invoice_profiles_{invoice_id}")
+
+    def profile_call(self, profile_path: Optional[str], function, *args):
+        """Виклик синхронної функції з профілюванням (profile_path None - без профілю)"""
+        if not profile_path:
+            return function(*args)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            profile.dump_stats(profile_path)
+
+    def finish(self, mode: Optional[str], staging_dir: str, profile_dir: str, invoice_id: str, elapsed: float):
+        """Перенесення профілів до даних накладної з метаданими або видалення профілів швидкої накладної"""
+        if mode is None or not os.path.isdir(staging_dir):
+            return
+
+        try:
+            profile_files = sorted(glob.glob(os.path.join(staging_dir, "profile_*.prof")))
+            if not profile_files or (mode == 'threshold' and elapsed < self.latency_threshold):
+                return
+
+            os.makedirs(profile_dir, exist_ok=True)
+            for path in profile_files:
+                shutil.move(path, os.path.join(profile_dir, os.path.basename(path)))
+            with open(os.path.join(profile_dir, "profile_meta.json"), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'invoice_id': invoice_id,
+                    'mode': mode,
+                    'elapsed': elapsed,
+                    'profiles': [os.path.basename(path) for path in profile_files]
+                }, f, ensure_ascii=False, indent=2)
+            logger.info(f"Збережено профіль накладної {invoice_id} ({elapsed:.1f} с) в {profile_dir}")
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+def collect_profiles(training_dir: str, kind: Optional[str] = None) -> List[str]:
+    """Пошук збережених профілів (kind: 'bot' або 'ocr')"""
+    pattern = f"profile_{kind}*.prof" if kind else "profile_*.prof"
+    return sorted(glob.glob(os.path.join(training_dir, "invoice_*", pattern)))
+
+def load_meta(training_dir: str) -> List[Dict]:
+    """Метадані профільованих накладних"""
+    meta = []
+    for path in glob.glob(os.path.join(training_dir, "invoice_*", "profile_meta.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                meta.append(json.load(f))
+        except Exception as e:
+            logger.error(f"Помилка читання {path}: {e}")
+    return meta
+
+def main():
+    """Зведення гарячих точок по всіх профілях"""
+    parser = argparse.ArgumentParser(description="Зведення профілів обробки накладних")
+    parser.add_argument('training_dir', nargs='?', default="training_data")
+    parser.add_argument('--top', type=int, default=30, help="Скільки функцій показати")
+    parser.add_argument('--sort', default="cumulative", help="Сортування: cumulative, tottime, calls")
+    parser.add_argument('--kind', choices=['bot', 'ocr'], default=None, help="Лише профілі бота або OCR")
+    args = parser.parse_args()
+
+    profiles = collect_profiles(args.training_dir, args.kind)
+    print("🔬 ПРОФІЛІ ОБРОБКИ НАКЛАДНИХ")
+    print("=" * 50)
+
+    if not profiles:
+        print("Профілів не знайдено. Увімкніть PROFILE_EVERY_N або PROFILE_LATENCY_THRESHOLD")
+        return
+
+    meta = sorted(load_meta(args.training_dir), key=lambda item: item.get('elapsed', 0), reverse=True)
+    print(f"Профілів: {len(profiles)}, накладних: {len(meta)}")
+    if meta:
+        print("\nНайповільніші накладні:")
+        for item in meta[:10]:
+            print(f"  • {item['invoice_id']}: {item['elapsed']:.1f} с ({item['mode']})")
+
+    print(f"\nГарячі точки (сортування: {args.sort}):")
+    stats = pstats.Stats(profiles[0])
+    for path in profiles[1:]:
+        stats.add(path)
+    stats.strip_dirs().sort_stats(args.sort).print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import logging
+import time
+from typing import List, Optional
+
+from telegram import Message
+from telegram.error import RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+class ProgressReporter:
+    """Поетапне оновлення статусного повідомлення з обмеженням частоти редагувань"""
+
+    def __init__(self, message: Message, min_interval: float = 1.5):
+        """Ініціалізація для вже надісланого статусного повідомлення"""
+        self.message = message
+        self.min_interval = min_interval
+        self.lines: List[str] = [message.text or ""]
+        self.last_edit = 0.0
+        self.last_text: Optional[str] = message.text
+
+    async def add_stage(self, line: str, force: bool = False):
+        """Додавання рядка про завершений етап"""
+        self.lines.append(line)
+        await self.flush(force=force)
+
+    async def finish(self, line: str):
+        """Останній етап - редагуємо завжди"""
+        await self.add_stage(line, force=True)
+
+    async def flush(self, force: bool = False):
+        """Редагування повідомлення, якщо минуло достатньо часу з попереднього"""
+        text = "\n".join(self.lines)
+        if text == self.last_text:
+            return
+
+        # Проміжні етапи пропускаємо - наступне редагування покаже їх разом
+        if not force and time.time() - self.last_edit < self.min_interval:
+            return
+
+        try:
+            await self.message.edit_text(text)
+            self.last_text = text
+        except RetryAfter as e:
+            logger.warning(f"Telegram обмежив редагування на {e.retry_after} с")
+        except TelegramError as e:
+            # Статус - лише підказка: таймаут чи збій мережі не повинні зривати обробку накладної
+            logger.warning(f"Не вдалося оновити статус: {e}")
+        finally:
+            self.last_edit = time.time()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Швидка перевірка якості фото перед OCR
+Різкість (дисперсія Лапласіана), експозиція (гістограма яскравості), частка кадру,
+яку займає аркуш, та роздільність рахуються на зменшеній копії за мілісекунди.
+Розмите, темне або обрізане фото відхиляється одразу з порадою перезняти,
+а не після повного проходу easyocr.
+
+Пороги калібруються за оцінками ocr_quality з ручних анотацій:
+    python quality_gate.py calibrate [training_data]
+    python quality_gate.py measure photo.jpg
+"""
+
+import glob
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import QUALITY_THRESHOLDS_FILE
+
+logger = logging.getLogger(__name__)
+
+# Довша сторона робочої копії: різкість порівнюється на однаковому масштабі
+WORK_SIDE = 800
+
+# Яскравість, нижче/вище якої піксель вважається провалом у тінь/пересвітом
+DARK_LEVEL = 40
+BRIGHT_LEVEL = 250
+
+# Пороги за замовчуванням (поки немає каліброваних)
+DEFAULT_THRESHOLDS = {
+    'min_pixels': 500000,
+    'min_sharpness': 40.0,
+    'min_brightness': 70.0,
+    'max_dark_fraction': 0.5,
+    'max_bright_fraction': 0.3,
+    'min_paper_coverage': 0.3
+}
+
+# Порада користувачу для кожного порушеного порогу
+ADVICE = {
+    'min_pixels': "🔍 Замала роздільність - надішліть фото в кращій якості",
+    'min_sharpness': "📷 Фото розмите - тримайте телефон нерухомо та дочекайтесь фокусу на тексті",
+    'min_brightness': "🌑 Фото затемне або в тіні - увімкніть світло чи спалах, знімайте при рівному освітленні",
+    'max_dark_fraction': "🌑 Фото затемне або в тіні - увімкніть світло чи спалах, знімайте при рівному освітленні",
+    'max_bright_fraction': "☀️ Фото пересвічене - приберіть відблиски та пряме світло",
+    'min_paper_coverage': "📄 Накладна займає замало кадру - наблизьте телефон, щоб аркуш заповнив кадр"
+}
+
+# Калібрування: оцінки ocr_quality (0-10) для добрих і поганих фото
+GOOD_QUALITY = 7
+BAD_QUALITY = 4
+# Яку частку добрих фото допускається відхилити кожним порогом
+GOOD_REJECT_PERCENT = 2
+MIN_CALIBRATION_SAMPLES = 10
+# Де між поганими і добрими фото ставити поріг (0 - впритул до поганих): хибне відхилення
+# доброго фото дорожче, ніж зайвий прохід OCR для поганого
+BAD_SIDE_SHARE = 0.25
+# Наскільки (частка порогу за замовчуванням) погане фото має бути гіршим за добрі, щоб зсувати поріг
+MIN_SEPARATION = 0.1
+
+def measure(image_path: str) -> Optional[Dict[str, float]]:
+    """Метрики якості фото (None - файл не читається як зображення)"""
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+    except Exception:
+        return None
+
+    # Декодування одразу зі зменшенням - основна економія часу на великих фото
+    reduction = cv2.IMREAD_REDUCED_GRAYSCALE_4 if max(width, height) >= WORK_SIDE * 4 else (
+        cv2.IMREAD_REDUCED_GRAYSCALE_2 if max(width, height) >= WORK_SIDE * 2 else cv2.IMREAD_GRAYSCALE)
+    gray = cv2.imread(image_path, reduction)
+    if gray is None:
+        return None
+    scale = WORK_SIDE / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    cumulative = np.cumsum(histogram)
+
+    # Аркуш - найбільша світла область після порогу Оцу
+    _, paper = cv2.threshold(cv2.GaussianBlur(gray, (5, 5), 0), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    paper = cv2.morphologyEx(paper, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    paper_area = max((cv2.contourArea(contour) for contour in contours), default=0.0)
+
+    return {
+        'pixels': float(width * height),
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        'brightness': float(np.searchsorted(cumulative, 0.5)),
+        'dark_fraction': float(cumulative[DARK_LEVEL - 1]),
+        'bright_fraction': float(histogram[BRIGHT_LEVEL:].sum()),
+        'paper_coverage': float(paper_area / gray.size)
+    }
+
+def threshold_metric(name: str) -> Tuple[str, bool]:
+    """Метрика порогу та чи це нижня межа (min_*)"""
+    return name.split('_', 1)[1], name.startswith('min_')
+
+def failed_checks(metrics: Dict[str, float], thresholds: Dict[str, float]) -> List[str]:
+    """Назви порушених порогів"""
+    failed = []
+    for name, limit in thresholds.items():
+        metric, is_minimum = threshold_metric(name)
+        if metric not in metrics:
+            continue
+        if (metrics[metric] < limit) if is_minimum else (metrics[metric] > limit):
+            failed.append(name)
+    return failed
+
+def load_thresholds(path: str = QUALITY_THRESHOLDS_FILE) -> Dict[str, float]:
+    """Каліброві пороги (відсутні - за замовчуванням)"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                thresholds.update({name: value for name, value in json.load(f).get('thresholds', {}).items()
+                                   if name in DEFAULT_THRESHOLDS})
+        except Exception as e:
+            logger.error(f"Помилка завантаження порогів якості {path}: {e}")
+    return thresholds
+
+class QualityGate:
+    """Перевірка фото перед OCR"""
+
+    def __init__(self, thresholds_file: str = QUALITY_THRESHOLDS_FILE):
+        """Завантаження порогів"""
+        self.thresholds = load_thresholds(thresholds_file)
+
+    def evaluate(self, image_path: str) -> Tuple[bool, List[str], Optional[Dict[str, float]]]:
+        """(чи пропускати фото, поради користувачу, метрики)"""
+        metrics = measure(image_path)
+        if metrics is None:
+            return False, ["❌ Файл не вдалося відкрити як зображення"], None
+
+        failed = failed_checks(metrics, self.thresholds)
+        if failed:
+            logger.info(f"Фото {image_path} не пройшло перевірку якості: {failed} {metrics}")
+        # Однакові поради (тінь і темне фото) показуємо один раз
+        advice = list(dict.fromkeys(ADVICE[name] for name in failed))
+        return not failed, advice, metrics
+
+def calibration_samples(training_dir: str) -> Tuple[List[Dict[str, float]], List[Dict[str, float]]]:
+    """Метрики фото анотованих накладних: (добрі, погані)"""
+    good, bad = [], []
+    for annotation_file in glob.glob(os.path.join(training_dir, "invoice_*", "manual_annotation.json")):
+        try:
+            with open(annotation_file, 'r', encoding='utf-8') as f:
+                quality = json.load(f).get('ocr_quality', {}).get('overall_quality', 0)
+        except Exception as e:
+            logger.error(f"Помилка читання анотації {annotation_file}: {e}")
+            continue
+        # 0 - накладну не оцінювали
+        if not quality or BAD_QUALITY < quality < GOOD_QUALITY:
+            continue
+
+        invoice_dir = os.path.dirname(annotation_file)
+        for photo in glob.glob(os.path.join(invoice_dir, "photo*.*")):
+            metrics = measure(photo)
+            if metrics:
+                (good if quality >= GOOD_QUALITY else bad).append(metrics)
+    return good, bad
+
+def calibrate_threshold(name: str, good: List[float], bad: List[float]) -> float:
+    """
+    Поріг однієї метрики: не відхиляє більше GOOD_REJECT_PERCENT добрих фото,
+    а якщо погані фото лежать за цією межею - ставиться між ними та добрими, ближче до поганих
+    """
+    _, is_minimum = threshold_metric(name)
+    # Для верхніх меж дзеркалимо значення, щоб рахувати як для нижніх
+    sign = 1 if is_minimum else -1
+    good_edge = float(np.percentile([sign * value for value in good], GOOD_REJECT_PERCENT))
+    # Погане фото, яке ледь гірше за добрі, зазвичай погане з іншої причини - його не враховуємо
+    margin = MIN_SEPARATION * abs(DEFAULT_THRESHOLDS[name])
+    separable = [sign * value for value in bad if sign * value < good_edge - margin]
+    if separable:
+        limit = max(separable) + (good_edge - max(separable)) * BAD_SIDE_SHARE
+    else:
+        # Метрика не відділяє погані фото - лише не даємо порогу за замовчуванням відхиляти добрі
+        limit = min(sign * DEFAULT_THRESHOLDS[name], good_edge)
+    return round(sign * limit, 4)
+
+def calibrate(training_dir: str = "training_data") -> Dict:
+    """Пороги за метриками фото з оцінками якості (замало оцінених фото - пороги за замовчуванням)"""
+    good, bad = calibration_samples(training_dir)
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    report = {}
+    if len(good) >= MIN_CALIBRATION_SAMPLES:
+        for name in DEFAULT_THRESHOLDS:
+            metric, _ = threshold_metric(name)
+            thresholds[name] = calibrate_threshold(name, [sample[metric] for sample in good],
+                                                   [sample[metric] for sample in bad])
+
+    for name, limit in thresholds.items():
+        report[name] = {
+            'good_rejected': sum(1 for sample in good if failed_checks(sample, {name: limit})),
+            'bad_rejected': sum(1 for sample in bad if failed_checks(sample, {name: limit}))
+        }
+
+    return {
+        'thresholds': thresholds,
+        'calibrated': len(good) >= MIN_CALIBRATION_SAMPLES,
+        'good_photos': len(good),
+        'bad_photos': len(bad),
+        'bad_rejected': sum(1 for sample in bad if failed_checks(sample, thresholds)),
+        'good_rejected': sum(1 for sample in good if failed_checks(sample, thresholds)),
+        'checks': report,
+        'calibrated_at': datetime.now().isoformat()
+    }
+
+def main():
+    """Калібрування порогів або вимірювання фото з командного рядка"""
+    logging.basicConfig(level=logging.WARNING)
+    command = sys.argv[1] if len(sys.argv) > 1 else "calibrate"
+
+    if command == "measure":
+        gate = QualityGate()
+        for photo in sys.argv[2:]:
+            passed, advice, metrics = gate.evaluate(photo)
+            print(f"{'✅' if passed else '❌'} {photo}: {json.dumps(metrics, ensure_ascii=False)}")
+            for line in advice:
+                print(f"   {line}")
+        return
+
+    training_dir = sys.argv[2] if len(sys.argv) > 2 else "training_data"
+    print("📏 КАЛІБРУВАННЯ ПЕРЕВІРКИ ЯКОСТІ ФОТО")
+    print("=" * 50)
+
+    result = calibrate(training_dir)
+    print(f"Фото з оцінкою >= {GOOD_QUALITY}: {result['good_photos']}, <= {BAD_QUALITY}: {result['bad_photos']}")
+    if not result['calibrated']:
+        print(f"⚠️ Замало оцінених фото (потрібно {MIN_CALIBRATION_SAMPLES}) - пороги за замовчуванням")
+    for name, limit in result['thresholds'].items():
+        check = result['checks'][name]
+        print(f"  {name}: {limit:g} (відсіює поганих: {check['bad_rejected']}, добрих: {check['good_rejected']})")
+    print(f"Разом відсіюється поганих: {result['bad_rejected']}/{result['bad_photos']}, "
+          f"добрих: {result['good_rejected']}/{result['good_photos']}")
+
+    with open(QUALITY_THRESHOLDS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Збережено в {QUALITY_THRESHOLDS_FILE} - бот використає пороги при наступному запуску")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Компактні записи накладних: OCR блок, рядок продукту, накладна
+Записи з __slots__ займають менше пам'яті, ніж словники, а підсумки накладної
+рахуються один раз. to_row - компактна серіалізація у списки для JSON.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+class OCRBox:
+    """Один блок тексту easyocr: 4 кути рамки, текст, впевненість"""
+
+    __slots__ = ('bbox', 'text', 'confidence')
+
+    def __init__(self, bbox: Tuple[Tuple[int, int], ...], text: str, confidence: float):
+        self.bbox = bbox
+        self.text = text
+        self.confidence = confidence
+
+    @classmethod
+    def from_easyocr(cls, result: Tuple) -> 'OCRBox':
+        """Блок з результату easyocr (bbox, text, confidence)"""
+        bbox, text, confidence = result
+        return cls(tuple((int(x), int(y)) for x, y in bbox), text, float(confidence))
+
+    def to_row(self) -> List[Any]:
+        """[x1, y1, ..., x4, y4, текст, впевненість]"""
+        return [coordinate for point in self.bbox for coordinate in point] + [self.text, round(self.confidence, 4)]
+
+    def __repr__(self) -> str:
+        return f"OCRBox({self.text!r}, {self.confidence:.2f})"
+
+class ProductLine:
+    """Рядок продукту в накладній"""
+
+    __slots__ = ('name', 'quantity', 'price', 'code', 'weight', 'weight_unit')
+
+    def __init__(self, name: str, quantity: float, price: float = 0.0, code: Optional[str] = None,
+                 weight: Optional[float] = None, weight_unit: Optional[str] = None):
+        self.name = name
+        self.quantity = quantity
+        self.price = price
+        self.code = code
+        self.weight = weight
+        self.weight_unit = weight_unit
+
+    @property
+    def total(self) -> float:
+        """Сума рядка (без ціни - 0)"""
+        return self.quantity * self.price if self.price > 0 else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словник у форматі ocr_results.json"""
+        product = {
+            'name': self.name,
+            'quantity': self.quantity,
+            'price': self.price,
+            'total': self.total,
+            'code': self.code
+        }
+        if self.weight is not None:
+            product['weight'], product['weight_unit'] = self.weight, self.weight_unit
+        return product
+
+    @classmethod
+    def from_dict(cls, product: Dict[str, Any]) -> 'ProductLine':
+        """Рядок зі словника ocr_results.json"""
+        return cls(product.get('name', ''), product.get('quantity', 0), product.get('price', 0),
+                   product.get('code'), product.get('weight'), product.get('weight_unit'))
+
+    def to_row(self) -> List[Any]:
+        """[назва, кількість, ціна, код, вага, одиниця]"""
+        return [self.name, self.quantity, self.price, self.code, self.weight, self.weight_unit]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> 'ProductLine':
+        """Зворотне перетворення to_row"""
+        return cls(*row)
+
+    def __repr__(self) -> str:
+        return f"ProductLine({self.name!r}, {self.quantity}, {self.price}, {self.code!r})"
+
+class Invoice:
+    """
+    Накладна з обох фото: пекарня, продукти та підсумки, пораховані один раз.
+    products - кортеж, щоб кешовані підсумки не розійшлися з продуктами; додавати - через add_products
+    """
+
+    __slots__ = ('invoice_id', 'bakery_name', 'products', '_total_quantity', '_total_amount')
+
+    def __init__(self, invoice_id: str, bakery_name: Optional[str] = None,
+                 products: Optional[List[ProductLine]] = None):
+        self.invoice_id = invoice_id
+        self.bakery_name = bakery_name
+        self.products: Tuple[ProductLine, ...] = tuple(products or ())
+        self._total_quantity: Optional[float] = None
+        self._total_amount: Optional[float] = None
+
+    @classmethod
+    def from_pages(cls, invoice_id: str, pages: Iterable[Dict[str, Any]]) -> 'Invoice':
+        """Накладна з результатів обробки окремих фото (пекарня - з першого фото, де вона знайдена)"""
+        invoice = cls(invoice_id)
+        for page in pages:
+            if not invoice.bakery_name:
+                invoice.bakery_name = page.get('bakery_name')
+            invoice.add_products(page.get('products', []))
+        return invoice
+
+    def add_products(self, products: Iterable[ProductLine]):
+        """Додавання продуктів (підсумки буде перераховано)"""
+        self.products += tuple(products)
+        self._total_quantity = None
+        self._total_amount = None
+
+    @property
+    def total_quantity(self) -> float:
+        """Загальна кількість"""
+        if self._total_quantity is None:
+            self._total_quantity = sum(product.quantity for product in self.products)
+        return self._total_quantity
+
+    @property
+    def total_amount(self) -> float:
+        """Загальна сума"""
+        if self._total_amount is None:
+            self._total_amount = sum(product.total for product in self.products)
+        return self._total_amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словник у форматі ocr_results.json"""
+        return {
+            'bakery_name': self.bakery_name,
+            'products': [product.to_dict() for product in self.products],
+            'total_quantity': self.total_quantity,
+            'total_amount': self.total_amount
+        }
+
+    @classmethod
+    def from_dict(cls, invoice_id: str, data: Dict[str, Any]) -> 'Invoice':
+        """Накладна з ocr_results.json"""
+        return cls(invoice_id, data.get('bakery_name'),
+                   [ProductLine.from_dict(product) for product in data.get('products', [])])
+
+    def to_row(self) -> List[Any]:
+        """[id, пекарня, [рядки продуктів]]"""
+        return [self.invoice_id, self.bakery_name, [product.to_row() for product in self.products]]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> 'Invoice':
+        """Зворотне перетворення to_row"""
+        invoice_id, bakery_name, products = row
+        return cls(invoice_id, bakery_name, [ProductLine.from_row(product) for product in products])
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __repr__(self) -> str:
+        return f"Invoice({self.invoice_id!r}, {self.bakery_name!r}, {len(self.products)} продуктів)"
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Очищення та ущільнення накопичених файлів бота
+- старі фото перестискаються у WebP зі зменшеною роздільністю, дуже старі видаляються
+- старі Excel та текстові звіти видаляються
+- старі неанотовані накладні з training_data пакуються в архівні шарди з індексом
+
+Використання:
+    python retention.py [--dry-run]
+"""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import cv2
+
+from config import (
+    PHOTO_RECOMPRESS_DAYS, PHOTO_DELETE_DAYS, REPORT_DELETE_DAYS,
+    TRAINING_ARCHIVE_DAYS, ARCHIVE_SHARD_DELETE_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+class RetentionManager:
+    """Політики зберігання фото, звітів та тренувальних даних"""
+
+    def __init__(self, photos_dir: str = "nakladni_photos", reports_dir: str = "excel_reports",
+                 training_dir: str = "training_data", dry_run: bool = False):
+        """Ініціалізація менеджера зберігання"""
+        self.photos_dir = photos_dir
+        self.reports_dir = reports_dir
+        self.training_dir = training_dir
+        self.archive_dir = os.path.join(training_dir, "archive")
+        self.index_file = os.path.join(self.archive_dir, "index.json")
+        self.dry_run = dry_run
+
+    def run(self) -> Dict[str, int]:
+        """Один прохід усіх політик"""
+        now = time.time()
+        summary = {
+            'photos_recompressed': 0,
+            'photos_deleted': 0,
+            'reports_deleted': 0,
+            'invoices_archived': 0,
+            'shards_deleted': 0,
+            'bytes_freed': 0
+        }
+
+        self.process_photos(now, summary)
+        self.delete_reports(now, summary)
+        self.archive_invoices(now, summary)
+        self.delete_old_shards(now, summary)
+
+        logger.info(f"Очищення завершено: {summary}")
+        return summary
+
+    def is_expired(self, mtime: float, now: float, days: int) -> bool:
+        """Чи старший файл за вказану кількість днів (0 - політика вимкнена)"""
+        return days > 0 and now - mtime > days * DAY
+
+    def remove_file(self, path: str, summary: Dict[str, int]) -> bool:
+        """Видалення файлу з підрахунком звільненого місця"""
+        try:
+            size = os.path.getsize(path)
+            if not self.dry_run:
+                os.remove(path)
+            summary['bytes_freed'] += size
+            return True
+        except Exception as e:
+            logger.error(f"Помилка видалення файлу {path}: {e}")
+            return False
+
+    def process_photos(self, now: float, summary: Dict[str, int]):
+        """Перестискання та видалення старих фото"""
+        if not os.path.isdir(self.photos_dir):
+            return
+
+        with os.scandir(self.photos_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+
+                if self.is_expired(mtime, now, PHOTO_DELETE_DAYS):
+                    if self.remove_file(entry.path, summary):
+                        summary['photos_deleted'] += 1
+                elif not entry.name.endswith('.webp') and self.is_expired(mtime, now, PHOTO_RECOMPRESS_DAYS):
+                    freed = self.recompress_photo(entry.path, mtime)
+                    if freed is not None:
+                        summary['photos_recompressed'] += 1
+                        summary['bytes_freed'] += freed
+
+    def recompress_photo(self, path: str, mtime: float, max_side: int = 1600, quality: int = 70):
+        """Перестискання фото у WebP; повертає кількість звільнених байтів"""
+        try:
+            image = cv2.imread(path)
+            if image is None:
+                return None
+
+            scale = max_side / max(image.shape[:2])
+            if scale < 1:
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            target = os.path.splitext(path)[0] + '.webp'
+            original_size = os.path.getsize(path)
+            if self.dry_run:
+                return 0
+
+            cv2.imwrite(target, image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+            # Зберігаємо дату фото, щоб політика видалення рахувала вік від зйомки
+            os.utime(target, (mtime, mtime))
+            os.remove(path)
+            return original_size - os.path.getsize(target)
+        except Exception as e:
+            logger.error(f"Помилка перестискання фото {path}: {e}")
+            return None
+
+    def delete_reports(self, now: float, summary: Dict[str, int]):
+        """Видалення старих Excel файлів, сирого тексту та текстових звітів"""
+        candidates = glob.glob(os.path.join(self.reports_dir, "*.xlsx"))
+        candidates += glob.glob("raw_text_*.txt") + glob.glob("Накладна_*.txt")
+
+        for path in candidates:
+            try:
+                expired = self.is_expired(os.path.getmtime(path), now, REPORT_DELETE_DAYS)
+            except OSError:
+                continue
+            if expired and self.remove_file(path, summary):
+                summary['reports_deleted'] += 1
+
+    def is_annotated(self, invoice_dir: str) -> bool:
+        """Чи містить накладна ручну анотацію (такі потрібні для оцінки точності)"""
+        annotation_file = os.path.join(invoice_dir, "manual_annotation.json")
+        try:
+            with open(annotation_file, 'r', encoding='utf-8') as f:
+                annotation = json.load(f)
+        except Exception:
+            return False
+
+        if annotation.get('bakery_name', {}).get('correct_name'):
+            return True
+        if annotation.get('ocr_quality', {}).get('overall_quality', 0) > 0:
+            return True
+        # Списки пропущених продуктів, неправильних кількостей і цін тощо
+        if any(annotation.get('manual_corrections', {}).values()):
+            return True
+        return any(product.get('correct_name') or product.get('is_correct')
+                   or product.get('correct_quantity') or product.get('correct_price')
+                   for product in annotation.get('products', []))
+
+    def archive_invoices(self, now: float, summary: Dict[str, int]):
+        """Пакування старих неанотованих накладних в один архівний шард за прохід"""
+        if not os.path.isdir(self.training_dir):
+            return
+
+        to_archive: List[os.DirEntry] = []
+        with os.scandir(self.training_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir() or not entry.name.startswith("invoice_"):
+                    continue
+                if self.is_expired(entry.stat().st_mtime, now, TRAINING_ARCHIVE_DAYS) and \
+                        not self.is_annotated(entry.path):
+                    to_archive.append(entry)
+
+        if not to_archive:
+            return
+
+        shard_name = f"shard_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tar.gz"
+        if self.dry_run:
+            summary['invoices_archived'] += len(to_archive)
+            return
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        shard_path = os.path.join(self.archive_dir, shard_name)
+        try:
+            with tarfile.open(shard_path, 'w:gz') as tar:
+                for entry in to_archive:
+                    tar.add(entry.path, arcname=entry.name)
+        except Exception as e:
+            logger.error(f"Помилка створення архіву {shard_path}: {e}")
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
+            return
+
+        # Індекс: накладна -> шард, щоб знайти її без розпакування всіх архівів
+        index = self.load_index()
+        for entry in to_archive:
+            index[entry.name[len("invoice_"):]] = shard_name
+        self.save_index(index)
+
+        for entry in to_archive:
+            try:
+                summary['bytes_freed'] += sum(
+                    os.path.getsize(os.path.join(root, name))
+                    for root, _, files in os.walk(entry.path) for name in files
+                )
+                shutil.rmtree(entry.path)
+                summary['invoices_archived'] += 1
+            except Exception as e:
+                logger.error(f"Помилка видалення папки {entry.path}: {e}")
+        summary['bytes_freed'] -= os.path.getsize(shard_path)
+
+    def delete_old_shards(self, now: float, summary: Dict[str, int]):
+        """Видалення архівних шардів, старших за термін зберігання"""
+        if not os.path.isdir(self.archive_dir):
+            return
+
+        expired = []
+        with os.scandir(self.archive_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("shard_") and \
+                        self.is_expired(entry.stat().st_mtime, now, ARCHIVE_SHARD_DELETE_DAYS):
+                    expired.append(entry)
+
+        if not expired:
+            return
+
+        expired_names = set()
+        for entry in expired:
+            if self.remove_file(entry.path, summary):
+                summary['shards_deleted'] += 1
+                expired_names.add(entry.name)
+
+        if not self.dry_run and expired_names:
+            index = self.load_index()
+            self.save_index({invoice_id: shard for invoice_id, shard in index.items()
+                             if shard not in expired_names})
+
+    def load_index(self) -> Dict[str, str]:
+        """Завантаження індексу архіву"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save_index(self, index: Dict[str, str]):
+        """Збереження індексу архіву (через тимчасовий файл)"""
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.index_file)
+
+    def extract_invoice(self, invoice_id: str, target_dir: str = None) -> str:
+        """Розпакування накладної з архіву назад у training_data"""
+        shard_name = self.load_index().get(invoice_id)
+        if not shard_name:
+            return None
+
+        target_dir = target_dir or self.training_dir
+        member_prefix = f"invoice_{invoice_id}"
+        with tarfile.open(os.path.join(self.archive_dir, shard_name), 'r:gz') as tar:
+            members = [m for m in tar.getmembers()
+                       if m.name == member_prefix or m.name.startswith(member_prefix + "/")]
+            tar.extractall(target_dir, members=members, filter='data')
+
+        return os.path.join(target_dir, member_prefix)
+
+def main():
+    """Ручний запуск очищення"""
+    logging.basicConfig(level=logging.INFO)
+    dry_run = '--dry-run' in sys.argv
+
+    print("🧹 ОЧИЩЕННЯ ФАЙЛІВ БОТА" + (" (пробний запуск)" if dry_run else ""))
+    print("=" * 50)
+
+    summary = RetentionManager(dry_run=dry_run).run()
+
+    print(f"Перестиснуто фото: {summary['photos_recompressed']}")
+    print(f"Видалено фото: {summary['photos_deleted']}")
+    print(f"Видалено звітів: {summary['reports_deleted']}")
+    print(f"Заархівовано накладних: {summary['invoices_archived']}")
+    print(f"Видалено архівних шардів: {summary['shards_deleted']}")
+    print(f"Звільнено: {summary['bytes_freed'] / 1024 / 1024:.1f} МБ")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import numpy as np
+from typing import List, Tuple
+
+def box_geometry(ocr_results: List[Tuple]) -> np.ndarray:
+    """Координати блоків: x_min, y_min, x_max, y_max для кожного блоку"""
+    if not ocr_results:
+        return np.zeros((0, 4), dtype=np.float32)
+
+    # easyocr повертає bbox як 4 точки [[x, y], ...]
+    points = np.array([bbox for bbox, _, _ in ocr_results], dtype=np.float32).reshape(-1, 4, 2)
+    return np.stack([
+        points[:, :, 0].min(axis=1),
+        points[:, :, 1].min(axis=1),
+        points[:, :, 0].max(axis=1),
+        points[:, :, 1].max(axis=1)
+    ], axis=1)
+
+# Перебір нахилів фото: до ±MAX_SKEW_DEGREES з кроком SKEW_STEP_DEGREES
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.1
+
+def estimate_skew(geometry: np.ndarray, median_height: float) -> float:
+    """
+    Нахил рядків (тангенс кута) за проєкцією центрів блоків
+    Для кожного кута з перебору центри вирівнюються, і рахується, наскільки щільно вони
+    збираються в рядки (сума близькостей пар блоків по y) - перемагає найщільніший кут.
+    Рахуються лише пари, які при якомусь куті з перебору можуть опинитись в одному рядку
+    """
+    if len(geometry) < 2:
+        return 0.0
+
+    x_center = (geometry[:, 0] + geometry[:, 2]) / 2
+    y_center = (geometry[:, 1] + geometry[:, 3]) / 2
+    first, second = np.triu_indices(len(geometry), k=1)
+    dx = x_center[second] - x_center[first]
+    dy = y_center[second] - y_center[first]
+
+    max_slope = np.tan(np.radians(MAX_SKEW_DEGREES))
+    nearby = np.abs(dy) <= np.abs(dx) * max_slope + median_height
+    dx, dy = dx[nearby], dy[nearby]
+    if len(dx) == 0:
+        return 0.0
+
+    # Кути від нуля назовні: за однакової щільності перемагає менший нахил
+    steps = int(round(MAX_SKEW_DEGREES / SKEW_STEP_DEGREES))
+    angles = np.array([0.0] + [sign * step * SKEW_STEP_DEGREES
+                               for step in range(1, steps + 1) for sign in (1, -1)])
+    slopes = np.tan(np.radians(angles))
+
+    sigma = median_height / 4
+    scores = [np.exp(-((dy - slope * dx) / sigma) ** 2 / 2).sum() for slope in slopes]
+    return float(slopes[int(np.argmax(scores))])
+
+def assign_rows(geometry: np.ndarray, row_tolerance: float = 0.5) -> np.ndarray:
+    """
+    Номер рядка таблиці для кожного блоку
+    Центри блоків спершу вирівнюються на оцінений нахил фото (тримане в руці фото
+    зазвичай нахилене на 1-2°, і на широкому бланку це зсув на кілька висот рядка),
+    потім сортуються по y, і новий рядок починається там, де відстань між сусідніми
+    центрами більша за частку медіанної висоти блоку
+    """
+    count = len(geometry)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    height = geometry[:, 3] - geometry[:, 1]
+    median_height = max(float(np.median(height)), 1.0)
+    threshold = row_tolerance * median_height
+
+    x_center = (geometry[:, 0] + geometry[:, 2]) / 2
+    y_center = (geometry[:, 1] + geometry[:, 3]) / 2
+    # Вирівняний y: висота точки рядка там, де рядок перетинає x = 0
+    y_center = y_center - estimate_skew(geometry, median_height) * x_center
+
+    order = np.argsort(y_center, kind='stable')
+    breaks = np.diff(y_center[order]) > threshold
+
+    row_ids = np.empty(count, dtype=np.int64)
+    row_ids[order] = np.concatenate(([0], np.cumsum(breaks)))
+    return row_ids
+
+def group_into_rows(ocr_results: List[Tuple], row_tolerance: float = 0.5) -> List[List[Tuple]]:
+    """Групування текстових блоків у рядки таблиці, блоки в рядку - зліва направо (по колонках)"""
+    if not ocr_results:
+        return []
+
+    geometry = box_geometry(ocr_results)
+    row_ids = assign_rows(geometry, row_tolerance)
+
+    # Сортуємо спочатку за рядком, потім за x - отримуємо колонки в порядку бланка
+    order = np.lexsort((geometry[:, 0], row_ids))
+    splits = np.flatnonzero(np.diff(row_ids[order])) + 1
+
+    return [[ocr_results[i] for i in row] for row in np.split(order, splits)]
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Вирівнювання фото накладної за еталонним зображенням бланка
+Після вирівнювання розпізнаються лише відомі клітинки кількості, без детекції тексту
+
+Калібрування (один раз, на чистому рівному фото бланка):
+    python template_registration.py calibrate reference.jpg [page_name]
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from config import TEMPLATE_DIR, TEMPLATE_MIN_INLIERS
+from records import ProductLine
+from row_reconstruction import box_geometry, group_into_rows
+
+logger = logging.getLogger(__name__)
+
+# Розмір, до якого зводиться довша сторона еталону та фото перед пошуком ознак
+FEATURE_IMAGE_SIZE = 1600
+
+class TemplateRegistrar:
+    """Реєстрація фото на еталонні сторінки бланка та розпізнавання відомих клітинок"""
+
+    def __init__(self, reader, template_dir: str = TEMPLATE_DIR):
+        """Завантаження еталонних сторінок та їх розмітки"""
+        self.reader = reader
+        self.template_dir = template_dir
+        self.orb = cv2.ORB_create(nfeatures=4000)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        self.pages: List[Dict] = []
+        self.load_pages()
+
+    def load_pages(self):
+        """Завантаження еталонів: пари <сторінка>.png + <сторінка>.json"""
+        if not os.path.isdir(self.template_dir):
+            return
+
+        for filename in sorted(os.listdir(self.template_dir)):
+            if not filename.endswith('.json'):
+                continue
+            name = os.path.splitext(filename)[0]
+            image_path = os.path.join(self.template_dir, f"{name}.png")
+            if not os.path.exists(image_path):
+                continue
+
+            try:
+                with open(os.path.join(self.template_dir, filename), 'r', encoding='utf-8') as f:
+                    layout = json.load(f)
+                reference = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+                keypoints, descriptors = self.orb.detectAndCompute(reference, None)
+                self.pages.append({
+                    'name': name,
+                    'layout': layout,
+                    'size': (reference.shape[1], reference.shape[0]),
+                    'keypoints': keypoints,
+                    'descriptors': descriptors
+                })
+                logger.info(f"Завантажено еталон бланка {name}: {len(layout.get('cells', []))} клітинок")
+            except Exception as e:
+                logger.error(f"Помилка завантаження еталона {name}: {e}")
+
+    def is_ready(self) -> bool:
+        """Чи є хоча б одна відкалібрована сторінка"""
+        return bool(self.pages)
+
+    def align(self, image: np.ndarray) -> Optional[Dict]:
+        """Пошук сторінки бланка та вирівнювання фото до неї гомографією"""
+        scale = FEATURE_IMAGE_SIZE / max(image.shape[:2])
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+        scale = min(scale, 1.0)
+
+        keypoints, descriptors = self.orb.detectAndCompute(small, None)
+        if descriptors is None or len(keypoints) < TEMPLATE_MIN_INLIERS:
+            return None
+
+        best = None
+        for page in self.pages:
+            if page['descriptors'] is None:
+                continue
+
+            # Тест відношення Лоу відкидає неоднозначні збіги
+            matches = self.matcher.knnMatch(descriptors, page['descriptors'], k=2)
+            good = [m[0] for m in matches if len(m) == 2 and m[0].distance < 0.75 * m[1].distance]
+            if len(good) < TEMPLATE_MIN_INLIERS:
+                continue
+
+            source = np.float32([keypoints[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+            target = np.float32([page['keypoints'][m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+            homography, mask = cv2.findHomography(source, target, cv2.RANSAC, 5.0)
+            if homography is None:
+                continue
+
+            inliers = int(mask.sum())
+            if inliers >= TEMPLATE_MIN_INLIERS and (best is None or inliers > best['inliers']):
+                best = {'page': page, 'homography': homography, 'inliers': inliers}
+
+        if best is None:
+            return None
+
+        # Гомографія знайдена на зменшеному фото - додаємо масштаб
+        homography = best['homography'] @ np.diag([scale, scale, 1.0])
+        best['image'] = cv2.warpPerspective(image, homography, best['page']['size'], borderValue=255)
+        return best
+
+    def process_invoice(self, image_path: str) -> Optional[Dict]:
+        """Обробка фото через вирівнювання; None - фото не схоже на жоден еталон"""
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None or not self.pages:
+            return None
+
+        aligned = self.align(image)
+        if aligned is None:
+            logger.info(f"Фото {image_path} не вирівняно за еталоном, повне розпізнавання")
+            return None
+
+        layout = aligned['page']['layout']
+        cells = layout.get('cells', [])
+        if not cells:
+            return None
+
+        # Одне пакетне розпізнавання клітинок кількості, лише цифри
+        boxes = [cell['quantity_box'] for cell in cells]
+        recognized = self.reader.recognize(aligned['image'], horizontal_list=boxes, free_list=[],
+                                           allowlist='0123456789.,', batch_size=len(boxes))
+        by_position = {(box[0], box[2]): index for index, box in enumerate(boxes)}
+
+        products = []
+        raw_text = []
+        for bbox, text, confidence in recognized:
+            index = by_position.get((int(bbox[0][0]), int(bbox[0][1])))
+            if index is None:
+                continue
+            text = text.strip().replace(',', '.')
+            raw_text.append(f"{cells[index]['code']}: {text}")
+            if confidence < 0.3 or not re.match(r'^\d+(?:\.\d+)?$', text):
+                continue
+            quantity = float(text)
+            if 0 < quantity <= 10000:
+                products.append(ProductLine(cells[index]['name'], quantity, code=cells[index]['code']))
+
+        bakery_name = None
+        bakery_box = layout.get('fields', {}).get('bakery_name')
+        if bakery_box:
+            result = self.reader.recognize(aligned['image'], horizontal_list=[bakery_box], free_list=[])
+            if result and result[0][2] > 0.4 and len(result[0][1].strip()) > 3:
+                bakery_name = result[0][1].strip()
+                raw_text.insert(0, bakery_name)
+
+        logger.info(f"Фото {image_path} вирівняно за еталоном {aligned['page']['name']} "
+                    f"({aligned['inliers']} збігів), знайдено {len(products)} продуктів")
+
+        return {
+            'bakery_name': bakery_name,
+            'products': products,
+            'raw_text': raw_text,
+            'template_page': aligned['page']['name']
+        }
+
+def calibrate(reader, reference_path: str, catalog: Dict[str, Dict], page_name: str = "page1",
+              template_dir: str = TEMPLATE_DIR) -> Optional[str]:
+    """
+    Створення розмітки сторінки з чистого рівного фото бланка
+    Клітинка кількості - проміжок між назвою продукту та його кодом у тому ж рядку
+    """
+    image = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        logger.error(f"Не вдалося відкрити {reference_path}")
+        return None
+
+    # Еталон зберігається зі стандартним розміром - так само зводяться фото
+    scale = FEATURE_IMAGE_SIZE / max(image.shape[:2])
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    ocr_results = reader.readtext(image)
+
+    cells = []
+    fields = {}
+    for row in group_into_rows(ocr_results):
+        geometry = box_geometry(row)
+        for index, (_, text, _) in enumerate(row):
+            text = text.strip()
+            if 'ПЕКАРНЯ' in text.upper() and 'bakery_name' not in fields:
+                x_min, y_min, x_max, y_max = geometry[index]
+                fields['bakery_name'] = [int(x_max), int(min(x_max + 4 * (x_max - x_min), image.shape[1])),
+                                         int(y_min), int(y_max)]
+                continue
+
+            if text not in catalog or index == 0:
+                continue
+
+            # Ліва межа - правий край сусіднього блоку зліва (назва продукту)
+            x_min, y_min, x_max, y_max = geometry[index]
+            left = geometry[index - 1][2]
+            if x_min - left < 5:
+                continue
+            cells.append({
+                'code': text,
+                'name': catalog[text]['name'],
+                'quantity_box': [int(left + 2), int(x_min - 2), int(y_min), int(y_max)]
+            })
+
+    os.makedirs(template_dir, exist_ok=True)
+    cv2.imwrite(os.path.join(template_dir, f"{page_name}.png"), image)
+    layout_path = os.path.join(template_dir, f"{page_name}.json")
+    with open(layout_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(reference_path), 'cells': cells, 'fields': fields},
+                  f, ensure_ascii=False, indent=2)
+
+    logger.info(f"Розмітку сторінки {page_name} збережено: {len(cells)} клітинок кількості")
+    return layout_path
+
+def main():
+    """Калібрування еталону з командного рядка"""
+    if len(sys.argv) < 3 or sys.argv[1] != 'calibrate':
+        print(__doc__)
+        return
+
+    import easyocr
+    from blank_analyzer import BlankAnalyzer
+
+    logging.basicConfig(level=logging.INFO)
+    catalog = BlankAnalyzer("бланк для випічки з новинками.xlsx").get_product_catalog()
+    reader = easyocr.Reader(['uk', 'ru', 'en'], gpu=False)
+    page_name = sys.argv[3] if len(sys.argv) > 3 else "page1"
+
+    layout_path = calibrate(reader, sys.argv[2], catalog, page_name)
+    if layout_path:
+        print(f"💾 Розмітку збережено в {layout_path}")
+    else:
+        print("❌ Калібрування не вдалося")
+
+if __name__ == "__main__":
+    main()
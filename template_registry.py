@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from text_normalizer import key_tokens, normalize_key
+
+logger = logging.getLogger(__name__)
+
+# Скільки перших OCR блоків використовується для визначення бланка
+FINGERPRINT_BOXES = 60
+
+class TemplateRegistry:
+    """Реєстр бланків постачальників з визначенням бланка за ключовими словами та кодами"""
+
+    def __init__(self, templates_dir: str = "supplier_templates"):
+        """Завантаження всіх бланків з папки"""
+        self.templates_dir = templates_dir
+        self.templates: Dict[str, Dict] = {}
+        self.default_id: Optional[str] = None
+
+        # Інвертований індекс: ознака -> бланки, в яких вона зустрічається
+        self.index: Dict[str, List[str]] = defaultdict(list)
+
+        self.load_templates()
+
+    def load_templates(self):
+        """Завантаження описів бланків (*.json)"""
+        if not os.path.isdir(self.templates_dir):
+            logger.warning(f"Папка бланків {self.templates_dir} не знайдена")
+            return
+
+        for filename in sorted(os.listdir(self.templates_dir)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.templates_dir, filename), 'r', encoding='utf-8') as f:
+                    self.register(json.load(f))
+            except Exception as e:
+                logger.error(f"Помилка завантаження бланка {filename}: {e}")
+
+        logger.info(f"Завантажено бланків постачальників: {len(self.templates)}")
+
+    def register(self, template: Dict):
+        """Додавання бланка в реєстр та індекс"""
+        template_id = template['id']
+        template.setdefault('columns', ['number', 'name', 'quantity', 'code'])
+        template.setdefault('min_confidence', 0.4)
+        template.setdefault('row_tolerance', 0.5)
+        template.setdefault('header_keywords', [])
+
+        catalog = dict(template.get('catalog', {}))
+        if template.get('catalog_file'):
+            catalog.update(self.load_catalog(template['catalog_file']))
+        template['catalog'] = catalog
+
+        self.templates[template_id] = template
+        if template.get('default') or self.default_id is None:
+            self.default_id = template_id
+
+        features = {f"word:{word}" for keyword in template['header_keywords'] for word in key_tokens(keyword)}
+        features |= {f"code:{code}" for code in catalog}
+        for feature in features:
+            self.index[feature].append(template_id)
+
+    def load_catalog(self, catalog_file: str) -> Dict[str, str]:
+        """Каталог продуктів з Excel бланка: код -> назва"""
+        from blank_analyzer import BlankAnalyzer
+
+        if not os.path.exists(catalog_file):
+            logger.warning(f"Файл каталогу {catalog_file} не знайдено")
+            return {}
+        catalog = BlankAnalyzer(catalog_file).get_product_catalog()
+        return {code: item['name'] for code, item in catalog.items()}
+
+    def get(self, template_id: str) -> Optional[Dict]:
+        """Бланк за ідентифікатором"""
+        return self.templates.get(template_id)
+
+    def fingerprint(self, ocr_results: List[Tuple]) -> Optional[Dict]:
+        """
+        Визначення бланка за першими блоками OCR
+        Кожна ознака дає бланкам вагу 1/кількість бланків з нею, тож вартість
+        залежить від кількості слів, а не від кількості бланків
+        """
+        if not self.templates:
+            return None
+
+        scores: Dict[str, float] = defaultdict(float)
+        seen = set()
+        for _, text, _ in ocr_results[:FINGERPRINT_BOXES]:
+            for word in key_tokens(text):
+                for feature in (f"word:{word}", f"code:{word}"):
+                    if feature in seen:
+                        continue
+                    seen.add(feature)
+                    template_ids = self.index.get(feature)
+                    if template_ids:
+                        weight = 1.0 / len(template_ids)
+                        for template_id in template_ids:
+                            scores[template_id] += weight
+
+        if scores:
+            best_id = max(scores, key=scores.get)
+            logger.info(f"Визначено бланк {best_id} (оцінка {scores[best_id]:.2f})")
+            return self.templates[best_id]
+
+        return self.templates.get(self.default_id)
+
+    def catalog_name(self, template: Optional[Dict], code: Optional[str]) -> Optional[str]:
+        """Назва продукту з каталогу бланка за кодом"""
+        if not template or not code:
+            return None
+        return template['catalog'].get(normalize_key(code))
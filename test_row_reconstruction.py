@@ -0,0 +1,51 @@
+"""Групування блоків OCR у рядки таблиці на рівних і нахилених фото"""
+
+import math
+
+import pytest
+
+from row_reconstruction import group_into_rows
+
+def table_boxes(angle: float, rows: int = 10, columns: int = 12, used_columns=None):
+    """
+    Блоки таблиці, повернутої на angle градусів: bbox - обмежувальний прямокутник
+    повернутого блоку (як у easyocr), текст - "рядок:колонка"
+    """
+    radians = math.radians(angle)
+    boxes = []
+    for row in range(rows):
+        for column in range(columns):
+            if used_columns is not None and column not in used_columns:
+                continue
+            x, y = column * 100, row * 30
+            corners = [(x, y), (x + 80, y), (x + 80, y + 20), (x, y + 20)]
+            rotated = [(px * math.cos(radians) - py * math.sin(radians),
+                        px * math.sin(radians) + py * math.cos(radians)) for px, py in corners]
+            xs, ys = [px for px, _ in rotated], [py for _, py in rotated]
+            bbox = [[min(xs), min(ys)], [max(xs), min(ys)], [max(xs), max(ys)], [min(xs), max(ys)]]
+            boxes.append((bbox, f"{row}:{column}", 0.9))
+    return boxes
+
+def cells(row):
+    """(рядок, колонка) кожного блоку групи"""
+    return [tuple(int(part) for part in text.split(':')) for _, text, _ in row]
+
+@pytest.mark.parametrize("angle", [0, 0.5, 1, 1.5, 2, -1, -2])
+def test_rows_survive_handheld_skew(angle):
+    rows = group_into_rows(table_boxes(angle))
+    assert len(rows) == 10
+    for row in rows:
+        row_cells = cells(row)
+        assert len({row_number for row_number, _ in row_cells}) == 1
+        assert [column for _, column in row_cells] == list(range(12))
+
+@pytest.mark.parametrize("angle", [1, 2, -2])
+def test_sparse_rows_keep_name_with_quantity(angle):
+    # Назва ліворуч і кількість далеко праворуч - між ними порожні колонки
+    rows = group_into_rows(table_boxes(angle, used_columns={0, 1, 11}))
+    assert len(rows) == 10
+    for row in rows:
+        assert len({row_number for row_number, _ in cells(row)}) == 1
+
+def test_empty_input():
+    assert group_into_rows([]) == []
@@ -0,0 +1,74 @@
+import re
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+
+# Латинські літери, які easyocr плутає з кириличними
+LATIN_TO_CYRILLIC = str.maketrans(
+    'ABCEHIKMOPTXYaceikopxy',
+    'АВСЕНІКМОРТХУасеікорху'
+)
+
+# Літери, схожі на цифри (в числових фрагментах: "1О0г" -> "100г", "З6" -> "36")
+LETTERS_TO_DIGITS = str.maketrans('OoОоЗзIlІі|', '00003311111')
+
+# Цифри, схожі на літери (в кириличних словах: "Г0РІХ" -> "ГОРІХ")
+DIGITS_TO_LETTERS = str.maketrans('03', 'ОЗ')
+
+LATIN_LOOKALIKES = frozenset('ABCEHIKMOPTXYaceikopxy')
+DIGIT_LOOKALIKES = frozenset('OoОоЗзIlІі|')
+
+WORD = re.compile(r'\w+|\|')
+CYRILLIC = re.compile(r'[А-ЯЁІЇЄҐа-яёіїєґ]')
+LATIN = re.compile(r'[A-Za-z]')
+DIGIT_RUN = re.compile(r'([\dOoОоЗзIlІі|]+?)([.,]\d+)?(кг|гр|г|мл|л|шт)?', re.IGNORECASE)
+WEIGHT = re.compile(r'(\d+(?:[.,]\d+)?)\s*(кг|гр|г|мл|л)(?![А-Яа-яІіЇїЄєҐґ])', re.IGNORECASE)
+KEY_TOKEN = re.compile(r'№|\w+')
+
+WEIGHT_UNITS = {'кг': 'кг', 'гр': 'г', 'г': 'г', 'мл': 'мл', 'л': 'л'}
+
+def fold_token(token: str) -> str:
+    """Заміна схожих символів в одному слові залежно від того, число це чи слово"""
+    digits = sum(char.isdigit() for char in token)
+
+    # Числовий фрагмент (можливо з одиницею виміру): літери-двійники -> цифри
+    if digits:
+        match = DIGIT_RUN.fullmatch(token)
+        if match and digits * 2 >= len(match.group(1)):
+            core = match.group(1).translate(LETTERS_TO_DIGITS)
+            return core + (match.group(2) or '') + (match.group(3) or '')
+
+    has_cyrillic = CYRILLIC.search(token) is not None
+    if has_cyrillic:
+        # Кириличне слово з латинськими двійниками: "BП" -> "ВП"
+        token = token.translate(LATIN_TO_CYRILLIC)
+        if digits and not any(char.isdigit() and char not in '03' for char in token):
+            token = token.translate(DIGITS_TO_LETTERS)
+        return token
+
+    # Слово лише з латинських двійників: "TOB" -> "ТОВ"
+    if LATIN.search(token) and all(char in LATIN_LOOKALIKES for char in token if not char.isdigit()):
+        return token.translate(LATIN_TO_CYRILLIC)
+
+    return token
+
+@lru_cache(maxsize=8192)
+def fold_homoglyphs(text: str) -> str:
+    """Виправлення змішаних латиниці/кирилиці та цифр/літер зі збереженням регістру"""
+    return WORD.sub(lambda match: fold_token(match.group(0)), text)
+
+@lru_cache(maxsize=8192)
+def normalize_key(text: str) -> str:
+    """Нормалізований ключ для порівняння: виправлені двійники, верхній регістр, одинарні пробіли"""
+    return ' '.join(fold_homoglyphs(text).upper().split())
+
+@lru_cache(maxsize=8192)
+def key_tokens(text: str) -> FrozenSet[str]:
+    """Множина слів нормалізованого тексту"""
+    return frozenset(KEY_TOKEN.findall(normalize_key(text)))
+
+def extract_weight(text: str) -> Optional[Tuple[float, str]]:
+    """Вага/об'єм з назви продукту: "Багет ВП 230г" -> (230.0, 'г')"""
+    match = WEIGHT.search(fold_homoglyphs(text))
+    if not match:
+        return None
+    return float(match.group(1).replace(',', '.')), WEIGHT_UNITS[match.group(2).lower()]
@@ -0,0 +1,80 @@
+"""
+Розпізнавання великих зображень частинами
+Зображення ділиться на плитки з перекриттям, плитки розпізнаються паралельно
+в OCR процесах, а блоки на стиках плиток об'єднуються без дублікатів.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from row_reconstruction import box_geometry
+
+# Частка меншого блоку, яку має покривати перетин, щоб блоки вважались одним
+DUPLICATE_OVERLAP = 0.5
+
+# Відступ від краю плитки, в межах якого блок вважається обрізаним
+EDGE_MARGIN = 3
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """Плитки (x, y, ширина, висота), що покривають зображення з перекриттям"""
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        step = max(tile_size - overlap, 1)
+        positions = list(range(0, length - tile_size, step))
+        # Остання плитка притиснута до краю зображення
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in starts(height) for x in starts(width)]
+
+def shift_results(results: List[Tuple], x: int, y: int) -> List[Tuple]:
+    """Переведення координат блоків з плитки в координати всього зображення"""
+    return [([[int(px) + x, int(py) + y] for px, py in bbox], text, float(confidence))
+            for bbox, text, confidence in results]
+
+def merge_tile_results(tile_results: List[Tuple[Tuple[int, int, int, int], List[Tuple]]],
+                       width: int, height: int) -> List[Tuple]:
+    """
+    Об'єднання блоків з усіх плиток (координати вже в системі всього зображення)
+    На стику одне слово потрапляє в дві плитки: залишаємо цілий (не обрізаний краєм
+    плитки) блок, потім більший, потім впевненіший
+    """
+    results = [result for _, tile_boxes in tile_results for result in tile_boxes]
+    if not results:
+        return []
+
+    geometry = box_geometry(results)
+    clipped = np.zeros(len(results), dtype=bool)
+    offset = 0
+    for (x, y, tile_width, tile_height), tile_boxes in tile_results:
+        part = geometry[offset:offset + len(tile_boxes)]
+        # Обрізаним вважається лише край плитки всередині зображення, не край самого зображення
+        clipped[offset:offset + len(tile_boxes)] = (
+            ((x > 0) & (part[:, 0] <= x + EDGE_MARGIN)) |
+            ((y > 0) & (part[:, 1] <= y + EDGE_MARGIN)) |
+            ((x + tile_width < width) & (part[:, 2] >= x + tile_width - EDGE_MARGIN)) |
+            ((y + tile_height < height) & (part[:, 3] >= y + tile_height - EDGE_MARGIN))
+        )
+        offset += len(tile_boxes)
+
+    area = np.maximum(geometry[:, 2] - geometry[:, 0], 1) * np.maximum(geometry[:, 3] - geometry[:, 1], 1)
+    confidence = np.array([result[2] for result in results], dtype=np.float32)
+    order = np.lexsort((-confidence, -area, clipped))
+
+    kept: List[int] = []
+    for index in order:
+        if kept:
+            others = geometry[kept]
+            overlap_width = np.minimum(others[:, 2], geometry[index, 2]) - np.maximum(others[:, 0], geometry[index, 0])
+            overlap_height = np.minimum(others[:, 3], geometry[index, 3]) - np.maximum(others[:, 1], geometry[index, 1])
+            intersection = np.clip(overlap_width, 0, None) * np.clip(overlap_height, 0, None)
+            if np.any(intersection >= DUPLICATE_OVERLAP * np.minimum(area[kept], area[index])):
+                continue
+        kept.append(int(index))
+
+    # Порядок читання: зверху вниз, зліва направо (як у readtext)
+    kept.sort(key=lambda index: (geometry[index, 1], geometry[index, 0]))
+    return [results[index] for index in kept]
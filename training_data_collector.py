@@ -2,9 +2,12 @@ import os
 import json
 import shutil
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
+from duplicate_detector import DuplicateIndex
+from records import Invoice, OCRBox
+
 logger = logging.getLogger(__name__)
 
 class TrainingDataCollector:
@@ -20,14 +23,34 @@ class TrainingDataCollector:
             if not os.path.exists(directory):
                 os.makedirs(directory)
                 logger.info(f"Створено папку: {directory}")
+        
+        # Відбитки клітинок кількості та sha256 збережених фото - побайтові повтори не зберігаються
+        self.duplicates = DuplicateIndex(os.path.join(self.training_dir, "photo_hashes.jsonl"))
+    
+    def get_invoice_dir(self, invoice_id: str) -> str:
+        """Папка з даними накладної"""
+        return os.path.join(self.training_dir, f"invoice_{invoice_id}")
     
-    def save_invoice_data(self, invoice_id: str, photo1_path: str, photo2_path: str, 
+    def save_invoice_data(self, invoice: Invoice, photo1_path: str, photo2_path: str, 
                          raw_text1: List[str], raw_text2: List[str], 
-                         ocr_results: Dict[str, Any]) -> str:
-        """Збереження даних накладної для тренування"""
+                         ocr_boxes: List[List[OCRBox]] = None,
+                         photo_hashes: Tuple[Optional[Tuple], Optional[Tuple]] = (None, None),
+                         photo_digests: Tuple[Optional[str], Optional[str]] = (None, None)) -> Optional[str]:
+        """
+        Збереження даних накладної для тренування
+        Не зберігаються лише побайтово ті самі фото (sha256): схожий pHash має й інша
+        накладна на тому самому бланку, а її анотація потрібна для тренування
+        """
+        for digest in photo_digests:
+            duplicate = self.duplicates.find_identical(digest)
+            if duplicate:
+                logger.info(f"Накладна {invoice.invoice_id} повторює накладну {duplicate['invoice_id']}, "
+                            f"тренувальні дані не зберігаються")
+                return None
+        
         try:
             # Створюємо папку для цієї накладної
-            invoice_dir = os.path.join(self.training_dir, f"invoice_{invoice_id}")
+            invoice_dir = self.get_invoice_dir(invoice.invoice_id)
             if not os.path.exists(invoice_dir):
                 os.makedirs(invoice_dir)
             
@@ -50,27 +73,36 @@ class TrainingDataCollector:
             # Зберігаємо результати OCR
             ocr_results_file = os.path.join(invoice_dir, "ocr_results.json")
             with open(ocr_results_file, 'w', encoding='utf-8') as f:
-                json.dump(ocr_results, f, ensure_ascii=False, indent=2)
+                json.dump(invoice.to_dict(), f, ensure_ascii=False, indent=2)
+            
+            # Блоки OCR обох фото (компактно, рядок на блок) - для повторного розбору без OCR
+            if ocr_boxes:
+                ocr_boxes_file = os.path.join(invoice_dir, "ocr_boxes.json")
+                with open(ocr_boxes_file, 'w', encoding='utf-8') as f:
+                    json.dump([[box.to_row() for box in page] for page in ocr_boxes], f, ensure_ascii=False)
             
             # Створюємо файл для ручної анотації
             annotation_file = os.path.join(invoice_dir, "manual_annotation.json")
-            self.create_annotation_template(annotation_file, ocr_results)
+            self.create_annotation_template(annotation_file, invoice)
+            
+            self.duplicates.add(photo_hashes[0], invoice.invoice_id, "photo1", photo_digests[0])
+            self.duplicates.add(photo_hashes[1], invoice.invoice_id, "photo2", photo_digests[1])
             
-            logger.info(f"Збережено дані накладної {invoice_id} в {invoice_dir}")
+            logger.info(f"Збережено дані накладної {invoice.invoice_id} в {invoice_dir}")
             return invoice_dir
             
         except Exception as e:
             logger.error(f"Помилка збереження даних накладної: {e}")
             return None
     
-    def create_annotation_template(self, annotation_file: str, ocr_results: Dict[str, Any]):
+    def create_annotation_template(self, annotation_file: str, invoice: Invoice):
         """Створення шаблону для ручної анотації"""
         template = {
             "invoice_id": "",
             "date_annotated": datetime.now().isoformat(),
             "bakery_name": {
                 "correct_name": "",
-                "found_in_ocr": ocr_results.get('bakery_name', ''),
+                "found_in_ocr": invoice.bakery_name or '',
                 "confidence": 0.0,
                 "notes": ""
             },
@@ -92,12 +124,12 @@ class TrainingDataCollector:
         }
         
         # Додаємо знайдені продукти для анотації
-        for product in ocr_results.get('products', []):
+        for product in invoice.products:
             template["products"].append({
-                "ocr_name": product.get('name', ''),
-                "ocr_quantity": product.get('quantity', 0),
-                "ocr_price": product.get('price', 0),
-                "ocr_total": product.get('total', 0),
+                "ocr_name": product.name,
+                "ocr_quantity": product.quantity,
+                "ocr_price": product.price,
+                "ocr_total": product.total,
                 "correct_name": "",
                 "correct_quantity": 0.0,
                 "correct_price": 0.0,
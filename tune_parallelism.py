@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Підбір паралельності OCR для конкретної машини
+Перебирає комбінації кількості OCR процесів, потоків torch та розміру пакета easyocr
+на зразках накладних, вимірює пропускну здатність і p95 затримки та записує
+найкращу комбінацію в ocr_tuning.json, який бот читає при старті
+
+Використання:
+    python tune_parallelism.py [--fixtures training_data] [--workers 1,2,4] [--threads 1,2,4]
+                               [--batch-sizes 1,4,8] [--images 8] [--max-p95 60]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import MAX_IMAGE_PIXELS, OCR_TUNING_FILE
+from load_test import load_fixture_pairs, percentile
+from ocr_worker_pool import OCRWorkerPool
+
+logger = logging.getLogger(__name__)
+
+def parse_int_list(value: str) -> List[int]:
+    """Список чисел через кому: "1,2,4" -> [1, 2, 4]"""
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def candidate_configs(cpu_count: int, workers: List[int], threads: Optional[List[int]],
+                      batch_sizes: List[int]) -> List[Dict[str, int]]:
+    """
+    Комбінації для перевірки
+    Без явного списку потоків кожен процес отримує свою частку ядер,
+    тож процеси x потоки не перевищують кількість ядер
+    """
+    configs = []
+    for worker_count in workers:
+        if worker_count < 1 or worker_count > cpu_count:
+            continue
+        thread_options = threads or [max(1, cpu_count // worker_count)]
+        for thread_count in thread_options:
+            for batch_size in batch_sizes:
+                configs.append({'workers': worker_count, 'torch_threads': thread_count, 'batch_size': batch_size})
+    return configs
+
+def select_images(fixtures: str, limit: int) -> List[str]:
+    """Зразки фото накладних для вимірювання"""
+    return [photo for pair in load_fixture_pairs(fixtures) for photo in pair][:limit]
+
+def copy_images(images: List[str], workdir: str) -> List[str]:
+    """
+    Свіжі копії оригіналів: процес-обробник зменшує та повертає фото на місці,
+    тож кожне вимірювання має починати з неопрацьованих фото
+    """
+    os.makedirs(workdir, exist_ok=True)
+    copies = []
+    for i, image in enumerate(images):
+        target = os.path.join(workdir, f"sample_{i}{os.path.splitext(image)[1]}")
+        shutil.copyfile(image, target)
+        copies.append(target)
+    return copies
+
+async def benchmark(config: Dict[str, int], originals: List[str], workdir: str) -> Dict:
+    """Вимірювання однієї комбінації: кожен процес обробляє фото одне за одним"""
+    warmup_images = copy_images([originals[i % len(originals)] for i in range(config['workers'])],
+                                os.path.join(workdir, "warmup"))
+    images = copy_images(originals, os.path.join(workdir, "run"))
+    pool = OCRWorkerPool(
+        workers=config['workers'],
+        max_jobs=len(images) * 2 + config['workers'],
+        max_rss_mb=float('inf'),
+        max_pixels=MAX_IMAGE_PIXELS,
+        torch_threads=config['torch_threads'],
+        batch_size=config['batch_size']
+    )
+    try:
+        # Прогрів: завантаження моделей у кожному процесі не входить у вимірювання
+        await asyncio.gather(*(pool.process_invoice(image) for image in warmup_images))
+
+        queue = list(images)
+        latencies: List[float] = []
+
+        async def client():
+            while queue:
+                image = queue.pop()
+                start = time.perf_counter()
+                await pool.process_invoice(image)
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(config['workers'])))
+        wall_time = time.perf_counter() - started
+    finally:
+        await asyncio.to_thread(pool.shutdown)
+
+    return {
+        **config,
+        'images': len(latencies),
+        'wall_time': wall_time,
+        'throughput_per_min': len(latencies) / wall_time * 60 if wall_time else 0.0,
+        'p50_seconds': percentile(latencies, 50),
+        'p95_seconds': percentile(latencies, 95),
+        'peak_rss_mb': pool.stats['peak_rss_mb']
+    }
+
+def choose_best(results: List[Dict], max_p95: float) -> Optional[Dict]:
+    """Найбільша пропускна здатність серед комбінацій з прийнятною затримкою (None - таких немає)"""
+    eligible = [r for r in results if max_p95 <= 0 or r['p95_seconds'] <= max_p95]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda r: (r['throughput_per_min'], -r['p95_seconds']))
+
+async def run_tuning(args) -> Dict:
+    """Перебір усіх комбінацій"""
+    cpu_count = os.cpu_count() or 1
+    configs = candidate_configs(cpu_count, parse_int_list(args.workers),
+                                parse_int_list(args.threads) if args.threads else None,
+                                parse_int_list(args.batch_sizes))
+    if not configs:
+        raise SystemExit("❌ Немає комбінацій для перевірки")
+
+    images = select_images(args.fixtures, args.images)
+    if not images:
+        raise SystemExit(f"❌ У {args.fixtures} не знайдено фото")
+
+    print(f"Ядер: {cpu_count}, фото: {len(images)}, комбінацій: {len(configs)}")
+    results = []
+    for config in configs:
+        workdir = tempfile.mkdtemp(prefix="ocr_tuning_")
+        try:
+            result = await benchmark(config, images, workdir)
+        except Exception as e:
+            logger.error(f"Помилка вимірювання {config}: {e}")
+            continue
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        results.append(result)
+        print(f"  процеси {result['workers']} x потоки {result['torch_threads']} x пакет {result['batch_size']}: "
+              f"{result['throughput_per_min']:.1f} фото/хв, p95 {result['p95_seconds']:.1f} с, "
+              f"RSS {result['peak_rss_mb']:.0f} МБ")
+
+    if not results:
+        raise SystemExit("❌ Жодна комбінація не завершилась успішно")
+    best = choose_best(results, args.max_p95)
+    if best is None:
+        fastest = min(result['p95_seconds'] for result in results)
+        raise SystemExit(f"❌ Жодна комбінація не вкладається в --max-p95 {args.max_p95:g} с "
+                         f"(найменша p95 {fastest:.1f} с) - файл налаштувань не змінено")
+
+    return {
+        'workers': best['workers'],
+        'torch_threads': best['torch_threads'],
+        'batch_size': best['batch_size'],
+        'throughput_per_min': best['throughput_per_min'],
+        'p95_seconds': best['p95_seconds'],
+        'cpu_count': cpu_count,
+        'tuned_at': datetime.now().isoformat(),
+        'results': results
+    }
+
+def main():
+    """Підбір паралельності з командного рядка"""
+    parser = argparse.ArgumentParser(description="Підбір кількості OCR процесів, потоків torch та пакета")
+    parser.add_argument('--fixtures', default="training_data", help="Папка з фото накладних")
+    parser.add_argument('--workers', default="1,2,4", help="Кількості OCR процесів")
+    parser.add_argument('--threads', default=None, help="Потоки torch (за замовчуванням ядра / процеси)")
+    parser.add_argument('--batch-sizes', default="1,4,8", help="Розміри пакета easyocr")
+    parser.add_argument('--images', type=int, default=8, help="Скільки фото використовувати")
+    parser.add_argument('--max-p95', type=float, default=0, help="Максимальна p95 затримка, с (0 - без обмеження)")
+    parser.add_argument('--output', default=OCR_TUNING_FILE, help="Файл налаштувань")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print("⚙️ ПІДБІР ПАРАЛЕЛЬНОСТІ OCR")
+    print("=" * 50)
+
+    tuning = asyncio.run(run_tuning(args))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, ensure_ascii=False, indent=2)
+
+    print("=" * 50)
+    print(f"✅ Найкраще: процеси {tuning['workers']} x потоки {tuning['torch_threads']} x пакет {tuning['batch_size']} "
+          f"({tuning['throughput_per_min']:.1f} фото/хв, p95 {tuning['p95_seconds']:.1f} с)")
+    print(f"Збережено в {args.output} - бот використає ці значення при наступному запуску")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,120 @@
-from flask import Flask
+from flask import Flask, request
+import asyncio
+import hmac
+import logging
 import os
 import threading
-from bot import main as run_bot
+from typing import Optional
+
+from telegram import Update
+
+from bot import build_application
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+class BotRunner:
+    """Запуск бота у власному event loop в окремому потоці веб-процесу"""
+
+    def __init__(self):
+        # Без секрету будь-хто, хто знає адресу, міг би надсилати боту підроблені оновлення
+        if WEBHOOK_URL and not WEBHOOK_SECRET:
+            raise SystemExit("❌ WEBHOOK_URL задано без WEBHOOK_SECRET - задайте секрет для webhook")
+        self.application = build_application()
+        self.loop = asyncio.new_event_loop()
+        self.mode: Optional[str] = None  # 'webhook' або 'polling'
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        """Запуск потоку бота"""
+        self.thread.start()
+
+    def run(self):
+        """Цикл подій бота"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.startup())
+        self.loop.run_forever()
+
+    async def startup(self):
+        """Ініціалізація Application та вибір режиму отримання оновлень"""
+        await self.application.initialize()
+        await self.application.start()
+
+        if WEBHOOK_URL:
+            webhook_url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+            try:
+                await self.application.bot.set_webhook(
+                    url=webhook_url,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                self.mode = 'webhook'
+                logger.info(f"Бот працює через webhook: {webhook_url}")
+                return
+            except Exception as e:
+                logger.error(f"Не вдалося встановити webhook, переходимо на polling: {e}")
+
+        # Polling як запасний варіант
+        await self.application.bot.delete_webhook()
+        await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        self.mode = 'polling'
+        logger.info("Бот працює через polling")
+
+    def feed_update(self, data: dict):
+        """Передача оновлення з HTTP запиту в чергу Application"""
+        update = Update.de_json(data, self.application.bot)
+        asyncio.run_coroutine_threadsafe(self.application.update_queue.put(update), self.loop)
+
+    def is_running(self) -> bool:
+        """Чи запущено Application"""
+        return self.mode is not None and self.application.running
+
+runner: Optional[BotRunner] = None
+
 @app.route('/')
 def health_check():
     return "Bot is running! 🚀"
 
 @app.route('/health')
 def health():
-    return {"status": "healthy", "bot": "running"}
+    if runner is None or not runner.is_running():
+        return {"status": "starting", "bot": "stopped", "mode": runner.mode if runner else None}, 503
+    return {"status": "healthy", "bot": "running", "mode": runner.mode}
+
+@app.route('/stats')
+def stats():
+    """Статистика черги обробки накладних"""
+    if runner is None:
+        return {"status": "starting"}, 503
+    bot = runner.application.bot_data['nakladni_bot']
+    return {"mode": runner.mode, "queue": bot.scheduler.get_stats(), "ocr_workers": bot.ocr_pool.get_stats()}
 
-def run_bot_thread():
-    """Запуск бота в окремому потоці"""
-    run_bot()
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Прийом оновлень від Telegram"""
+    # Без секрету (режим polling) маршрут не приймає оновлень взагалі
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+        return {"ok": False, "error": "forbidden"}, 403
+
+    if runner is None or not runner.is_running():
+        # Telegram повторить доставку оновлення пізніше
+        return {"ok": False, "error": "bot is not running"}, 503
+
+    data = request.get_json(silent=True)
+    if not data:
+        return {"ok": False, "error": "invalid update"}, 400
+
+    runner.feed_update(data)
+    return {"ok": True}
 
 if __name__ == '__main__':
     # Запускаємо бота в окремому потоці
-    bot_thread = threading.Thread(target=run_bot_thread, daemon=True)
-    bot_thread.start()
-    
+    runner = BotRunner()
+    runner.start()
+
     # Запускаємо веб-сервер
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
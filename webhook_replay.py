@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перевірки webhook режиму без Telegram
+Надсилає записані JSON оновлення на локальний веб-сервер так само, як це робить Telegram
+
+Використання:
+    python webhook_replay.py updates.json [http://localhost:5000]
+    python webhook_replay.py recorded_updates/ [http://localhost:5000]
+"""
+
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List
+
+from config import WEBHOOK_PATH, WEBHOOK_SECRET
+
+def load_updates(path: str) -> List[Dict]:
+    """Завантаження записаних оновлень з файлу або папки"""
+    files = []
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json')]
+    else:
+        files = [path]
+
+    updates = []
+    for filename in files:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Файл може містити одне оновлення, список або відповідь getUpdates
+        if isinstance(data, dict) and 'result' in data:
+            data = data['result']
+        if isinstance(data, list):
+            updates.extend(data)
+        else:
+            updates.append(data)
+
+    return updates
+
+def post_update(url: str, update: Dict) -> int:
+    """Надсилання одного оновлення на webhook"""
+    body = json.dumps(update, ensure_ascii=False).encode('utf-8')
+    req = urllib.request.Request(url, data=body, method='POST')
+    req.add_header('Content-Type', 'application/json')
+    if WEBHOOK_SECRET:
+        req.add_header('X-Telegram-Bot-Api-Secret-Token', WEBHOOK_SECRET)
+
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def main():
+    """Відтворення записаних оновлень"""
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    updates = load_updates(sys.argv[1])
+    base_url = sys.argv[2] if len(sys.argv) > 2 else f"http://localhost:{os.environ.get('PORT', 5000)}"
+    url = base_url.rstrip('/') + WEBHOOK_PATH
+
+    print(f"📨 Відправляю {len(updates)} оновлень на {url}")
+
+    failed = 0
+    for update in updates:
+        start = time.time()
+        status = post_update(url, update)
+        elapsed = (time.time() - start) * 1000
+        if status != 200:
+            failed += 1
+        print(f"  • update_id={update.get('update_id')}: HTTP {status} ({elapsed:.0f} мс)")
+
+    print(f"\n✅ Успішно: {len(updates) - failed}, ❌ Помилок: {failed}")
+
+if __name__ == "__main__":
+    main()